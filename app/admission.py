@@ -0,0 +1,196 @@
+# admission control: per-route concurrency limits with a bounded wait, route-wide and per-user token
+# buckets, and a per-show cap on booking attempts; whatever can't be served in time gets 429/503 fast
+import asyncio
+import logging
+import math
+import time
+import weakref
+from collections import deque
+from contextlib import asynccontextmanager
+from fastapi import Depends, HTTPException, Request
+from fastapi.responses import JSONResponse
+from sqlalchemy.exc import OperationalError
+from app.cache import TTLCache
+from app.config import settings
+from app.deps import require_active_user
+from app.metrics import registry
+from app.models import User
+
+logger = logging.getLogger("app.admission")
+
+
+class TokenBucket:
+    __slots__ = ("rate", "burst", "tokens", "updated")
+
+    def __init__(self, rate: float, burst: float):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+
+    def take(self) -> float:
+        # 0 when a token was taken, otherwise seconds until the next one
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+
+class ConcurrencyLimiter:
+    def __init__(self, limit: int):
+        self.limit = limit
+        self.active = 0
+        self._waiters: deque[asyncio.Future] = deque()
+        # smoothed time a request holds its slot, to tell up front whether waiting can pay off
+        self.service_time = 0.0
+
+    def expected_wait(self) -> float:
+        return (len(self._waiters) + 1) / self.limit * self.service_time
+
+    async def acquire(self, timeout: float) -> bool:
+        if self.active < self.limit and not self._waiters:
+            self.active += 1
+            return True
+        if timeout <= 0 or self.expected_wait() > timeout:
+            return False
+        future = asyncio.get_running_loop().create_future()
+        self._waiters.append(future)
+        try:
+            await asyncio.wait_for(future, timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+        except asyncio.CancelledError:
+            # the slot may have been handed over just as the caller went away
+            if future.done() and not future.cancelled():
+                self.release()
+            raise
+        finally:
+            if future in self._waiters:
+                self._waiters.remove(future)
+
+    def release(self, held: float | None = None):
+        if held is not None:
+            self.service_time = held if not self.service_time else 0.8 * self.service_time + 0.2 * held
+        while self._waiters:
+            future = self._waiters.popleft()
+            if not future.done():
+                # hand the slot straight to the next waiter, active stays the same
+                future.set_result(None)
+                return
+        self.active -= 1
+
+    def stats(self) -> dict:
+        return {"limit": self.limit, "active": self.active, "waiting": len(self._waiters), "service_ms": round(self.service_time * 1000, 2)}
+
+
+def _shed(policy: str, reason: str, status_code: int, retry_after: float, detail: str) -> HTTPException:
+    registry.shed[(policy, reason)] += 1
+    return HTTPException(status_code=status_code, detail=detail, headers={"Retry-After": str(max(1, math.ceil(retry_after)))})
+
+
+class RoutePolicy:
+    def __init__(self, name: str, limits: dict):
+        self.name = name
+        concurrency = int(limits.get("concurrency", 0))
+        self.limiter = ConcurrencyLimiter(concurrency) if concurrency else None
+        rate = limits.get("rate", 0)
+        self.bucket = TokenBucket(rate, limits.get("burst", rate)) if rate else None
+        self.user_rate = limits.get("user_rate", 0)
+        self.user_burst = limits.get("user_burst", self.user_rate)
+        # idle users fall off the end; an evicted bucket would have refilled by then anyway
+        self.user_buckets = TTLCache(maxsize=settings.ADMISSION_USER_BUCKETS)
+
+    def check_rates(self, user_id: int):
+        if self.user_rate:
+            bucket = self.user_buckets.get(user_id)
+            if bucket is None:
+                bucket = TokenBucket(self.user_rate, self.user_burst)
+                self.user_buckets.set(user_id, bucket)
+            wait = bucket.take()
+            if wait:
+                raise _shed(self.name, "user_rate", 429, wait, "Too many requests")
+        if self.bucket is not None:
+            wait = self.bucket.take()
+            if wait:
+                raise _shed(self.name, "route_rate", 503, wait, "Server busy, try again shortly")
+
+    def stats(self) -> dict:
+        return {"concurrency": self.limiter.stats() if self.limiter else None, "users_tracked": len(self.user_buckets)}
+
+
+_policies: dict[str, RoutePolicy] = {}
+
+
+def policy(name: str) -> RoutePolicy | None:
+    if name not in _policies:
+        limits = settings.ADMISSION_LIMITS.get(name)
+        _policies[name] = RoutePolicy(name, limits) if limits else None
+    return _policies[name]
+
+
+def admit(name: str, user_dependency=require_active_user):
+    # use in place of the user dependency: resolves the user, then holds a slot for the request
+    async def admission(current_user: User = Depends(user_dependency)):
+        route = policy(name) if settings.ADMISSION_ENABLED else None
+        if route is None:
+            yield current_user
+            return
+        route.check_rates(current_user.id)
+        if route.limiter is None:
+            yield current_user
+            return
+        timeout = settings.ADMISSION_QUEUE_TIMEOUT_MS / 1000
+        if not await route.limiter.acquire(timeout):
+            raise _shed(name, "concurrency", 503, route.limiter.expected_wait(), "Server busy, try again shortly")
+        start = time.perf_counter()
+        try:
+            yield current_user
+        finally:
+            route.limiter.release(time.perf_counter() - start)
+
+    return admission
+
+
+# per-show limiters, dropped once no request holds one
+_show_limiters: "weakref.WeakValueDictionary[int, ConcurrencyLimiter]" = weakref.WeakValueDictionary()
+
+
+@asynccontextmanager
+async def show_admission(show_id: int):
+    # bookings for one show serialize on its lock anyway; past this many waiting, fail fast instead
+    if not settings.ADMISSION_ENABLED or not settings.ADMISSION_SHOW_CONCURRENCY:
+        yield
+        return
+    limiter = _show_limiters.get(show_id)
+    if limiter is None:
+        limiter = _show_limiters[show_id] = ConcurrencyLimiter(settings.ADMISSION_SHOW_CONCURRENCY)
+    if not await limiter.acquire(settings.ADMISSION_QUEUE_TIMEOUT_MS / 1000):
+        raise _shed("show", "concurrency", 503, limiter.expected_wait(), "Too many bookings for this show right now, try again shortly")
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        limiter.release(time.perf_counter() - start)
+
+
+async def database_busy_handler(request: Request, exc: OperationalError):
+    # sqlite gave up waiting for the write lock (busy_timeout). writers in this process queue for it
+    # (app.database.begin_write), so this means another process held it that long, or a write path
+    # skipped begin_write; the request is safe to retry, but it is a fault to look into, not shedding
+    if "database is locked" not in str(exc.orig):
+        raise exc
+    registry.lock_timeouts += 1
+    logger.warning("database is locked: %s %s", request.method, request.url.path)
+    return JSONResponse(status_code=503, content={"detail": "Server busy, try again shortly"}, headers={"Retry-After": "1"})
+
+
+def admission_stats() -> dict:
+    return {
+        "enabled": settings.ADMISSION_ENABLED,
+        "policies": {name: route.stats() for name, route in _policies.items() if route is not None},
+        "shed": {f"{name}:{reason}": count for (name, reason), count in registry.shed.items()},
+    }
@@ -0,0 +1,171 @@
+# occupancy/revenue rollups: incremented inside booking transactions, rebuildable in batches
+from collections import defaultdict
+from datetime import date
+from sqlalchemy import delete, exists, func, insert, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.database import begin_write
+from app.models import ArchivedBooking, BookedSeat, Booking, Screen, Seat, Show, ShowStats
+
+
+def _upsert(dialect: str, values: dict, increments: dict):
+    # insert the row or add the increments to the existing one, in a single statement
+    if dialect in ("sqlite", "postgresql"):
+        if dialect == "sqlite":
+            from sqlalchemy.dialects.sqlite import insert as dialect_insert
+        else:
+            from sqlalchemy.dialects.postgresql import insert as dialect_insert
+        stmt = dialect_insert(ShowStats).values(**values, **increments)
+        return stmt.on_conflict_do_update(
+            index_elements=[ShowStats.show_id],
+            set_={"capacity": stmt.excluded.capacity, **{k: getattr(ShowStats, k) + stmt.excluded[k] for k in increments}},
+        )
+    if dialect == "mysql":
+        from sqlalchemy.dialects.mysql import insert as dialect_insert
+        stmt = dialect_insert(ShowStats).values(**values, **increments)
+        return stmt.on_duplicate_key_update(
+            capacity=stmt.inserted.capacity, **{k: getattr(ShowStats, k) + stmt.inserted[k] for k in increments}
+        )
+    return None
+
+
+async def record_booking(db: AsyncSession, show: Show, theatre_id: int, capacity: int, seats: int, revenue: float, bookings: int = 1):
+    values = {"show_id": show.id, "movie_id": show.movie_id, "theatre_id": theatre_id, "day": show.start_time.date(), "capacity": capacity}
+    increments = {"seats_sold": seats, "bookings": bookings, "revenue": revenue}
+    stmt = _upsert(db.bind.dialect.name, values, increments)
+    if stmt is not None:
+        await db.execute(stmt)
+        return
+    result = await db.execute(
+        update(ShowStats).where(ShowStats.show_id == show.id).values(capacity=capacity, **{k: getattr(ShowStats, k) + v for k, v in increments.items()})
+    )
+    if not result.rowcount:
+        db.add(ShowStats(**values, cancellations=0, **increments))
+
+
+async def record_cancellation(db: AsyncSession, booking: Booking, seats: int):
+    # rows missing here predate the rollups and are fixed by a rebuild
+    await db.execute(
+        update(ShowStats)
+        .where(ShowStats.show_id == booking.show_id)
+        .values(
+            seats_sold=ShowStats.seats_sold - seats,
+            bookings=ShowStats.bookings - 1,
+            cancellations=ShowStats.cancellations + 1,
+            revenue=ShowStats.revenue - booking.total_price,
+        )
+    )
+
+
+def new_show_stats(show: Show, theatre_id: int, capacity: int) -> ShowStats:
+    return ShowStats(show_id=show.id, movie_id=show.movie_id, theatre_id=theatre_id, day=show.start_time.date(), capacity=capacity,
+                     seats_sold=0, bookings=0, cancellations=0, revenue=0.0)
+
+
+async def rebuild_rollups(db: AsyncSession, batch_size: int = 1000) -> int:
+    # recompute from the booking tables a batch of shows at a time; each batch replaces its
+    # rows in one transaction, so the rollup is never empty while the rebuild runs
+    last_id, rebuilt = 0, 0
+    while True:
+        await begin_write(db)
+        shows = await db.execute(
+            select(Show.id, Show.movie_id, Show.start_time, Screen.theatre_id, Show.screen_id)
+            .join(Screen, Show.screen_id == Screen.id)
+            .filter(Show.id > last_id)
+            .order_by(Show.id)
+            .limit(batch_size)
+        )
+        shows = shows.all()
+        if not shows:
+            # rows left over from deleted shows
+            await db.execute(delete(ShowStats).where(~exists().where(Show.id == ShowStats.show_id)))
+            await db.commit()
+            return rebuilt
+        show_ids = [row.id for row in shows]
+        screen_ids = {row.screen_id for row in shows}
+
+        capacity = await db.execute(select(Seat.screen_id, func.count(Seat.id)).filter(Seat.screen_id.in_(screen_ids)).group_by(Seat.screen_id))
+        capacity = dict(capacity.all())
+        sold = await db.execute(select(BookedSeat.show_id, func.count(BookedSeat.id)).filter(BookedSeat.show_id.in_(show_ids)).group_by(BookedSeat.show_id))
+        sold = dict(sold.all())
+        totals = await db.execute(
+            select(Booking.show_id, Booking.cancelled, func.count(Booking.id), func.coalesce(func.sum(Booking.total_price), 0.0))
+            .filter(Booking.show_id.in_(show_ids))
+            .group_by(Booking.show_id, Booking.cancelled)
+        )
+        # archived bookings still count towards their show
+        archived = await db.execute(
+            select(ArchivedBooking.show_id, ArchivedBooking.cancelled, func.count(ArchivedBooking.id),
+                   func.coalesce(func.sum(ArchivedBooking.total_price), 0.0), func.coalesce(func.sum(ArchivedBooking.seats_claimed), 0))
+            .filter(ArchivedBooking.show_id.in_(show_ids))
+            .group_by(ArchivedBooking.show_id, ArchivedBooking.cancelled)
+        )
+        bookings, cancellations, revenue = defaultdict(int), defaultdict(int), defaultdict(float)
+        for show_id, cancelled, count, total in totals.all():
+            if cancelled:
+                cancellations[show_id] += count
+            else:
+                bookings[show_id] += count
+                revenue[show_id] += total
+        for show_id, cancelled, count, total, seats in archived.all():
+            sold[show_id] = sold.get(show_id, 0) + seats
+            if cancelled:
+                cancellations[show_id] += count
+            else:
+                bookings[show_id] += count
+                revenue[show_id] += total
+
+        await db.execute(delete(ShowStats).where(ShowStats.show_id.in_(show_ids)))
+        await db.execute(insert(ShowStats), [
+            {
+                "show_id": row.id, "movie_id": row.movie_id, "theatre_id": row.theatre_id, "day": row.start_time.date(),
+                "capacity": capacity.get(row.screen_id, 0), "seats_sold": sold.get(row.id, 0), "bookings": bookings.get(row.id, 0),
+                "cancellations": cancellations.get(row.id, 0), "revenue": revenue.get(row.id, 0.0),
+            }
+            for row in shows
+        ])
+        await db.commit()
+        rebuilt += len(shows)
+        last_id = show_ids[-1]
+
+
+def _summary(row) -> dict:
+    capacity = row.capacity or 0
+    return {
+        "shows": row.shows,
+        "capacity": capacity,
+        "seats_sold": row.seats_sold or 0,
+        "bookings": row.bookings or 0,
+        "cancellations": row.cancellations or 0,
+        "revenue": round(row.revenue or 0.0, 2),
+        "occupancy": round((row.seats_sold or 0) / capacity, 4) if capacity else 0.0,
+    }
+
+
+def _totals():
+    return (
+        func.count(ShowStats.show_id).label("shows"),
+        func.sum(ShowStats.capacity).label("capacity"),
+        func.sum(ShowStats.seats_sold).label("seats_sold"),
+        func.sum(ShowStats.bookings).label("bookings"),
+        func.sum(ShowStats.cancellations).label("cancellations"),
+        func.sum(ShowStats.revenue).label("revenue"),
+    )
+
+
+async def summarize(db: AsyncSession, start: date | None = None, end: date | None = None, **filters) -> dict:
+    query = select(*_totals())
+    for column, value in filters.items():
+        query = query.filter(getattr(ShowStats, column) == value)
+    if start:
+        query = query.filter(ShowStats.day >= start)
+    if end:
+        query = query.filter(ShowStats.day <= end)
+    row = await db.execute(query)
+    return _summary(row.one())
+
+
+async def summarize_by_day(db: AsyncSession, start: date, end: date) -> list[dict]:
+    rows = await db.execute(
+        select(ShowStats.day, *_totals()).filter(ShowStats.day >= start, ShowStats.day <= end).group_by(ShowStats.day).order_by(ShowStats.day)
+    )
+    return [{"day": row.day, **_summary(row)} for row in rows.all()]
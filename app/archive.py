@@ -0,0 +1,91 @@
+# hot/cold split for bookings: bookings of shows that ended ARCHIVE_AFTER_DAYS ago move, with their seats
+# and cancelled rows, into archived_bookings. a bounded batch per transaction, so a live booking waits
+# for at most one batch's write
+import asyncio
+import logging
+from collections import defaultdict
+from datetime import datetime, timedelta
+from sqlalchemy import delete, insert, select
+from app.config import settings
+from app.database import AsyncSessionLocal, begin_write
+from app.models import ArchivedBooking, BookedSeat, Booking, Show
+from app.worker import BackgroundWorker
+
+logger = logging.getLogger("app.archive")
+
+
+async def archive_batch(cutoff: datetime, batch_size: int) -> int:
+    # moves up to batch_size bookings of shows that ended before cutoff; 0 when there is nothing left
+    async with AsyncSessionLocal() as db:
+        await begin_write(db)
+        connection = await db.connection()
+        bookings = await connection.execute(
+            select(Booking.id, Booking.show_id, Booking.user_id, Booking.created_at, Booking.updated_at, Booking.total_price, Booking.cancelled)
+            .join(Show, Booking.show_id == Show.id)
+            .filter(Show.end_time < cutoff)
+            .order_by(Booking.id)
+            .limit(batch_size)
+        )
+        bookings = bookings.mappings().all()
+        if not bookings:
+            return 0
+        booking_ids = [booking["id"] for booking in bookings]
+        seats = await connection.execute(
+            select(BookedSeat.booking_id, BookedSeat.seat_id, BookedSeat.show_id).filter(BookedSeat.booking_id.in_(booking_ids)).order_by(BookedSeat.id)
+        )
+        seat_ids, claimed = defaultdict(list), defaultdict(int)
+        for booking_id, seat_id, show_id in seats.all():
+            seat_ids[booking_id].append(seat_id)
+            # cancelled bookings keep their seat rows with show_id cleared
+            if show_id is not None:
+                claimed[booking_id] += 1
+        await connection.execute(insert(ArchivedBooking), [
+            {**booking, "seat_ids": seat_ids[booking["id"]], "seats_claimed": claimed[booking["id"]]}
+            for booking in bookings
+        ])
+        await connection.execute(delete(BookedSeat).where(BookedSeat.booking_id.in_(booking_ids)))
+        await connection.execute(delete(Booking).where(Booking.id.in_(booking_ids)))
+        await db.commit()
+    return len(bookings)
+
+
+class BookingArchiver(BackgroundWorker):
+    def __init__(self):
+        super().__init__()
+        self._running = asyncio.Lock()
+        self.archived = 0
+        self.runs = 0
+        self.last_run: datetime | None = None
+
+    async def run_once(self, after_days: int | None = None) -> int:
+        # one pass over everything due; a second caller waits rather than racing over the same rows
+        cutoff = datetime.utcnow() - timedelta(days=settings.ARCHIVE_AFTER_DAYS if after_days is None else after_days)
+        moved = 0
+        async with self._running:
+            while True:
+                count = await archive_batch(cutoff, settings.ARCHIVE_BATCH_SIZE)
+                moved += count
+                self.archived += count
+                if count < settings.ARCHIVE_BATCH_SIZE:
+                    break
+                # let queued live writes take the lock between batches
+                await asyncio.sleep(settings.ARCHIVE_BATCH_PAUSE_MS / 1000)
+            self.runs += 1
+            self.last_run = datetime.utcnow()
+        return moved
+
+    async def _run(self):
+        while True:
+            try:
+                moved = await self.run_once()
+                if moved:
+                    logger.info("archived %d bookings", moved)
+            except Exception:
+                logger.exception("booking archive run failed")
+            await asyncio.sleep(settings.ARCHIVE_INTERVAL_MINUTES * 60)
+
+    def stats(self) -> dict:
+        return {"enabled": settings.ARCHIVE_ENABLED, "running": self.running, "archived": self.archived, "runs": self.runs, "last_run": self.last_run}
+
+
+booking_archiver = BookingArchiver()
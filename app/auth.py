@@ -1,11 +1,21 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
 from fastapi import HTTPException
 from passlib.context import CryptContext
 from datetime import datetime, timedelta
 from jose import JWTError, jwt
 
+from app.cache import TTLCache
 from app.config import settings
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+# decoded claims keyed by the raw token, each entry expires at the token's exp
+token_cache = TTLCache(maxsize=settings.AUTH_CACHE_SIZE)
+
+pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto", bcrypt__rounds=settings.BCRYPT_ROUNDS)
+
+# bcrypt releases the GIL, so a small thread pool keeps it off the event loop
+hash_executor = ThreadPoolExecutor(max_workers=settings.PASSWORD_HASH_WORKERS, thread_name_prefix="pwd-hash")
+_hash_pending = 0
 
 def verify_password(plain_password, hashed_password):
     return pwd_context.verify(plain_password, hashed_password)
@@ -13,19 +23,43 @@ def verify_password(plain_password, hashed_password):
 def get_password_hash(password):
     return pwd_context.hash(password)
 
+async def _run_hash(func, *args):
+    # reject instead of queueing without bound when the pool is saturated
+    global _hash_pending
+    if _hash_pending >= settings.PASSWORD_HASH_MAX_PENDING:
+        raise HTTPException(status_code=503, detail="Server busy, try again shortly", headers={"Retry-After": "1"})
+    _hash_pending += 1
+    try:
+        return await asyncio.get_running_loop().run_in_executor(hash_executor, func, *args)
+    finally:
+        _hash_pending -= 1
+
+async def verify_password_async(plain_password, hashed_password):
+    return await _run_hash(verify_password, plain_password, hashed_password)
+
+async def get_password_hash_async(password):
+    return await _run_hash(get_password_hash, password)
+
+def hash_pool_stats():
+    return {"workers": settings.PASSWORD_HASH_WORKERS, "pending": _hash_pending, "max_pending": settings.PASSWORD_HASH_MAX_PENDING}
+
 def create_access_token(data: dict, expires_delta: timedelta | None = None):
     to_encode = data.copy()
     if expires_delta:
         expire = datetime.utcnow() + expires_delta
     else:
-        expire = datetime.utcnow() + timedelta(settings.ACCESS_TOKEN_EXPIRE_MINUTES)
+        expire = datetime.utcnow() + timedelta(minutes=settings.ACCESS_TOKEN_EXPIRE_MINUTES)
     to_encode.update({"exp": expire})
     encoded_jwt = jwt.encode(to_encode, settings.SECRET_KEY, algorithm=settings.ALGORITHM)
     return encoded_jwt
 
 def decode_access_token(token: str):
+    payload = token_cache.get(token)
+    if payload is not None:
+        return payload
     try:
         payload = jwt.decode(token, settings.SECRET_KEY, algorithms=[settings.ALGORITHM])
-        return payload
     except JWTError:
-        raise HTTPException(status_code=401, detail="Invalid or expired token")
\ No newline at end of file
+        raise HTTPException(status_code=401, detail="Invalid or expired token")
+    token_cache.set(token, payload, expires_at=payload.get("exp"))
+    return payload
\ No newline at end of file
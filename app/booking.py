@@ -0,0 +1,131 @@
+# booking engine: claims seats for a show in a single transaction, serialized per show
+import asyncio
+import weakref
+from fastapi import HTTPException
+from sqlalchemy import func, insert, inspect, select, text, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.analytics import record_booking, record_cancellation
+from app.database import begin_write
+from app.models import BookedSeat, Booking, Screen, Show
+from app.seatmap import seat_maps
+
+# one lock per show, dropped once nobody holds a reference to it
+_show_locks: "weakref.WeakValueDictionary[int, asyncio.Lock]" = weakref.WeakValueDictionary()
+
+
+def show_lock(show_id: int) -> asyncio.Lock:
+    lock = _show_locks.get(show_id)
+    if lock is None:
+        lock = asyncio.Lock()
+        _show_locks[show_id] = lock
+    return lock
+
+
+def ensure_claims(sync_conn):
+    # run at startup: databases created before booked_seats.show_id get the column, backfilled from
+    # live bookings, and the unique claim index that create_all only builds for new tables
+    columns = {column["name"] for column in inspect(sync_conn).get_columns("booked_seats")}
+    if "show_id" in columns:
+        return
+    sync_conn.execute(text("ALTER TABLE booked_seats ADD COLUMN show_id INTEGER REFERENCES shows (id) ON DELETE CASCADE"))
+    # a seat double-booked before the constraint existed keeps its claim on the earliest booking only
+    sync_conn.execute(text(
+        "UPDATE booked_seats SET show_id = (SELECT bookings.show_id FROM bookings WHERE bookings.id = booked_seats.booking_id) "
+        "WHERE booked_seats.id IN ("
+        "SELECT MIN(booked_seats.id) FROM booked_seats JOIN bookings ON bookings.id = booked_seats.booking_id "
+        "WHERE NOT COALESCE(bookings.cancelled, 0) GROUP BY bookings.show_id, booked_seats.seat_id)"
+    ))
+    sync_conn.execute(text("CREATE UNIQUE INDEX IF NOT EXISTS unique_booked_seat_show_id ON booked_seats (show_id, seat_id)"))
+
+
+def seat_conflict(seat_ids) -> HTTPException:
+    return HTTPException(status_code=409, detail={"message": "Seats already booked", "seat_ids": sorted(seat_ids)})
+
+
+def check_selection(seat_ids: list[int]):
+    if not seat_ids:
+        raise HTTPException(status_code=400, detail="No seats selected")
+    if len(set(seat_ids)) != len(seat_ids):
+        raise HTTPException(status_code=400, detail="Duplicate seats in booking")
+
+
+def check_seats(seat_map, seat_ids: list[int], claimed=()):
+    # claimed: seats already taken by earlier bookings in the same uncommitted batch
+    invalid = [seat_id for seat_id in seat_ids if not seat_map.has_seat(seat_id)]
+    if invalid:
+        raise HTTPException(status_code=400, detail={"message": "Seats do not belong to this show", "seat_ids": invalid})
+    taken = [seat_id for seat_id in seat_ids if not seat_map.is_free(seat_id) or seat_id in claimed]
+    if taken:
+        raise seat_conflict(taken)
+
+
+async def bookable_show(db: AsyncSession, show_id: int) -> tuple[Show, int]:
+    show = await db.execute(select(Show, Screen.theatre_id).join(Screen, Show.screen_id == Screen.id).filter(Show.id == show_id))
+    show = show.one_or_none()
+    if not show:
+        raise HTTPException(status_code=404, detail="Show not found")
+    if not show[0].active:
+        raise HTTPException(status_code=400, detail="Show is not active")
+    return show[0], show[1]
+
+
+async def write_booking(db: AsyncSession, user_id: int, show: Show, theatre_id: int, capacity: int, seat_ids: list[int]) -> Booking:
+    # the booking, its seat claims and the rollup increment; the caller commits
+    total_price = show.price * len(seat_ids)
+    booking = Booking(show_id=show.id, user_id=user_id, total_price=total_price)
+    db.add(booking)
+    await db.flush()
+    await db.execute(insert(BookedSeat), [{"booking_id": booking.id, "show_id": show.id, "seat_id": seat_id} for seat_id in seat_ids])
+    await record_booking(db, show, theatre_id, capacity, len(seat_ids), total_price)
+    return booking
+
+
+async def create_booking(db: AsyncSession, user_id: int, show_id: int, seat_ids: list[int]) -> Booking:
+    check_selection(seat_ids)
+
+    async with show_lock(show_id):
+        show, theatre_id = await bookable_show(db, show_id)
+        seat_map = await seat_maps.get(db, show_id)
+        check_seats(seat_map, seat_ids)
+
+        try:
+            await begin_write(db)
+            new_booking = await write_booking(db, user_id, show, theatre_id, len(seat_map.seat_ids), seat_ids)
+            await db.commit()
+        except IntegrityError:
+            # another process got there first, the unique (show_id, seat_id) constraint caught it
+            await db.rollback()
+            seat_maps.invalidate_show(show_id)
+            raise seat_conflict(seat_ids)
+        seat_maps.mark_booked(show_id, seat_ids)
+    await db.refresh(new_booking)
+    return new_booking
+
+
+async def cancel_booking(db: AsyncSession, booking: Booking) -> tuple[Booking, bool]:
+    # also says whether this call cancelled it, False when it was already cancelled or a concurrent
+    # cancel got there first
+    show_id = booking.show_id
+    async with show_lock(show_id):
+        # the caller read the booking in a snapshot from before the lock, where a cancel committed since
+        # still looks live. begin_write ends that snapshot and the update only matches a live booking
+        await begin_write(db)
+        result = await db.execute(
+            update(Booking).where(Booking.id == booking.id, func.coalesce(Booking.cancelled, False).is_(False)).values(cancelled=True)
+        )
+        if result.rowcount != 1:
+            await db.rollback()
+            await db.refresh(booking)
+            return booking, False
+        seat_ids = await db.execute(
+            select(BookedSeat.seat_id).filter(BookedSeat.booking_id == booking.id, BookedSeat.show_id == show_id)
+        )
+        seat_ids = seat_ids.scalars().all()
+        # clearing the claim frees the (show_id, seat_id) slot while keeping the seats on the booking
+        await db.execute(update(BookedSeat).where(BookedSeat.booking_id == booking.id).values(show_id=None))
+        await record_cancellation(db, booking, len(seat_ids))
+        await db.commit()
+        seat_maps.mark_free(show_id, seat_ids)
+    await db.refresh(booking)
+    return booking, True
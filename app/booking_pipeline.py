@@ -0,0 +1,181 @@
+# group commit for bookings: requests queue up and a single writer task validates and commits them
+# in batches, one transaction per batch, resolving each caller with its own booking or error
+import asyncio
+import time
+from collections import defaultdict
+from fastapi import HTTPException
+from sqlalchemy import insert, select
+from sqlalchemy.exc import IntegrityError
+from app.analytics import record_booking
+from app.booking import check_seats, check_selection, create_booking, show_lock
+from app.config import settings
+from app.database import AsyncSessionLocal, begin_write
+from app.metrics import Histogram, registry
+from app.models import BookedSeat, Booking, Screen, Show
+from app.seatmap import seat_maps
+from app.worker import BatchingWorker
+
+BATCH_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128, 256, 512)
+
+
+class PendingBooking:
+    __slots__ = ("user_id", "show_id", "seat_ids", "future", "enqueued", "booking")
+
+    def __init__(self, user_id: int, show_id: int, seat_ids: list[int], future: asyncio.Future):
+        self.user_id = user_id
+        self.show_id = show_id
+        self.seat_ids = seat_ids
+        self.future = future
+        self.enqueued = time.perf_counter()
+        self.booking: Booking | None = None
+
+
+class BookingPipeline(BatchingWorker):
+    def __init__(self, batch_size: int, linger: float, max_queue: int):
+        super().__init__(batch_size, linger, max_queue)
+        self.batches = 0
+        self.committed = 0
+        self.rejected = 0
+        self.fallbacks = 0
+        # bigger batches mean fewer commits but a longer wait for the first booking in each
+        self.batch_sizes = Histogram(BATCH_BUCKETS)
+        self.wait_seconds = Histogram()
+        self.commit_seconds = Histogram()
+
+    async def submit(self, user_id: int, show_id: int, seat_ids: list[int]) -> Booking:
+        check_selection(seat_ids)
+        self.start()
+        if self.queue.full():
+            raise HTTPException(status_code=503, detail="Server busy, try again shortly", headers={"Retry-After": "1"})
+        future = asyncio.get_running_loop().create_future()
+        self.queue.put_nowait(PendingBooking(user_id, show_id, seat_ids, future))
+        return await future
+
+    def _failed(self, batch: list[PendingBooking], exc: Exception):
+        # everyone still waiting in this batch gets the error
+        for pending in batch:
+            self._resolve(pending, exc=exc)
+
+    def _resolve(self, pending: PendingBooking, result=None, exc: Exception | None = None):
+        # the caller may have gone away (cancelled future), there is nobody to tell then
+        if pending.future.done():
+            return
+        self.wait_seconds.observe(time.perf_counter() - pending.enqueued)
+        if exc is not None:
+            pending.future.set_exception(exc)
+        else:
+            pending.future.set_result(result)
+
+    async def _process(self, batch: list[PendingBooking]):
+        start = time.perf_counter()
+        show_ids = sorted({pending.show_id for pending in batch})
+        # the direct path's per-show locks, taken in id order, keep cancellations out of the batch
+        locks = [show_lock(show_id) for show_id in show_ids]
+        for lock in locks:
+            await lock.acquire()
+        accepted, conflicted = [], False
+        try:
+            async with AsyncSessionLocal() as db:
+                await begin_write(db)
+                rows = await db.execute(select(Show, Screen.theatre_id).join(Screen, Show.screen_id == Screen.id).filter(Show.id.in_(show_ids)))
+                shows = {show.id: (show, theatre_id) for show, theatre_id in rows.all()}
+                claimed: dict[int, set[int]] = defaultdict(set)
+                capacity: dict[int, int] = {}
+                for pending in batch:
+                    if pending.future.done():
+                        continue
+                    try:
+                        if pending.show_id not in shows:
+                            raise HTTPException(status_code=404, detail="Show not found")
+                        show, _ = shows[pending.show_id]
+                        if not show.active:
+                            raise HTTPException(status_code=400, detail="Show is not active")
+                        seat_map = await seat_maps.get(db, pending.show_id, screen_id=show.screen_id)
+                        check_seats(seat_map, pending.seat_ids, claimed[pending.show_id])
+                        capacity[pending.show_id] = len(seat_map.seat_ids)
+                    except HTTPException as exc:
+                        self.rejected += 1
+                        self._resolve(pending, exc=exc)
+                        continue
+                    claimed[pending.show_id].update(pending.seat_ids)
+                    pending.booking = Booking(show_id=pending.show_id, user_id=pending.user_id, total_price=show.price * len(pending.seat_ids))
+                    accepted.append(pending)
+                if not accepted:
+                    return
+
+                db.add_all([pending.booking for pending in accepted])
+                try:
+                    await db.flush()
+                    await db.execute(insert(BookedSeat), [
+                        {"booking_id": pending.booking.id, "show_id": pending.show_id, "seat_id": seat_id}
+                        for pending in accepted
+                        for seat_id in pending.seat_ids
+                    ])
+                    # one rollup increment per show rather than per booking
+                    totals: dict[int, list] = defaultdict(lambda: [0, 0.0, 0])
+                    for pending in accepted:
+                        total = totals[pending.show_id]
+                        total[0] += len(pending.seat_ids)
+                        total[1] += pending.booking.total_price
+                        total[2] += 1
+                    for show_id, (seats, revenue, bookings) in totals.items():
+                        show, theatre_id = shows[show_id]
+                        await record_booking(db, show, theatre_id, capacity[show_id], seats, revenue, bookings=bookings)
+                    await db.commit()
+                except IntegrityError:
+                    # another process claimed one of the seats; the batch is gone, retry one by one below
+                    await db.rollback()
+                    conflicted = True
+                else:
+                    # backends without RETURNING leave the server defaults unloaded; one query reloads them all
+                    await db.execute(
+                        select(Booking).filter(Booking.id.in_([pending.booking.id for pending in accepted])).execution_options(populate_existing=True)
+                    )
+                    for pending in accepted:
+                        seat_maps.mark_booked(pending.show_id, pending.seat_ids)
+        finally:
+            for lock in reversed(locks):
+                lock.release()
+
+        if conflicted:
+            self.fallbacks += 1
+            for show_id in show_ids:
+                seat_maps.invalidate_show(show_id)
+            for pending in accepted:
+                try:
+                    async with AsyncSessionLocal() as db:
+                        booking = await create_booking(db, pending.user_id, pending.show_id, pending.seat_ids)
+                except HTTPException as exc:
+                    self.rejected += 1
+                    self._resolve(pending, exc=exc)
+                else:
+                    self.committed += 1
+                    self._resolve(pending, booking)
+            return
+
+        self.batches += 1
+        self.committed += len(accepted)
+        self.batch_sizes.observe(len(accepted))
+        self.commit_seconds.observe(time.perf_counter() - start)
+        for pending in accepted:
+            self._resolve(pending, pending.booking)
+
+    def stats(self) -> dict:
+        return {
+            "enabled": settings.BOOKING_PIPELINE_ENABLED,
+            "running": self.running,
+            "queued": self.queue.qsize(),
+            "batches": self.batches,
+            "committed": self.committed,
+            "rejected": self.rejected,
+            "fallbacks": self.fallbacks,
+            "avg_batch_size": round(self.committed / self.batches, 2) if self.batches else 0.0,
+            "avg_wait_ms": round(self.wait_seconds.total / self.wait_seconds.count * 1000, 2) if self.wait_seconds.count else 0.0,
+        }
+
+
+booking_pipeline = BookingPipeline(settings.BOOKING_BATCH_SIZE, settings.BOOKING_BATCH_LINGER_MS / 1000, settings.BOOKING_QUEUE_MAX)
+registry.histograms["booking_pipeline_batch_size"] = ("Bookings committed per group-commit batch", booking_pipeline.batch_sizes)
+registry.histograms["booking_pipeline_wait_seconds"] = ("Time from enqueue to result for pipelined bookings", booking_pipeline.wait_seconds)
+registry.histograms["booking_pipeline_commit_seconds"] = ("Time to validate and commit one batch", booking_pipeline.commit_seconds)
+registry.collectors.append(lambda: {"booking_pipeline_queued": booking_pipeline.queue.qsize(), "booking_pipeline_fallbacks": booking_pipeline.fallbacks})
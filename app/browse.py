@@ -0,0 +1,144 @@
+# composite browse view: theatres -> screens -> upcoming shows -> movie and availability. each level is
+# one IN query over the keys collected from the whole level above, never one query per parent row
+from collections import defaultdict
+from datetime import datetime, timedelta
+from fastapi import HTTPException, Query
+from sqlalchemy import func, select, union_all
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.config import settings
+from app.models import BookedSeat, HeldSeat, Movie, Screen, Seat, Show, Theatre
+from app.pagination import PageParams, keyset
+from app.schemas import Movie as MovieSchema, Screen as ScreenSchema, Show as ShowSchema, Theatre as TheatreSchema
+from app.serialize import as_dicts
+
+LEVELS = {"theatre": (Theatre, TheatreSchema), "screen": (Screen, ScreenSchema), "show": (Show, ShowSchema), "movie": (Movie, MovieSchema)}
+INCLUDES = ("screens", "shows", "movie", "availability")
+# columns a level needs to hang its children, fetched even when the caller did not ask for them
+LINKS = {"theatre": ("id",), "screen": ("id", "theatre_id"), "show": ("id", "screen_id", "movie_id"), "movie": ("id",)}
+
+
+class BrowseParams:
+    def __init__(
+        self,
+        include: str | None = Query(None, description=f"Comma-separated levels below theatres: {', '.join(INCLUDES)}; defaults to all"),
+        fields: str | None = Query(None, description="Comma-separated level.field, e.g. theatre.name,show.start_time; levels not named return every field"),
+        location: str | None = None,
+        theatre_id: int | None = None,
+        movie_id: int | None = None,
+        start_from: datetime | None = Query(None, description="Defaults to now"),
+        days: int = Query(settings.BROWSE_DAYS_DEFAULT, ge=1, le=settings.BROWSE_DAYS_MAX, description="How far ahead to list shows"),
+        limit: int | None = Query(None, ge=1, le=settings.PAGE_SIZE_MAX, description="Theatres per page"),
+        after: int | None = Query(None, description="Cursor: theatres with id greater than this, from X-Next-Cursor"),
+    ):
+        self.include = set(INCLUDES) if include is None else {name.strip() for name in include.split(",") if name.strip()}
+        unknown = self.include - set(INCLUDES)
+        if unknown:
+            raise HTTPException(status_code=400, detail=f"Unknown include: {', '.join(sorted(unknown))}")
+        if self.include - {"screens"} and "screens" not in self.include:
+            raise HTTPException(status_code=400, detail="shows, movie and availability need screens included")
+        if self.include & {"movie", "availability"} and "shows" not in self.include:
+            raise HTTPException(status_code=400, detail="movie and availability need shows included")
+        self.fields = {level: list(schema.model_fields) for level, (_, schema) in LEVELS.items()}
+        requested = defaultdict(list)
+        for item in (fields or "").split(","):
+            if not item.strip():
+                continue
+            level, _, name = item.strip().partition(".")
+            if level not in LEVELS or name not in LEVELS[level][1].model_fields:
+                raise HTTPException(status_code=400, detail=f"Unknown field: {item.strip()}")
+            requested[level].append(name)
+        for level, names in requested.items():
+            # id always comes back, the rest in schema order
+            self.fields[level] = [name for name in LEVELS[level][1].model_fields if name == "id" or name in names]
+        self.location = location
+        self.theatre_id = theatre_id
+        self.movie_id = movie_id
+        self.start_from = start_from or datetime.utcnow()
+        self.start_to = self.start_from + timedelta(days=days)
+        self.page = PageParams(limit=limit, after=after, stream=False)
+
+
+def _columns(level: str, names: list[str]) -> list:
+    table = LEVELS[level][0].__table__
+    return [table.c[name] for name in dict.fromkeys([*names, *LINKS[level]])]
+
+
+def _trim(rows: list[dict], names: list[str]) -> list[dict]:
+    # drop link columns the caller did not ask for, once they have done their job
+    extra = [key for key in rows[0] if key not in names] if rows else []
+    for row in rows:
+        for key in extra:
+            del row[key]
+    return rows
+
+
+async def _children(db: AsyncSession, level: str, names: list[str], parent_key: str, parent_ids, *criteria, order_by=()) -> dict[int, list[dict]]:
+    model = LEVELS[level][0]
+    if not parent_ids:
+        return {}
+    connection = await db.connection()
+    result = await connection.execute(
+        select(*_columns(level, names)).filter(model.__table__.c[parent_key].in_(parent_ids), *criteria).order_by(*order_by, model.id)
+    )
+    grouped = defaultdict(list)
+    for row in as_dicts(result):
+        grouped[row[parent_key]].append(row)
+    return grouped
+
+
+async def _availability(db: AsyncSession, screen_ids, show_ids) -> tuple[dict[int, int], dict[int, int]]:
+    # seats per screen and taken (booked or held) seats per show, one grouped query each
+    connection = await db.connection()
+    capacity = await connection.execute(select(Seat.screen_id, func.count()).filter(Seat.screen_id.in_(screen_ids)).group_by(Seat.screen_id))
+    taken = union_all(
+        select(BookedSeat.show_id).filter(BookedSeat.show_id.in_(show_ids)),
+        select(HeldSeat.show_id).filter(HeldSeat.show_id.in_(show_ids)),
+    ).subquery()
+    taken = await connection.execute(select(taken.c.show_id, func.count()).group_by(taken.c.show_id))
+    return dict(capacity.all()), dict(taken.all())
+
+
+async def browse(db: AsyncSession, params: BrowseParams) -> tuple[list[dict], int | None]:
+    query = select(Theatre)
+    if params.theatre_id is not None:
+        query = query.filter(Theatre.id == params.theatre_id)
+    if params.location:
+        query = query.filter(Theatre.location == params.location)
+    limit = params.page.limit or settings.PAGE_SIZE_DEFAULT
+    connection = await db.connection()
+    result = await connection.execute(keyset(query.with_only_columns(*_columns("theatre", params.fields["theatre"])), Theatre, params.page, limit))
+    theatres = as_dicts(result)
+    next_cursor = theatres[-1]["id"] if len(theatres) == limit else None
+    if "screens" not in params.include:
+        return _trim(theatres, params.fields["theatre"]), next_cursor
+
+    screens = await _children(db, "screen", params.fields["screen"], "theatre_id", [theatre["id"] for theatre in theatres])
+    all_screens = [screen for rows in screens.values() for screen in rows]
+    shows = {}
+    if "shows" in params.include:
+        criteria = [Show.active.is_(True), Show.start_time >= params.start_from, Show.start_time < params.start_to]
+        if params.movie_id is not None:
+            criteria.append(Show.movie_id == params.movie_id)
+        shows = await _children(
+            db, "show", params.fields["show"], "screen_id", [screen["id"] for screen in all_screens], *criteria, order_by=(Show.start_time,)
+        )
+    all_shows = [show for rows in shows.values() for show in rows]
+
+    if "movie" in params.include and all_shows:
+        movies = await _children(db, "movie", params.fields["movie"], "id", {show["movie_id"] for show in all_shows})
+        movies = {movie_id: _trim(rows, params.fields["movie"])[0] for movie_id, rows in movies.items()}
+        for show in all_shows:
+            show["movie"] = movies[show["movie_id"]]
+    if "availability" in params.include and all_shows:
+        capacity, taken = await _availability(db, [screen["id"] for screen in all_screens], [show["id"] for show in all_shows])
+        for show in all_shows:
+            seats = capacity.get(show["screen_id"], 0)
+            show["capacity"] = seats
+            show["available_seats"] = seats - taken.get(show["id"], 0)
+
+    if "shows" in params.include:
+        for screen in all_screens:
+            screen["shows"] = _trim(shows.get(screen["id"], []), [*params.fields["show"], "movie", "capacity", "available_seats"])
+    for theatre in theatres:
+        theatre["screens"] = _trim(screens.get(theatre["id"], []), [*params.fields["screen"], "shows"])
+    return _trim(theatres, params.fields["theatre"] + ["screens"]), next_cursor
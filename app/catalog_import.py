@@ -0,0 +1,444 @@
+# bulk catalog import: csv or ndjson parsed as it arrives, each row validated with its *Create schema,
+# references between rows resolved through an in-memory id map, and rows written in chunked bulk inserts.
+#
+# every row has a type (a column/field, or the default for the whole upload): theatre, movie, screen,
+# seat, layout (a SeatGrid for one screen) or show. a row may name itself with ref, and later rows point
+# at it with theatre_ref / screen_ref / movie_ref instead of a database id. a row is only ever checked
+# against rows before it, so parents have to come first.
+#
+#   python -m app.catalog_import chain.ndjson
+#   python -m app.catalog_import movies.csv --type movie
+import argparse
+import asyncio
+import codecs
+import csv
+import logging
+import sys
+import time
+from collections import Counter
+from types import SimpleNamespace
+from typing import AsyncIterator, Callable
+from fastapi import HTTPException
+from pydantic import BaseModel, ValidationError
+from sqlalchemy import exists, func, insert, select
+from sqlalchemy.exc import IntegrityError
+from app.config import settings
+from app.database import AsyncSessionLocal, begin_write
+from app.layout import expand_grid
+from app.models import Movie, Screen, Seat, Show, ShowStats, Theatre
+from app.response_cache import catalog_cache
+from app.scheduling import naive_utc, find_conflicts, schedule_lock
+from app.schemas import MovieCreate, ScreenCreate, ScreenGridCreate, SeatCreate, ShowCreate, TheatreCreate
+from app.seatmap import seat_maps
+from app.serialize import loads
+
+logger = logging.getLogger("app.catalog_import")
+
+
+class Kind:
+    def __init__(self, name: str, model, schema: type[BaseModel], parents: dict[str, str], table: str | None = None):
+        self.name = name
+        self.model = model
+        self.schema = schema
+        # (foreign key field, kind it points at, field naming it by ref instead)
+        self.parents = [(field, parent, f"{parent}_ref") for field, parent in parents.items()]
+        # rows of this kind are buffered and inserted as rows of another kind (layouts become seats)
+        self.table = table or name
+
+
+# in flush order: parents before children, seats before the shows whose rollup counts them
+KINDS = {
+    kind.name: kind
+    for kind in (
+        Kind("theatre", Theatre, TheatreCreate, {}),
+        Kind("movie", Movie, MovieCreate, {}),
+        Kind("screen", Screen, ScreenCreate, {"theatre_id": "theatre"}),
+        Kind("seat", Seat, SeatCreate, {"screen_id": "screen"}),
+        Kind("layout", Seat, ScreenGridCreate, {"screen_id": "screen"}, table="seat"),
+        Kind("show", Show, ShowCreate, {"movie_id": "movie", "screen_id": "screen"}),
+    )
+}
+TABLES = ("theatre", "movie", "screen", "seat", "show")
+# kinds other rows can point at, their ids come back from the insert
+REFERABLE = {"theatre", "movie", "screen"}
+
+
+class Entry:
+    __slots__ = ("line", "kind", "ref", "rows", "id")
+
+    def __init__(self, line: int, kind: str, ref: str | None, rows: list[dict]):
+        self.line = line
+        self.kind = kind
+        self.ref = ref
+        self.rows = rows
+        self.id: int | None = None
+
+
+async def _lines(chunks: AsyncIterator[bytes]) -> AsyncIterator[tuple[int, str]]:
+    # numbered text lines from raw chunks, a multi-byte character may be split across two chunks
+    decoder = codecs.getincrementaldecoder("utf-8-sig")()
+    pending, number = "", 0
+    async for chunk in chunks:
+        pending += decoder.decode(chunk)
+        lines = pending.split("\n")
+        pending = lines.pop()
+        for line in lines:
+            number += 1
+            yield number, line.rstrip("\r")
+    pending += decoder.decode(b"", final=True)
+    if pending.strip():
+        yield number + 1, pending.rstrip("\r")
+
+
+async def ndjson_records(chunks: AsyncIterator[bytes]) -> AsyncIterator[tuple[int, dict | None, str | None]]:
+    async for number, line in _lines(chunks):
+        if not line.strip():
+            continue
+        try:
+            record = loads(line)
+        except ValueError as exc:
+            yield number, None, f"Invalid JSON: {exc}"
+            continue
+        if not isinstance(record, dict):
+            yield number, None, "Expected a JSON object"
+            continue
+        yield number, record, None
+
+
+# list fields of a layout row, which come as json in a single cell. anything else is kept as text, so a
+# title like "[1]" stays a title
+LIST_FIELDS = {"skip_cols", "disabled"}
+
+
+def _cell(name: str, value: str):
+    if name in LIST_FIELDS:
+        try:
+            return loads(value)
+        except ValueError:
+            # left as text, validation reports it against the field
+            pass
+    return value
+
+
+async def csv_records(chunks: AsyncIterator[bytes]) -> AsyncIterator[tuple[int, dict | None, str | None]]:
+    header, record, start, quotes = None, [], 0, 0
+    async for number, line in _lines(chunks):
+        if not record:
+            start = number
+        record.append(line)
+        # an odd number of quotes so far means a quoted field runs on into the next line
+        quotes += line.count('"')
+        if quotes % 2:
+            continue
+        text, record, quotes = "\n".join(record), [], 0
+        if not text.strip():
+            continue
+        row = next(csv.reader([text]))
+        if header is None:
+            header = [name.strip() for name in row]
+            continue
+        if len(row) != len(header):
+            yield start, None, f"Expected {len(header)} columns, got {len(row)}"
+            continue
+        # empty cells are left out, so optional fields fall back to their defaults
+        yield start, {name: _cell(name, value) for name, value in zip(header, row) if value != ""}, None
+    if record:
+        yield start, None, "Unterminated quoted field"
+
+
+class CatalogImport:
+    def __init__(self, default_type: str | None = None, chunk_size: int | None = None, progress: Callable | None = None):
+        if default_type is not None and default_type not in KINDS:
+            raise HTTPException(status_code=400, detail=f"Unknown type '{default_type}', expected one of {', '.join(KINDS)}")
+        self.default_type = default_type
+        self.chunk_size = chunk_size or settings.IMPORT_CHUNK_SIZE
+        self.progress = progress
+        # (kind, ref) -> database id, None while the row is buffered and not yet inserted
+        self.ids: dict[tuple[str, str], int | None] = {}
+        # ids known to exist per kind, so raw foreign keys are only looked up once
+        self.known: dict[str, set[int]] = {kind: set() for kind in REFERABLE}
+        self.pending: dict[str, list[Entry]] = {table: [] for table in TABLES}
+        self.buffered = 0
+        self._writing: asyncio.Future | None = None
+        self.rows = 0
+        self.inserted = Counter()
+        self.errors: list[dict] = []
+        self.error_count = 0
+        self.screens_with_seats: set[int] = set()
+        self.started = time.perf_counter()
+
+    def error(self, line: int, kind: str | None, message: str):
+        self.error_count += 1
+        if len(self.errors) < settings.IMPORT_MAX_ERRORS:
+            self.errors.append({"line": line, "type": kind, "message": message})
+
+    async def run(self, records: AsyncIterator[tuple[int, dict | None, str | None]]) -> dict:
+        async for line, record, problem in records:
+            self.rows += 1
+            if problem is not None:
+                self.error(line, None, problem)
+                continue
+            await self.add(line, record)
+        await self.flush(wait=True)
+        await catalog_cache.bump("movies", "theatres", "shows")
+        for screen_id in self.screens_with_seats:
+            seat_maps.invalidate_screen(screen_id)
+        summary = self.summary()
+        logger.info("catalog import: %d rows, inserted %s, %d errors in %.1fs", self.rows, summary["inserted"], self.error_count, summary["seconds"])
+        return summary
+
+    async def add(self, line: int, record: dict):
+        kind = KINDS.get(record.pop("type", None) or self.default_type)
+        if kind is None:
+            self.error(line, None, f"Missing or unknown type, expected one of {', '.join(KINDS)}")
+            return
+        ref = record.pop("ref", None)
+        for field, parent, ref_field in kind.parents:
+            parent_ref = record.pop(ref_field, None)
+            if parent_ref is None:
+                continue
+            key = (parent, str(parent_ref))
+            parent_id = self.ids.get(key)
+            if parent_id is None and key in self.ids:
+                # the parent is still buffered, insert it to learn its id
+                await self.flush(wait=True)
+                parent_id = self.ids.get(key)
+            if parent_id is None:
+                self.error(line, kind.name, f"Unknown {ref_field} '{parent_ref}'")
+                return
+            record[field] = parent_id
+        try:
+            values = kind.schema.model_validate(record).model_dump()
+        except ValidationError as exc:
+            self.error(line, kind.name, "; ".join(f"{'.'.join(map(str, err['loc'])) or 'row'}: {err['msg']}" for err in exc.errors()))
+            return
+        if kind.name == "layout":
+            screen_id = values.pop("screen_id")
+            try:
+                rows = [{**seat, "screen_id": screen_id} for seat in expand_grid(ScreenGridCreate.model_construct(**values))]
+            except HTTPException as exc:
+                self.error(line, kind.name, str(exc.detail))
+                return
+        elif kind.name == "show":
+            values["start_time"], values["end_time"] = naive_utc(values["start_time"]), naive_utc(values["end_time"])
+            if values["end_time"] <= values["start_time"]:
+                self.error(line, kind.name, "end_time must be after start_time")
+                return
+            rows = [values]
+        else:
+            rows = [values]
+        if ref is not None:
+            if kind.name not in REFERABLE:
+                self.error(line, kind.name, f"A {kind.name} cannot have a ref")
+                return
+            key = (kind.name, str(ref))
+            if key in self.ids:
+                self.error(line, kind.name, f"Duplicate ref '{ref}'")
+                return
+            self.ids[key] = None
+        self.pending[kind.table].append(Entry(line, kind.name, None if ref is None else str(ref), rows))
+        self.buffered += len(rows)
+        if self.buffered >= self.chunk_size:
+            await self.flush()
+
+    async def flush(self, wait: bool = False):
+        # the chunk is written by a task while parsing carries on with the next one; one write at a time
+        if self._writing is not None:
+            await self._writing
+        pending = self.pending
+        self.pending = {table: [] for table in TABLES}
+        self.buffered = 0
+        self._writing = asyncio.ensure_future(self._write_chunk(pending))
+        if wait:
+            await self._writing
+
+    async def _write_chunk(self, pending: dict[str, list[Entry]]):
+        for table in TABLES:
+            entries = pending[table]
+            if entries:
+                async with AsyncSessionLocal() as db:
+                    entries = await self._check_parents(db, KINDS[table], entries)
+                    if table == "show":
+                        await self._insert_shows(db, entries)
+                    else:
+                        await self._insert(db, KINDS[table], entries)
+        if self.progress is not None:
+            self.progress(self)
+
+    def _drop(self, entry: Entry, message: str):
+        self.error(entry.line, entry.kind, message)
+        if entry.ref is not None:
+            # children naming this ref are reported as unknown refs from here on
+            del self.ids[(entry.kind, entry.ref)]
+
+    async def _check_parents(self, db, kind: Kind, entries: list[Entry]) -> list[Entry]:
+        # raw ids given directly (not through a ref) are checked against the database, one IN query per parent kind
+        for field, parent, _ in kind.parents:
+            unknown = {row[field] for entry in entries for row in entry.rows} - self.known[parent]
+            if unknown:
+                model = KINDS[parent].model
+                found = await db.execute(select(model.id).filter(model.id.in_(unknown)))
+                self.known[parent].update(found.scalars().all())
+                missing = unknown - self.known[parent]
+                if missing:
+                    kept = []
+                    for entry in entries:
+                        if entry.rows[0][field] in missing:
+                            self._drop(entry, f"{parent.capitalize()} {entry.rows[0][field]} not found")
+                        else:
+                            kept.append(entry)
+                    entries = kept
+        return entries
+
+    async def _insert(self, db, kind: Kind, entries: list[Entry], extra=None):
+        # one bulk insert for the chunk; if it breaks a constraint, row by row to find the culprits
+        if not entries:
+            return
+        try:
+            await begin_write(db)
+            await self._write(db, kind, entries, extra)
+            await db.commit()
+        except IntegrityError:
+            await db.rollback()
+        else:
+            self._committed(kind, entries)
+            return
+        for entry in entries:
+            try:
+                await begin_write(db)
+                await self._write(db, kind, [entry], extra)
+                await db.commit()
+            except IntegrityError as exc:
+                await db.rollback()
+                self._drop(entry, f"Rejected by the database: {exc.orig}")
+            else:
+                self._committed(kind, [entry])
+
+    async def _write(self, db, kind: Kind, entries: list[Entry], extra):
+        # core executemany on the session's connection, none of the orm bulk machinery
+        connection = await db.connection()
+        table = kind.model.__table__
+        floor = None
+        if extra is not None:
+            # ids above this one are the rows this transaction adds
+            floor = (await connection.execute(select(func.max(table.c.id)))).scalar() or 0
+        # only rows that later rows refer to need their ids back, which costs a statement per row
+        named = [entry for entry in entries if entry.ref is not None]
+        if named:
+            ids = await connection.execute(insert(table).returning(table.c.id, sort_by_parameter_order=True), [entry.rows[0] for entry in named])
+            for entry, row_id in zip(named, ids.scalars().all()):
+                entry.id = row_id
+        params = [row for entry in entries if entry.ref is None for row in entry.rows]
+        if params:
+            await connection.execute(insert(table), params)
+        if extra is not None:
+            await extra(connection, floor)
+
+    def _committed(self, kind: Kind, entries: list[Entry]):
+        for entry in entries:
+            self.inserted[kind.name] += len(entry.rows)
+            if entry.ref is not None:
+                self.ids[(entry.kind, entry.ref)] = entry.id
+            if entry.id is not None:
+                self.known[kind.name].add(entry.id)
+            if kind.name == "seat":
+                self.screens_with_seats.add(entry.rows[0]["screen_id"])
+
+    async def _insert_shows(self, db, entries: list[Entry]):
+        screen_ids = {entry.rows[0]["screen_id"] for entry in entries}
+        capacity = select(Seat.screen_id, func.count(Seat.id).label("seats")).filter(Seat.screen_id.in_(screen_ids)).group_by(Seat.screen_id).subquery()
+
+        async def rollups(connection, floor: int):
+            # the rows new_show_stats would make for the shows just inserted, written by the database itself
+            await connection.execute(insert(ShowStats).from_select(
+                ["show_id", "movie_id", "theatre_id", "day", "capacity", "seats_sold", "bookings", "cancellations", "revenue"],
+                select(Show.id, Show.movie_id, Screen.theatre_id, func.date(Show.start_time), func.coalesce(capacity.c.seats, 0), 0, 0, 0, 0.0)
+                .join(Screen, Show.screen_id == Screen.id)
+                .outerjoin(capacity, capacity.c.screen_id == Show.screen_id)
+                .filter(Show.id > floor, ~exists().where(ShowStats.show_id == Show.id)),
+            ))
+
+        # same overlap rules as the scheduling endpoints, against the database and within the chunk
+        async with schedule_lock:
+            conflicts = await find_conflicts(db, [SimpleNamespace(**entry.rows[0]) for entry in entries])
+            clashing = {}
+            for conflict in conflicts:
+                clashing.setdefault(conflict["index"], conflict)
+            kept = []
+            for i, entry in enumerate(entries):
+                if i in clashing:
+                    other = clashing[i].get("conflicts_with_show")
+                    self._drop(entry, f"Overlaps show {other}" if other else f"Overlaps the show on line {entries[clashing[i]['conflicts_with_index']].line}")
+                else:
+                    kept.append(entry)
+            await self._insert(db, KINDS["show"], kept, rollups)
+
+    def summary(self) -> dict:
+        seconds = time.perf_counter() - self.started
+        return {
+            "rows": self.rows,
+            "inserted": dict(self.inserted),
+            "errors": self.error_count,
+            "error_rows": sorted(self.errors, key=lambda error: error["line"]),
+            "seconds": round(seconds, 3),
+            "rows_per_second": round(self.rows / seconds, 1) if seconds else 0.0,
+        }
+
+
+async def run_import(chunks: AsyncIterator[bytes], fmt: str, default_type: str | None = None, chunk_size: int | None = None, progress: Callable | None = None) -> dict:
+    records = csv_records(chunks) if fmt == "csv" else ndjson_records(chunks)
+    return await CatalogImport(default_type, chunk_size, progress).run(records)
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Bulk import movies, theatres, screens, seats and shows from csv or ndjson")
+    parser.add_argument("path", help="file to import, - for stdin")
+    parser.add_argument("--format", choices=("csv", "ndjson"), help="default: from the file extension, ndjson otherwise")
+    parser.add_argument("--type", choices=tuple(KINDS), help="type for rows that do not name one")
+    parser.add_argument("--chunk-size", type=int, help="rows per insert transaction (default: IMPORT_CHUNK_SIZE)")
+    return parser.parse_args(argv)
+
+
+async def _read(stream, size: int = 1 << 16) -> AsyncIterator[bytes]:
+    while chunk := stream.read(size):
+        yield chunk
+        # let the import get at the event loop between reads
+        await asyncio.sleep(0)
+
+
+def _report(job: CatalogImport):
+    inserted = ", ".join(f"{count} {kind}s" for kind, count in job.inserted.items()) or "nothing yet"
+    print(f"\r{job.rows} rows read, {inserted}, {job.error_count} errors", end="", file=sys.stderr, flush=True)
+
+
+async def _main(args) -> int:
+    from app.database import Base, engine
+    from app.search import search_index
+
+    # same schema setup as the app's startup, so the fts triggers see the imported movies
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+        await conn.run_sync(search_index.ensure)
+    fmt = args.format or ("csv" if args.path.endswith(".csv") else "ndjson")
+    stream = sys.stdin.buffer if args.path == "-" else open(args.path, "rb")
+    try:
+        summary = await run_import(_read(stream), fmt, args.type, args.chunk_size, _report)
+    finally:
+        if stream is not sys.stdin.buffer:
+            stream.close()
+        await engine.dispose()
+    print(file=sys.stderr)
+    for error in summary["error_rows"]:
+        print(f"line {error['line']}: {error['type'] or '?'}: {error['message']}", file=sys.stderr)
+    if summary["errors"] > len(summary["error_rows"]):
+        print(f"... and {summary['errors'] - len(summary['error_rows'])} more errors", file=sys.stderr)
+    print(f"{summary['rows']} rows in {summary['seconds']}s ({summary['rows_per_second']} rows/s), {summary['errors']} errors")
+    return 1 if summary["errors"] else 0
+
+
+def main(argv=None):
+    sys.exit(asyncio.run(_main(parse_args(argv))))
+
+
+if __name__ == "__main__":
+    main()
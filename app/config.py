@@ -1,3 +1,4 @@
+from typing import Literal
 from pydantic_settings import BaseSettings
 
 class Settings(BaseSettings):
@@ -5,6 +6,90 @@ class Settings(BaseSettings):
     ALGORITHM: str = "HS256"
     ACCESS_TOKEN_EXPIRE_MINUTES: int = 30
     DATABASE_URL: str = "sqlite+aiosqlite:///./test.db"
+    # engine / pool
+    DB_ECHO: bool = False
+    DB_POOL_SIZE: int = 5
+    DB_MAX_OVERFLOW: int = 10
+    DB_POOL_TIMEOUT_SECONDS: int = 30
+    # checks each pooled connection before use; only applies to network databases
+    DB_POOL_PRE_PING: bool = True
+    DB_POOL_RECYCLE_SECONDS: int = 1800
+    SQLITE_BUSY_TIMEOUT_MS: int = 5000
+    SLOW_QUERY_MS: int = 200
+    # X-Profile request header returns a per-request query breakdown; exposes sql, keep off in production
+    PROFILING_ENABLED: bool = False
+    SQLITE_SYNCHRONOUS: Literal["OFF", "NORMAL", "FULL", "EXTRA"] = "NORMAL"
+    # authenticated principal cache
+    AUTH_CACHE_SIZE: int = 10000
+    AUTH_CACHE_USER_TTL_SECONDS: int = 300
+    # list endpoints
+    PAGE_SIZE_DEFAULT: int = 100
+    PAGE_SIZE_MAX: int = 1000
+    STREAM_YIELD_PER: int = 500
+    # composite browse endpoint: how far ahead it lists shows
+    BROWSE_DAYS_DEFAULT: int = 7
+    BROWSE_DAYS_MAX: int = 31
+    # catalog response cache, in-process unless a redis url is given
+    CATALOG_CACHE_URL: str = ""
+    CATALOG_CACHE_SIZE: int = 1024
+    CATALOG_CACHE_TTL_SECONDS: int = 300
+    # live seat feed
+    SEAT_FEED_MAX_PENDING: int = 512
+    SEAT_FEED_HEARTBEAT_SECONDS: int = 15
+    # bcrypt work factor and the pool it runs on
+    BCRYPT_ROUNDS: int = 12
+    PASSWORD_HASH_WORKERS: int = 4
+    PASSWORD_HASH_MAX_PENDING: int = 64
+    # seat holds
+    SEAT_HOLD_MINUTES: int = 10
+    SEAT_HOLD_MAX_MINUTES: int = 30
+    # seats in one hold, and holds a user may have running at once across all shows
+    SEAT_HOLD_MAX_SEATS: int = 10
+    SEAT_HOLD_MAX_ACTIVE: int = 3
+    # admission control: per-route limits by policy name, see app/admission.py. concurrency caps
+    # in-flight requests, rate/burst is a route-wide token bucket, user_rate/user_burst one per user
+    ADMISSION_ENABLED: bool = True
+    ADMISSION_LIMITS: dict[str, dict[str, float]] = {
+        "bookings": {"concurrency": 64, "user_rate": 1.0, "user_burst": 5},
+        "seats": {"concurrency": 256, "user_rate": 5.0, "user_burst": 20},
+        "browse": {"concurrency": 256, "user_rate": 10.0, "user_burst": 40},
+        "admin": {"concurrency": 16},
+    }
+    # booking attempts in flight per show, beyond the route limit
+    ADMISSION_SHOW_CONCURRENCY: int = 16
+    # longest a request may wait for a slot before it is shed
+    ADMISSION_QUEUE_TIMEOUT_MS: int = 200
+    ADMISSION_USER_BUCKETS: int = 100000
+    # booking emails, sent in batches from a background task; an empty SMTP_HOST turns them off
+    SMTP_HOST: str = ""
+    SMTP_PORT: int = 25
+    SMTP_USERNAME: str = ""
+    SMTP_PASSWORD: str = ""
+    SMTP_STARTTLS: bool = False
+    SMTP_TIMEOUT_SECONDS: int = 10
+    EMAIL_FROM: str = "tickets@example.com"
+    EMAIL_BATCH_SIZE: int = 50
+    EMAIL_BATCH_LINGER_MS: float = 200.0
+    EMAIL_QUEUE_MAX: int = 10000
+    EMAIL_MAX_ATTEMPTS: int = 5
+    EMAIL_RETRY_BASE_SECONDS: float = 2.0
+    # keep queued mail in the email_outbox table so a restart does not lose it
+    EMAIL_OUTBOX_ENABLED: bool = False
+    # move bookings of shows that ended this many days ago into archived_bookings; the background
+    # job only runs when enabled, POST /admin/archive/run works either way
+    ARCHIVE_ENABLED: bool = False
+    ARCHIVE_AFTER_DAYS: int = 30
+    ARCHIVE_BATCH_SIZE: int = 500
+    ARCHIVE_BATCH_PAUSE_MS: float = 50.0
+    ARCHIVE_INTERVAL_MINUTES: int = 60
+    # bulk catalog import: rows per insert transaction, and how many row errors a result lists
+    IMPORT_CHUNK_SIZE: int = 5000
+    IMPORT_MAX_ERRORS: int = 1000
+    # group commit for bookings: one writer task commits queued bookings in batches
+    BOOKING_PIPELINE_ENABLED: bool = False
+    BOOKING_BATCH_SIZE: int = 64
+    BOOKING_BATCH_LINGER_MS: float = 2.0
+    BOOKING_QUEUE_MAX: int = 4096
     
     class Config:
         env_file = ".env"
@@ -1,13 +1,127 @@
+import asyncio
+from sqlalchemy import delete, event, select
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.engine import make_url
 from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession, async_sessionmaker
-from sqlalchemy.orm import declarative_base
+from sqlalchemy.orm import Session, declarative_base
+from app.config import settings
 
-DATABASE_URL = "sqlite+aiosqlite:///./test.db"
+# plain or sync-driver urls are mapped to the async driver for the same database
+ASYNC_DRIVERS = {
+    "sqlite": "sqlite+aiosqlite",
+    "sqlite+pysqlite": "sqlite+aiosqlite",
+    "mysql": "mysql+aiomysql",
+    "mysql+pymysql": "mysql+aiomysql",
+}
 
-engine = create_async_engine(DATABASE_URL, future=True, echo=True)
+def async_url(url: str):
+    url = make_url(url)
+    driver = ASYNC_DRIVERS.get(url.drivername)
+    return url.set(drivername=driver) if driver else url
+
+def in_memory(url) -> bool:
+    return url.get_backend_name() == "sqlite" and url.database in (None, "", ":memory:")
+
+def engine_options(url) -> dict:
+    # a sqlite connection is a local file handle, there is no server to have dropped it
+    options = {"echo": settings.DB_ECHO, "pool_pre_ping": settings.DB_POOL_PRE_PING and url.get_backend_name() != "sqlite"}
+    if in_memory(url):
+        # in-memory sqlite lives on a single shared connection, no pool to size
+        return options
+    options.update(
+        pool_size=settings.DB_POOL_SIZE,
+        max_overflow=settings.DB_MAX_OVERFLOW,
+        pool_timeout=settings.DB_POOL_TIMEOUT_SECONDS,
+        pool_recycle=settings.DB_POOL_RECYCLE_SECONDS,
+    )
+    return options
+
+DATABASE_URL = async_url(settings.DATABASE_URL)
+
+engine = create_async_engine(DATABASE_URL, **engine_options(DATABASE_URL))
 AsyncSessionLocal = async_sessionmaker(engine, expire_on_commit=False, class_=AsyncSession)
 
+# execution option for transactions that are going to write. on sqlite they start with BEGIN IMMEDIATE:
+# a deferred transaction that reads first has to upgrade its snapshot to write, and once another writer
+# has committed past it that fails with "database is locked" however long busy_timeout waits. other
+# backends ignore it
+WRITE = {"sqlite_begin": "BEGIN IMMEDIATE"}
+
+# sqlite has one writer at a time anyway; writers from this process queue for it here, in order, instead
+# of polling in sqlite's busy handler where an unlucky one can be starved past busy_timeout. BEGIN
+# IMMEDIATE still covers writers in other processes
+_writer = asyncio.Lock() if DATABASE_URL.get_backend_name() == "sqlite" else None
+
+if DATABASE_URL.get_backend_name() == "sqlite":
+    @event.listens_for(engine.sync_engine, "connect")
+    def _sqlite_pragmas(dbapi_connection, connection_record):
+        # WAL lets readers run alongside the writer, busy_timeout waits for the lock instead of failing
+        cursor = dbapi_connection.cursor()
+        if not in_memory(DATABASE_URL):
+            cursor.execute("PRAGMA journal_mode=WAL")
+        cursor.execute(f"PRAGMA busy_timeout={int(settings.SQLITE_BUSY_TIMEOUT_MS)}")
+        cursor.execute(f"PRAGMA synchronous={settings.SQLITE_SYNCHRONOUS}")
+        # off by default in sqlite, and without it no ON DELETE CASCADE runs
+        cursor.execute("PRAGMA foreign_keys=ON")
+        cursor.close()
+        # the driver would open transactions itself with a deferred BEGIN; _sqlite_begin does it instead
+        dbapi_connection.isolation_level = None
+
+    @event.listens_for(engine.sync_engine, "begin")
+    def _sqlite_begin(conn):
+        # straight on the driver cursor, so BEGIN is not counted as a query by app.metrics
+        statement = conn.get_execution_options().get("sqlite_begin", "BEGIN")
+        cursor = conn.connection.cursor()
+        try:
+            cursor.execute(statement)
+        except conn.dialect.loaded_dbapi.Error as exc:
+            # wrapped like any other statement's error, so a lock timeout still reaches database_busy_handler
+            raise DBAPIError.instance(statement, None, exc, conn.dialect.loaded_dbapi.Error) from exc
+        finally:
+            cursor.close()
+
+    @event.listens_for(Session, "after_transaction_end")
+    def _release_writer(session, transaction):
+        if transaction.parent is None and session.info.pop("writer", False):
+            _writer.release()
+
 Base = declarative_base()
 
+def delete_orphans(sync_conn):
+    # run at startup on sqlite: rows an ON DELETE CASCADE should have removed back when foreign keys
+    # were not enforced. parents come before children in sorted_tables, so rows orphaned by this are
+    # removed in turn
+    if sync_conn.dialect.name != "sqlite":
+        return
+    for table in Base.metadata.sorted_tables:
+        for fk in table.foreign_keys:
+            if fk.ondelete == "CASCADE":
+                sync_conn.execute(delete(table).where(fk.parent.is_not(None), fk.parent.not_in(select(fk.column))))
+
 async def get_db():
     async with AsyncSessionLocal() as db:
-        yield db
\ No newline at end of file
+        yield db
+
+async def get_write_db():
+    # for handlers that write and take no other lock, see begin_write
+    async with AsyncSessionLocal() as db:
+        await begin_write(db)
+        yield db
+
+async def begin_write(db: AsyncSession):
+    # starts the session's next transaction as a write, holding this process's writer slot until it
+    # commits or rolls back. call it right before the first write and after taking any other lock the
+    # write needs: whoever holds the writer slot must not wait on a lock held by someone queued for it.
+    # an open read transaction is committed first, so the reads that decided the write have to be
+    # covered by that other lock (the show lock for seat claims) or re-checked by a constraint
+    if db.in_transaction():
+        await db.commit()
+    if _writer is not None:
+        await _writer.acquire()
+        db.sync_session.info["writer"] = True
+    try:
+        await db.connection(execution_options=WRITE)
+    except BaseException:
+        if db.sync_session.info.pop("writer", False):
+            _writer.release()
+        raise
@@ -4,29 +4,54 @@ from fastapi.security import OAuth2PasswordBearer
 from jose import JWTError, jwt
 from passlib.context import CryptContext
 from datetime import datetime, timedelta
-from sqlalchemy import select
-from sqlalchemy.ext.asyncio import AsyncSession
-from app.auth import decode_access_token
-from app.database import get_db
+from sqlalchemy import event, select
+from app.auth import decode_access_token, token_cache
+from app.cache import TTLCache
+from app.config import settings
+from app.database import AsyncSessionLocal
 from app.models import User
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
 
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 
-async def get_current_user(token: str = Depends(oauth2_scheme), db: AsyncSession = Depends(get_db)):
+# resolved users keyed by id, detached from the session that loaded them
+user_cache = TTLCache(maxsize=settings.AUTH_CACHE_SIZE, ttl=settings.AUTH_CACHE_USER_TTL_SECONDS)
+
+def invalidate_user(user_id: int):
+    user_cache.pop(user_id)
+
+@event.listens_for(User, "after_update")
+@event.listens_for(User, "after_delete")
+def _user_changed(mapper, connection, target):
+    invalidate_user(target.id)
+
+def auth_cache_stats():
+    return {"tokens": token_cache.stats(), "users": user_cache.stats()}
+
+async def get_current_user(token: str = Depends(oauth2_scheme)):
     payload = decode_access_token(token)
     if not payload or "sub" not in payload:
         raise HTTPException(status_code=401, detail="Invalid or expired token")
-    user_id = payload["sub"]
-    result = await db.execute(select(User).filter(User.id == user_id))
-    user = result.scalars().one_or_none()
+    try:
+        user_id = int(payload["sub"])
+    except (TypeError, ValueError):
+        raise HTTPException(status_code=401, detail="Invalid or expired token")
+    user = user_cache.get(user_id)
+    if user is not None:
+        return user
+    # short-lived session: the cached user is detached anyway, and the request's
+    # session should not sit on a pooled connection while the handler waits on locks
+    async with AsyncSessionLocal() as auth_db:
+        result = await auth_db.execute(select(User).filter(User.id == user_id))
+        user = result.scalars().one_or_none()
     if not user:
         raise HTTPException(status_code=401, detail="Invalid or expired token")
+    user_cache.set(user_id, user, expires_at=payload.get("exp"))
     return user
 
 async def require_admin(current_user: User = Depends(get_current_user)):
-    if not current_user.role.is_("admin"):
+    if current_user.role != "admin":
         raise HTTPException(status_code=403, detail="Permission denied")
     return current_user
 
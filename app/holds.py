@@ -0,0 +1,237 @@
+# temporary seat holds: held seats read as unavailable until the hold is confirmed, released or expires.
+# expiry runs off a min-heap of deadlines in one background task, O(log n) per hold, no table scans
+import asyncio
+import heapq
+import logging
+from datetime import datetime, timedelta
+from fastapi import HTTPException
+from sqlalchemy import delete, func, select
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.booking import bookable_show, check_seats, check_selection, seat_conflict, show_lock, write_booking
+from app.config import settings
+from app.database import AsyncSessionLocal, begin_write
+from app.models import BookedSeat, Booking, HeldSeat, SeatHold, Show
+from app.seatmap import seat_maps
+from app.worker import BackgroundWorker
+
+logger = logging.getLogger("app.holds")
+
+
+class HoldExpiry(BackgroundWorker):
+    def __init__(self):
+        super().__init__()
+        # (expires_at, hold_id); confirmed or released holds stay in the heap and are skipped when popped
+        self._heap: list[tuple[datetime, int]] = []
+        self._deadlines: dict[int, datetime] = {}
+        self._wakeup = asyncio.Event()
+        self.expired = 0
+
+    async def restore(self):
+        # startup: pick up holds that outlived the previous process, overdue ones expire right away
+        async with AsyncSessionLocal() as db:
+            holds = await db.execute(select(SeatHold.id, SeatHold.expires_at))
+            for hold_id, expires_at in holds.all():
+                self.schedule(hold_id, expires_at)
+        self.start()
+
+    def schedule(self, hold_id: int, expires_at: datetime):
+        self._deadlines[hold_id] = expires_at
+        heapq.heappush(self._heap, (expires_at, hold_id))
+        if self._heap[0][1] == hold_id:
+            # new earliest deadline, the sleeping task has to recompute its timeout
+            self._wakeup.set()
+        self.start()
+
+    def cancel(self, hold_id: int):
+        self._deadlines.pop(hold_id, None)
+
+    async def _run(self):
+        while True:
+            self._wakeup.clear()
+            if not self._heap:
+                await self._wakeup.wait()
+                continue
+            delay = (self._heap[0][0] - datetime.utcnow()).total_seconds()
+            if delay > 0:
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), delay)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            now, due = datetime.utcnow(), []
+            while self._heap and self._heap[0][0] <= now:
+                expires_at, hold_id = heapq.heappop(self._heap)
+                if self._deadlines.get(hold_id) == expires_at:
+                    del self._deadlines[hold_id]
+                    due.append(hold_id)
+            if due:
+                try:
+                    self.expired += await release_holds(due)
+                except Exception:
+                    logger.exception("failed to expire %d seat holds", len(due))
+
+    def stats(self) -> dict:
+        return {"active": len(self._deadlines), "heap": len(self._heap), "expired": self.expired}
+
+
+hold_expiry = HoldExpiry()
+
+
+async def release_holds(hold_ids: list[int]) -> int:
+    # frees whatever the holds still have. a hold confirmed while this waited for the lock has no rows
+    # left, but only a transaction started under the lock can see that: the show lookup's snapshot
+    # still has them
+    async with AsyncSessionLocal() as db:
+        shows = await db.execute(select(HeldSeat.show_id).filter(HeldSeat.hold_id.in_(hold_ids)).distinct())
+        for show_id in sorted(shows.scalars().all()):
+            async with show_lock(show_id):
+                await begin_write(db)
+                seats = await db.execute(select(HeldSeat.seat_id).filter(HeldSeat.hold_id.in_(hold_ids), HeldSeat.show_id == show_id))
+                seat_ids = seats.scalars().all()
+                await db.execute(delete(HeldSeat).where(HeldSeat.hold_id.in_(hold_ids), HeldSeat.show_id == show_id))
+                await db.commit()
+                seat_maps.mark_free(show_id, seat_ids)
+        await begin_write(db)
+        result = await db.execute(delete(SeatHold).where(SeatHold.id.in_(hold_ids)))
+        await db.commit()
+    return result.rowcount
+
+
+def _hold_dict(hold: SeatHold, seat_ids: list[int]) -> dict:
+    return {"id": hold.id, "show_id": hold.show_id, "seat_ids": seat_ids, "expires_at": hold.expires_at}
+
+
+def _hold_minutes(minutes: int | None) -> int:
+    minutes = minutes or settings.SEAT_HOLD_MINUTES
+    if minutes > settings.SEAT_HOLD_MAX_MINUTES:
+        raise HTTPException(status_code=400, detail=f"Holds last at most {settings.SEAT_HOLD_MAX_MINUTES} minutes")
+    return minutes
+
+
+def _check_hold_size(count: int):
+    if count > settings.SEAT_HOLD_MAX_SEATS:
+        raise HTTPException(status_code=400, detail=f"A hold has at most {settings.SEAT_HOLD_MAX_SEATS} seats")
+
+
+async def _holdable_show(db: AsyncSession, show_id: int) -> Show:
+    show, _ = await bookable_show(db, show_id)
+    if show.start_time <= datetime.utcnow():
+        raise HTTPException(status_code=400, detail="Show has already started")
+    return show
+
+
+async def _insert_hold(db: AsyncSession, user_id: int, show_id: int, seat_ids: list[int], minutes: int) -> SeatHold:
+    # caller holds the show lock and has checked the seats against the seat map. held_seats is only
+    # unique within holds, so a booked seat the map has wrong is caught here against booked_seats
+    await begin_write(db)
+    # counted inside the write transaction: the user's holds on other shows are not under this show's lock
+    active = await db.execute(select(func.count(SeatHold.id)).filter(SeatHold.user_id == user_id, SeatHold.expires_at > datetime.utcnow()))
+    if active.scalar() >= settings.SEAT_HOLD_MAX_ACTIVE:
+        await db.rollback()
+        raise HTTPException(status_code=409, detail=f"At most {settings.SEAT_HOLD_MAX_ACTIVE} holds at a time, confirm or release one first")
+    booked = await db.execute(select(BookedSeat.seat_id).filter(BookedSeat.show_id == show_id, BookedSeat.seat_id.in_(seat_ids)))
+    booked = booked.scalars().all()
+    if booked:
+        await db.rollback()
+        seat_maps.invalidate_show(show_id)
+        raise seat_conflict(booked)
+    hold = SeatHold(show_id=show_id, user_id=user_id, expires_at=datetime.utcnow() + timedelta(minutes=minutes))
+    hold.seats = [HeldSeat(show_id=show_id, seat_id=seat_id) for seat_id in seat_ids]
+    db.add(hold)
+    try:
+        await db.commit()
+    except IntegrityError:
+        await db.rollback()
+        seat_maps.invalidate_show(show_id)
+        raise seat_conflict(seat_ids)
+    seat_maps.mark_held(show_id, seat_ids)
+    return hold
+
+
+async def create_hold(db: AsyncSession, user_id: int, show_id: int, seat_ids: list[int], minutes: int | None) -> dict:
+    check_selection(seat_ids)
+    _check_hold_size(len(seat_ids))
+    minutes = _hold_minutes(minutes)
+    async with show_lock(show_id):
+        show = await _holdable_show(db, show_id)
+        seat_map = await seat_maps.get(db, show_id, screen_id=show.screen_id)
+        check_seats(seat_map, seat_ids)
+        hold = await _insert_hold(db, user_id, show_id, seat_ids, minutes)
+    hold_expiry.schedule(hold.id, hold.expires_at)
+    return _hold_dict(hold, seat_ids)
+
+
+def no_block(count: int) -> HTTPException:
+    return HTTPException(status_code=404, detail=f"No {count} adjacent seats available")
+
+
+async def hold_best_available(db: AsyncSession, user_id: int, show_id: int, count: int, minutes: int | None) -> dict:
+    # find and hold under the same lock, so nobody can take the block in between
+    _check_hold_size(count)
+    minutes = _hold_minutes(minutes)
+    async with show_lock(show_id):
+        show = await _holdable_show(db, show_id)
+        seat_map = await seat_maps.get(db, show_id, screen_id=show.screen_id)
+        seat_ids = seat_map.best_available(count)
+        if seat_ids is None:
+            raise no_block(count)
+        hold = await _insert_hold(db, user_id, show_id, seat_ids, minutes)
+    hold_expiry.schedule(hold.id, hold.expires_at)
+    return _hold_dict(hold, seat_ids)
+
+
+async def _load_hold(db: AsyncSession, hold_id: int, user_id: int) -> tuple[SeatHold, list[int]]:
+    hold = await db.execute(select(SeatHold).filter(SeatHold.id == hold_id, SeatHold.user_id == user_id))
+    hold = hold.scalar_one_or_none()
+    if not hold:
+        raise HTTPException(status_code=404, detail="Hold not found")
+    seats = await db.execute(select(HeldSeat.seat_id).filter(HeldSeat.hold_id == hold_id).order_by(HeldSeat.id))
+    return hold, seats.scalars().all()
+
+
+async def get_hold(db: AsyncSession, hold_id: int, user_id: int) -> dict:
+    hold, seat_ids = await _load_hold(db, hold_id, user_id)
+    return _hold_dict(hold, seat_ids)
+
+
+async def confirm_hold(db: AsyncSession, hold_id: int, user_id: int) -> Booking:
+    hold, _ = await _load_hold(db, hold_id, user_id)
+    show_id = hold.show_id
+    async with show_lock(show_id):
+        # re-read under the lock in a fresh snapshot, expiry or a release may have got here first
+        await db.rollback()
+        hold, seat_ids = await _load_hold(db, hold_id, user_id)
+        if not seat_ids or hold.expires_at <= datetime.utcnow():
+            raise HTTPException(status_code=410, detail="Hold expired")
+        show, theatre_id = await bookable_show(db, show_id)
+        seat_map = await seat_maps.get(db, show_id, screen_id=show.screen_id)
+        await begin_write(db)
+        await db.execute(delete(HeldSeat).where(HeldSeat.hold_id == hold_id))
+        await db.execute(delete(SeatHold).where(SeatHold.id == hold_id))
+        try:
+            booking = await write_booking(db, user_id, show, theatre_id, len(seat_map.seat_ids), seat_ids)
+            await db.commit()
+        except IntegrityError:
+            await db.rollback()
+            seat_maps.invalidate_show(show_id)
+            raise seat_conflict(seat_ids)
+        hold_expiry.cancel(hold_id)
+        seat_maps.mark_booked(show_id, seat_ids)
+    await db.refresh(booking)
+    return booking
+
+
+async def release_hold(db: AsyncSession, hold_id: int, user_id: int) -> dict:
+    hold, _ = await _load_hold(db, hold_id, user_id)
+    async with show_lock(hold.show_id):
+        # as in confirm_hold, the seats are re-read in a snapshot taken under the lock
+        await db.rollback()
+        hold, seat_ids = await _load_hold(db, hold_id, user_id)
+        await begin_write(db)
+        await db.execute(delete(HeldSeat).where(HeldSeat.hold_id == hold_id))
+        await db.execute(delete(SeatHold).where(SeatHold.id == hold_id))
+        await db.commit()
+        hold_expiry.cancel(hold_id)
+        seat_maps.mark_free(hold.show_id, seat_ids)
+    return _hold_dict(hold, seat_ids)
@@ -0,0 +1,88 @@
+# seat layout generation: expands grid specs and writes a whole screen layout in one transaction
+import string
+from datetime import datetime
+from fastapi import HTTPException
+from sqlalchemy import delete, exists, insert, select
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.models import BookedSeat, HeldSeat, Seat, SeatHold
+from app.schemas import SeatGrid, SeatLayoutCreate
+from app.seatmap import seat_maps
+
+
+def parse_rows(rows: str) -> list[str]:
+    # "A-C,E" -> ["A", "B", "C", "E"]
+    letters = []
+    for part in rows.replace(" ", "").upper().split(","):
+        if not part:
+            continue
+        if "-" in part:
+            start, _, end = part.partition("-")
+            if start not in string.ascii_uppercase or end not in string.ascii_uppercase or len(start) != 1 or len(end) != 1 or start > end:
+                raise HTTPException(status_code=400, detail=f"Invalid row range '{part}'")
+            letters.extend(string.ascii_uppercase[string.ascii_uppercase.index(start):string.ascii_uppercase.index(end) + 1])
+        elif len(part) == 1 and part in string.ascii_uppercase:
+            letters.append(part)
+        else:
+            raise HTTPException(status_code=400, detail=f"Invalid row '{part}'")
+    return letters
+
+
+def expand_grid(grid: SeatGrid) -> list[dict]:
+    if grid.col_end < grid.col_start:
+        raise HTTPException(status_code=400, detail="col_end must not be before col_start")
+    skip_cols = set(grid.skip_cols)
+    disabled = {label.upper() for label in grid.disabled}
+    seats = []
+    for row in parse_rows(grid.rows):
+        for col in range(grid.col_start, grid.col_end + 1):
+            label = f"{row}{col}"
+            if col in skip_cols or label in disabled:
+                continue
+            seats.append({"label": label, "row": row, "col": col})
+    return seats
+
+
+def expand_layout(layout: SeatLayoutCreate) -> list[dict]:
+    seats = expand_grid(layout.grid) if layout.grid else []
+    seats.extend(seat.model_dump() for seat in layout.seats)
+    if not seats:
+        raise HTTPException(status_code=400, detail="Layout has no seats")
+    labels = [seat["label"] for seat in seats]
+    if len(set(labels)) != len(labels):
+        duplicates = sorted({label for label in labels if labels.count(label) > 1})
+        raise HTTPException(status_code=400, detail={"message": "Duplicate seat labels in layout", "labels": duplicates})
+    return seats
+
+
+async def write_layout(db: AsyncSession, screen_id: int, layout: SeatLayoutCreate) -> list[Seat]:
+    seats = expand_layout(layout)
+    if layout.replace:
+        # a layout can only be swapped out while no booking, cancelled ones included, points at its seats
+        # and no show on the screen has a held seat; deleting the seats would take the bookings' seat rows
+        # with them
+        booked = await db.execute(select(exists().where(BookedSeat.seat_id == Seat.id, Seat.screen_id == screen_id)))
+        if booked.scalar():
+            raise HTTPException(status_code=409, detail="Screen has bookings, layout cannot be replaced")
+        held = await db.execute(
+            select(exists().where(
+                HeldSeat.seat_id == Seat.id, Seat.screen_id == screen_id, HeldSeat.hold_id == SeatHold.id, SeatHold.expires_at > datetime.utcnow()
+            ))
+        )
+        if held.scalar():
+            raise HTTPException(status_code=409, detail="Screen has held seats, layout cannot be replaced")
+        await db.execute(delete(Seat).where(Seat.screen_id == screen_id))
+    else:
+        existing = await db.execute(select(Seat.label).filter(Seat.screen_id == screen_id))
+        existing = set(existing.scalars().all()) & {seat["label"] for seat in seats}
+        if existing:
+            raise HTTPException(status_code=409, detail={"message": "Seats already exist on this screen", "labels": sorted(existing)})
+    try:
+        await db.execute(insert(Seat), [{**seat, "screen_id": screen_id} for seat in seats])
+        await db.commit()
+    except IntegrityError:
+        await db.rollback()
+        raise HTTPException(status_code=409, detail="Seat labels must be unique per screen")
+    seat_maps.invalidate_screen(screen_id)
+    result = await db.execute(select(Seat).filter(Seat.screen_id == screen_id).order_by(Seat.row, Seat.col, Seat.id))
+    return result.scalars().all()
@@ -1,9 +1,48 @@
 from fastapi import FastAPI
-from app.database import Base, engine
+from fastapi.responses import PlainTextResponse
+from sqlalchemy.exc import OperationalError
+from app.admission import database_busy_handler
+from app.archive import booking_archiver
+from app.auth import hash_pool_stats
+from app.booking import ensure_claims
+from app.booking_pipeline import booking_pipeline
+from app.config import settings
+from app.holds import hold_expiry
+from app.database import Base, delete_orphans, engine
+from app.deps import auth_cache_stats
+from app.notifications import email_dispatcher
+from app.metrics import MetricsMiddleware, instrument_engine, registry
+from app.response_cache import catalog_cache
 from app.routes import router as api_router
+from app.seatfeed import seat_feed
+from app.search import search_index
 
 app = FastAPI(title="Movie Ticket Booking System", description="A simple movie ticket booking system", version="1.0.0")
 app.include_router(api_router)
+app.add_middleware(MetricsMiddleware)
+app.add_exception_handler(OperationalError, database_busy_handler)
+instrument_engine(engine.sync_engine)
+
+def _cache_gauges():
+    auth = auth_cache_stats()
+    catalog = catalog_cache.stats()
+    return {
+        "auth_token_cache_hits": auth["tokens"]["hits"],
+        "auth_token_cache_misses": auth["tokens"]["misses"],
+        "auth_user_cache_hits": auth["users"]["hits"],
+        "auth_user_cache_misses": auth["users"]["misses"],
+        "catalog_cache_hits": catalog["hits"],
+        "catalog_cache_misses": catalog["misses"],
+        "catalog_cache_not_modified": catalog["not_modified"],
+        "password_hash_pending": hash_pool_stats()["pending"],
+        "seat_feed_subscribers": seat_feed.stats()["subscribers"],
+        "seat_holds_active": hold_expiry.stats()["active"],
+        "email_queued": email_dispatcher.stats()["queued"],
+        "email_sent": email_dispatcher.sent,
+        "email_failed": email_dispatcher.failed,
+    }
+
+registry.collectors.append(_cache_gauges)
 
 origins = [
     "http://localhost",
@@ -14,6 +53,27 @@ origins = [
 async def create_tables():
     async with engine.begin() as conn:
         await conn.run_sync(Base.metadata.create_all)
+        await conn.run_sync(ensure_claims)
+        await conn.run_sync(delete_orphans)
+        await conn.run_sync(search_index.ensure)
+    await hold_expiry.restore()
+    await email_dispatcher.restore()
+    if settings.BOOKING_PIPELINE_ENABLED:
+        booking_pipeline.start()
+    if settings.ARCHIVE_ENABLED:
+        booking_archiver.start()
+
+@app.on_event("shutdown")
+async def stop_background_tasks():
+    await booking_pipeline.stop()
+    await hold_expiry.stop()
+    await email_dispatcher.stop()
+    await booking_archiver.stop()
+
+# prometheus text format
+@app.get("/metrics", include_in_schema=False)
+async def metrics():
+    return PlainTextResponse(registry.render(), media_type="text/plain; version=0.0.4")
 
 @app.get("/")
 async def root():
@@ -0,0 +1,203 @@
+# request timing, sql query counting and prometheus text exposition
+import contextvars
+import json
+import logging
+import time
+from collections import defaultdict
+from sqlalchemy import event
+from app.config import settings
+
+logger = logging.getLogger("app.sql")
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class Histogram:
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.total = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.total += value
+        self.count += 1
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+
+
+class Registry:
+    # plain dicts keyed by label tuples; everything runs on the event loop so no locking
+    def __init__(self):
+        self.request_latency: dict[tuple, Histogram] = defaultdict(Histogram)
+        self.responses: dict[tuple, int] = defaultdict(int)
+        self.in_flight: dict[tuple, int] = defaultdict(int)
+        self.query_count: dict[tuple, int] = defaultdict(int)
+        self.query_seconds: dict[tuple, float] = defaultdict(float)
+        self.slow_queries = 0
+        # statements that gave up waiting for sqlite's write lock
+        self.lock_timeouts = 0
+        # (policy, reason) -> requests turned away by admission control
+        self.shed: dict[tuple, int] = defaultdict(int)
+        # name -> (help, Histogram) for subsystems outside the request path
+        self.histograms: dict[str, tuple[str, Histogram]] = {}
+        # callables returning {name: value}, rendered as gauges
+        self.collectors: list = []
+
+    def render(self) -> str:
+        lines = []
+
+        def header(name, kind, help_text):
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+
+        header("http_request_duration_seconds", "histogram", "Request latency by route")
+        for (method, route), hist in sorted(self.request_latency.items()):
+            labels = f'method="{method}",route="{route}"'
+            cumulative = 0
+            for bound, count in zip(hist.buckets, hist.counts):
+                cumulative += count
+                lines.append(f'http_request_duration_seconds_bucket{{{labels},le="{bound}"}} {cumulative}')
+            lines.append(f'http_request_duration_seconds_bucket{{{labels},le="+Inf"}} {hist.count}')
+            lines.append(f"http_request_duration_seconds_sum{{{labels}}} {hist.total:.6f}")
+            lines.append(f"http_request_duration_seconds_count{{{labels}}} {hist.count}")
+
+        header("http_responses_total", "counter", "Responses by route and status code")
+        for (method, route, status), count in sorted(self.responses.items()):
+            lines.append(f'http_responses_total{{method="{method}",route="{route}",status="{status}"}} {count}')
+
+        header("http_requests_in_flight", "gauge", "Requests currently being served")
+        for (method,), count in sorted(self.in_flight.items()):
+            lines.append(f'http_requests_in_flight{{method="{method}"}} {count}')
+
+        header("db_queries_total", "counter", "SQL statements executed by route")
+        for (method, route), count in sorted(self.query_count.items()):
+            lines.append(f'db_queries_total{{method="{method}",route="{route}"}} {count}')
+
+        header("db_query_duration_seconds_total", "counter", "Time spent in SQL statements by route")
+        for (method, route), seconds in sorted(self.query_seconds.items()):
+            lines.append(f'db_query_duration_seconds_total{{method="{method}",route="{route}"}} {seconds:.6f}')
+
+        header("db_slow_queries_total", "counter", f"Statements slower than {settings.SLOW_QUERY_MS}ms")
+        lines.append(f"db_slow_queries_total {self.slow_queries}")
+
+        header("db_lock_timeouts_total", "counter", "Statements that timed out waiting for the sqlite write lock")
+        lines.append(f"db_lock_timeouts_total {self.lock_timeouts}")
+
+        header("http_requests_shed_total", "counter", "Requests rejected by admission control")
+        for (policy, reason), count in sorted(self.shed.items()):
+            lines.append(f'http_requests_shed_total{{policy="{policy}",reason="{reason}"}} {count}')
+
+        for name, (help_text, hist) in sorted(self.histograms.items()):
+            header(name, "histogram", help_text)
+            cumulative = 0
+            for bound, count in zip(hist.buckets, hist.counts):
+                cumulative += count
+                lines.append(f'{name}_bucket{{le="{bound}"}} {cumulative}')
+            lines.append(f'{name}_bucket{{le="+Inf"}} {hist.count}')
+            lines.append(f"{name}_sum {hist.total:.6f}")
+            lines.append(f"{name}_count {hist.count}")
+
+        for collect in self.collectors:
+            for name, value in sorted(collect().items()):
+                header(name, "gauge", name.replace("_", " "))
+                lines.append(f"{name} {value}")
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+
+class QueryStats:
+    __slots__ = ("count", "seconds", "statements")
+
+    def __init__(self, profile: bool):
+        self.count = 0
+        self.seconds = 0.0
+        # statement -> [count, seconds], only kept when the request asked for a profile
+        self.statements: dict[str, list] | None = {} if profile else None
+
+
+_current_queries: contextvars.ContextVar[QueryStats | None] = contextvars.ContextVar("current_queries", default=None)
+
+
+def instrument_engine(engine):
+    # one statement at a time per connection, so a single start time each; a statement that fails never
+    # reaches _after and its start is simply overwritten by the next one
+    @event.listens_for(engine, "before_cursor_execute")
+    def _before(conn, cursor, statement, parameters, context, executemany):
+        conn.info["query_start"] = time.perf_counter()
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _after(conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - conn.info.pop("query_start")
+        if elapsed * 1000 >= settings.SLOW_QUERY_MS:
+            registry.slow_queries += 1
+            logger.warning("slow query (%.1f ms): %s", elapsed * 1000, statement)
+        stats = _current_queries.get()
+        if stats is None:
+            return
+        stats.count += 1
+        stats.seconds += elapsed
+        if stats.statements is not None:
+            entry = stats.statements.setdefault(statement, [0, 0.0])
+            entry[0] += 1
+            entry[1] += elapsed
+
+
+def _route_label(scope) -> str:
+    # routing stores the matched route in the scope; label by its template to keep series bounded
+    route = scope.get("route")
+    return getattr(route, "path", None) or "unmatched"
+
+
+class MetricsMiddleware:
+    # pure asgi so streaming responses (ndjson, sse) pass through untouched
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        method = scope["method"]
+        profile = settings.PROFILING_ENABLED and any(k == b"x-profile" for k, _ in scope.get("headers", []))
+        stats = QueryStats(profile)
+        token = _current_queries.set(stats)
+        start = time.perf_counter()
+        status = 500
+        # the route is only known once routing has run, so in-flight is tracked per method
+        registry.in_flight[(method,)] += 1
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                if profile:
+                    message["headers"] = list(message.get("headers", [])) + _profile_headers(stats, time.perf_counter() - start)
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            _current_queries.reset(token)
+            registry.in_flight[(method,)] -= 1
+            key = (method, _route_label(scope))
+            registry.request_latency[key].observe(time.perf_counter() - start)
+            registry.responses[key + (status,)] += 1
+            registry.query_count[key] += stats.count
+            registry.query_seconds[key] += stats.seconds
+
+
+def _profile_headers(stats: QueryStats, elapsed: float) -> list[tuple[bytes, bytes]]:
+    top = sorted(stats.statements.items(), key=lambda item: item[1][0], reverse=True)[:10]
+    breakdown = [{"count": count, "ms": round(seconds * 1000, 2), "sql": " ".join(sql.split())[:200]} for sql, (count, seconds) in top]
+    return [
+        (b"x-query-count", str(stats.count).encode()),
+        (b"x-query-time-ms", f"{stats.seconds * 1000:.2f}".encode()),
+        (b"x-request-time-ms", f"{elapsed * 1000:.2f}".encode()),
+        (b"x-query-breakdown", json.dumps(breakdown).encode()),
+    ]
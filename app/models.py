@@ -1,4 +1,4 @@
-from sqlalchemy import Boolean, Column, Float, Integer, String, ForeignKey, DateTime, UniqueConstraint
+from sqlalchemy import JSON, Boolean, Column, Date, Float, Index, Integer, String, ForeignKey, DateTime, UniqueConstraint
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 from app.database import Base
@@ -16,7 +16,7 @@ class Theatre(Base):
     __tablename__ = "theatres"
     id = Column(Integer, primary_key=True, index=True)
     name = Column(String, index=True)
-    location = Column(String)
+    location = Column(String, index=True)
     screens = relationship("Screen", back_populates="theatre", cascade="all, delete-orphan")
 
 
@@ -60,6 +60,10 @@ class Show(Base):
     price = Column(Float, nullable=False)
     active = Column(Boolean, default=True)
     bookings = relationship("Booking", back_populates="show", cascade="all, delete-orphan")
+    __table_args__ = (
+        Index("ix_shows_movie_id_start_time", "movie_id", "start_time"),
+        Index("ix_shows_screen_id_start_time", "screen_id", "start_time"),
+    )
 
 class Booking(Base):
     __tablename__ = "bookings"
@@ -68,7 +72,8 @@ class Booking(Base):
     show = relationship("Show", back_populates="bookings")
     user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
     user = relationship("User", backref="bookings")
-    seats = relationship("Seat", secondary="booked_seats", backref="bookings")
+    seats = relationship("Seat", secondary="booked_seats", viewonly=True)
+    booked_seats = relationship("BookedSeat", back_populates="booking", cascade="all, delete-orphan")
     created_at = Column(DateTime, default=func.now())
     updated_at = Column(DateTime, default=func.now(), onupdate=func.now())
     total_price = Column(Float, nullable=False)
@@ -79,5 +84,72 @@ class BookedSeat(Base):
     id = Column(Integer, primary_key=True, index=True)
     booking_id = Column(Integer, ForeignKey("bookings.id", ondelete="CASCADE"), nullable=False)
     seat_id = Column(Integer, ForeignKey("seats.id", ondelete="CASCADE"), nullable=False)
-    booking = relationship("Booking", back_populates="seats")
+    # set while the seat is claimed for the show, cleared when the booking is cancelled
+    show_id = Column(Integer, ForeignKey("shows.id", ondelete="CASCADE"), nullable=True)
+    booking = relationship("Booking", back_populates="booked_seats")
+    __table_args__ = (UniqueConstraint('show_id', 'seat_id', name = "unique_booked_seat_show_id"),)
 
+
+# bookings of shows that ended long ago, moved out of the live tables by app/archive.py. one row per
+# booking with its seats folded in, and no foreign keys so nothing cascades into it
+class ArchivedBooking(Base):
+    __tablename__ = "archived_bookings"
+    id = Column(Integer, primary_key=True)
+    show_id = Column(Integer, nullable=False, index=True)
+    user_id = Column(Integer, nullable=False, index=True)
+    created_at = Column(DateTime)
+    updated_at = Column(DateTime)
+    total_price = Column(Float, nullable=False)
+    cancelled = Column(Boolean, default=False)
+    # the booking's seat ids, and how many of them it still claimed when it was archived
+    seat_ids = Column(JSON, nullable=False)
+    seats_claimed = Column(Integer, default=0, nullable=False)
+    archived_at = Column(DateTime, default=func.now())
+
+
+# seats held for a user until expires_at; confirmed into a booking, released, or expired
+class SeatHold(Base):
+    __tablename__ = "seat_holds"
+    id = Column(Integer, primary_key=True, index=True)
+    show_id = Column(Integer, ForeignKey("shows.id", ondelete="CASCADE"), nullable=False)
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
+    created_at = Column(DateTime, default=func.now())
+    expires_at = Column(DateTime, nullable=False)
+    seats = relationship("HeldSeat", back_populates="hold", cascade="all, delete-orphan")
+
+class HeldSeat(Base):
+    __tablename__ = "held_seats"
+    id = Column(Integer, primary_key=True, index=True)
+    hold_id = Column(Integer, ForeignKey("seat_holds.id", ondelete="CASCADE"), nullable=False, index=True)
+    show_id = Column(Integer, ForeignKey("shows.id", ondelete="CASCADE"), nullable=False)
+    seat_id = Column(Integer, ForeignKey("seats.id", ondelete="CASCADE"), nullable=False)
+    hold = relationship("SeatHold", back_populates="seats")
+    __table_args__ = (UniqueConstraint("show_id", "seat_id", name="unique_held_seat_show_id"),)
+
+
+# booking emails waiting to be sent, only written when EMAIL_OUTBOX_ENABLED
+class EmailOutbox(Base):
+    __tablename__ = "email_outbox"
+    id = Column(Integer, primary_key=True, index=True)
+    recipient = Column(String, nullable=False)
+    subject = Column(String, nullable=False)
+    body = Column(String, nullable=False)
+    attempts = Column(Integer, default=0, nullable=False)
+    last_error = Column(String)
+    created_at = Column(DateTime, default=func.now())
+    sent_at = Column(DateTime, index=True)
+    failed_at = Column(DateTime)
+
+
+# booking rollup per show, kept up to date in the booking/cancel transaction
+class ShowStats(Base):
+    __tablename__ = "show_stats"
+    show_id = Column(Integer, ForeignKey("shows.id", ondelete="CASCADE"), primary_key=True)
+    movie_id = Column(Integer, index=True, nullable=False)
+    theatre_id = Column(Integer, index=True, nullable=False)
+    day = Column(Date, index=True, nullable=False)
+    capacity = Column(Integer, default=0, nullable=False)
+    seats_sold = Column(Integer, default=0, nullable=False)
+    bookings = Column(Integer, default=0, nullable=False)
+    cancellations = Column(Integer, default=0, nullable=False)
+    revenue = Column(Float, default=0.0, nullable=False)
@@ -0,0 +1,261 @@
+# booking emails: queued off the request path, sent in batches over one reused smtp connection
+# with retry and exponential backoff; optionally mirrored to the email_outbox table once a batch is taken
+import asyncio
+import logging
+import random
+import smtplib
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from email.message import EmailMessage
+from sqlalchemy import select, update
+from app.config import settings
+from app.database import AsyncSessionLocal, begin_write
+from app.models import BookedSeat, Booking, EmailOutbox, Movie, Screen, Seat, Show, Theatre, User
+from app.worker import BatchingWorker
+
+logger = logging.getLogger("app.notifications")
+
+
+class OutgoingEmail:
+    __slots__ = ("recipient", "subject", "body", "attempts", "outbox_id")
+
+    def __init__(self, recipient: str, subject: str, body: str, attempts: int = 0, outbox_id: int | None = None):
+        self.recipient = recipient
+        self.subject = subject
+        self.body = body
+        self.attempts = attempts
+        self.outbox_id = outbox_id
+
+    def message(self) -> EmailMessage:
+        message = EmailMessage()
+        message["From"] = settings.EMAIL_FROM
+        message["To"] = self.recipient
+        message["Subject"] = self.subject
+        message.set_content(self.body)
+        return message
+
+
+class SmtpSender:
+    # blocking smtplib, only ever touched from the dispatcher's single worker thread
+    def __init__(self):
+        self._smtp: smtplib.SMTP | None = None
+        self.connections = 0
+
+    def _connect(self) -> smtplib.SMTP:
+        if self._smtp is not None:
+            try:
+                if self._smtp.noop()[0] == 250:
+                    return self._smtp
+            except smtplib.SMTPException:
+                pass
+            self.close()
+        smtp = smtplib.SMTP(settings.SMTP_HOST, settings.SMTP_PORT, timeout=settings.SMTP_TIMEOUT_SECONDS)
+        if settings.SMTP_STARTTLS:
+            smtp.starttls()
+        if settings.SMTP_USERNAME:
+            smtp.login(settings.SMTP_USERNAME, settings.SMTP_PASSWORD)
+        self._smtp = smtp
+        self.connections += 1
+        return smtp
+
+    def send_batch(self, batch: list[OutgoingEmail]) -> list[tuple[bool, bool, str | None]]:
+        # (sent, retryable, error) per message, in batch order
+        results = []
+        try:
+            smtp = self._connect()
+        except (OSError, smtplib.SMTPException) as exc:
+            return [(False, True, f"connect: {exc}")] * len(batch)
+        for i, email in enumerate(batch):
+            try:
+                smtp.send_message(email.message())
+                results.append((True, False, None))
+            except smtplib.SMTPRecipientsRefused as exc:
+                code = min(code for code, _ in exc.recipients.values())
+                results.append((False, code < 500, str(exc)))
+            except smtplib.SMTPResponseException as exc:
+                # 4xx is temporary, 5xx means this message will never go through
+                results.append((False, exc.smtp_code < 500, str(exc)))
+            except (OSError, smtplib.SMTPException) as exc:
+                # connection lost: this and everything after it go back for a retry
+                self.close()
+                results.extend([(False, True, str(exc))] * (len(batch) - i))
+                break
+        return results
+
+    def close(self):
+        if self._smtp is not None:
+            try:
+                self._smtp.quit()
+            except (OSError, smtplib.SMTPException):
+                pass
+            self._smtp = None
+
+
+class EmailDispatcher(BatchingWorker):
+    # delivery is best-effort: mail is queued in memory after the booking has committed, so a crash
+    # before its batch is picked up loses it. the outbox only covers mail from there on
+    def __init__(self):
+        super().__init__(settings.EMAIL_BATCH_SIZE, settings.EMAIL_BATCH_LINGER_MS / 1000, settings.EMAIL_QUEUE_MAX)
+        self.sender = SmtpSender()
+        # one thread, so the smtp connection is never shared
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="smtp")
+        self._retries: set[asyncio.TimerHandle] = set()
+        self.sent = 0
+        self.failed = 0
+        self.retried = 0
+        self.dropped = 0
+        self.batches = 0
+
+    @property
+    def enabled(self) -> bool:
+        return bool(settings.SMTP_HOST)
+
+    def start(self):
+        if self.enabled:
+            super().start()
+
+    async def stop(self):
+        # pending retries are abandoned; with the outbox on they are picked up again by restore()
+        for handle in self._retries:
+            handle.cancel()
+        self._retries.clear()
+        await super().stop()
+        await asyncio.get_running_loop().run_in_executor(self._executor, self.sender.close)
+
+    async def restore(self):
+        # startup: requeue outbox rows that were neither sent nor given up on
+        if not (self.enabled and settings.EMAIL_OUTBOX_ENABLED):
+            return
+        async with AsyncSessionLocal() as db:
+            rows = await db.execute(
+                select(EmailOutbox).filter(EmailOutbox.sent_at.is_(None), EmailOutbox.failed_at.is_(None)).order_by(EmailOutbox.id)
+            )
+            for row in rows.scalars():
+                self._put(OutgoingEmail(row.recipient, row.subject, row.body, row.attempts, row.id))
+        self.start()
+
+    async def enqueue(self, email: OutgoingEmail):
+        if not self.enabled:
+            return
+        self.start()
+        self._put(email)
+
+    def _put(self, email: OutgoingEmail):
+        try:
+            self.queue.put_nowait(email)
+        except asyncio.QueueFull:
+            self.dropped += 1
+            logger.warning("email queue full, dropping mail to %s", email.recipient)
+
+    async def _process(self, batch: list[OutgoingEmail]):
+        if settings.EMAIL_OUTBOX_ENABLED:
+            await self._store(batch)
+        loop = asyncio.get_running_loop()
+        results = await loop.run_in_executor(self._executor, self.sender.send_batch, batch)
+        self.batches += 1
+        sent, outbox = [], []
+        for email, (ok, retryable, error) in zip(batch, results):
+            if ok:
+                self.sent += 1
+                sent.append(email)
+                continue
+            email.attempts += 1
+            give_up = not retryable or email.attempts >= settings.EMAIL_MAX_ATTEMPTS
+            if give_up:
+                self.failed += 1
+                logger.warning("giving up on mail to %s after %d attempts: %s", email.recipient, email.attempts, error)
+            else:
+                self.retried += 1
+                # exponential backoff with jitter so a recovering server is not hit by the whole backlog at once
+                delay = settings.EMAIL_RETRY_BASE_SECONDS * 2 ** (email.attempts - 1) * random.uniform(0.5, 1.5)
+                self._schedule_retry(loop, delay, email)
+            outbox.append((email, error, give_up))
+        if settings.EMAIL_OUTBOX_ENABLED:
+            await self._record(sent, outbox)
+
+    async def _store(self, batch: list[OutgoingEmail]):
+        # one write for the whole batch; retries and restored mail already have their row
+        new = [email for email in batch if email.outbox_id is None]
+        if not new:
+            return
+        async with AsyncSessionLocal() as db:
+            await begin_write(db)
+            rows = [EmailOutbox(recipient=email.recipient, subject=email.subject, body=email.body) for email in new]
+            db.add_all(rows)
+            await db.commit()
+        for email, row in zip(new, rows):
+            email.outbox_id = row.id
+
+    def _schedule_retry(self, loop, delay: float, email: OutgoingEmail):
+        def retry():
+            self._retries.discard(handle)
+            self._put(email)
+
+        handle = loop.call_later(delay, retry)
+        self._retries.add(handle)
+
+    async def _record(self, sent: list[OutgoingEmail], failed: list[tuple]):
+        now = datetime.utcnow()
+        async with AsyncSessionLocal() as db:
+            await begin_write(db)
+            sent_ids = [email.outbox_id for email in sent if email.outbox_id is not None]
+            if sent_ids:
+                await db.execute(update(EmailOutbox).where(EmailOutbox.id.in_(sent_ids)).values(sent_at=now))
+            for email, error, give_up in failed:
+                if email.outbox_id is not None:
+                    await db.execute(
+                        update(EmailOutbox)
+                        .where(EmailOutbox.id == email.outbox_id)
+                        .values(attempts=email.attempts, last_error=(error or "")[:500], failed_at=now if give_up else None)
+                    )
+            await db.commit()
+
+    def stats(self) -> dict:
+        return {
+            "enabled": self.enabled,
+            "queued": self.queue.qsize(),
+            "retrying": len(self._retries),
+            "sent": self.sent,
+            "failed": self.failed,
+            "retried": self.retried,
+            "dropped": self.dropped,
+            "batches": self.batches,
+            "connections": self.sender.connections,
+        }
+
+
+email_dispatcher = EmailDispatcher()
+
+
+async def notify_booking(booking_id: int, event: str):
+    # runs as a BackgroundTask after the response is sent; event is "confirmed" or "cancelled"
+    if not email_dispatcher.enabled:
+        return
+    async with AsyncSessionLocal() as db:
+        row = await db.execute(
+            select(Booking, User.email, Movie.title, Show.start_time, Theatre.name, Screen.name)
+            .join(User, Booking.user_id == User.id)
+            .join(Show, Booking.show_id == Show.id)
+            .join(Movie, Show.movie_id == Movie.id)
+            .join(Screen, Show.screen_id == Screen.id)
+            .join(Theatre, Screen.theatre_id == Theatre.id)
+            .filter(Booking.id == booking_id)
+        )
+        row = row.one_or_none()
+        if row is None:
+            return
+        booking, recipient, title, start_time, theatre, screen = row
+        labels = await db.execute(
+            select(Seat.label).join(BookedSeat, BookedSeat.seat_id == Seat.id).filter(BookedSeat.booking_id == booking_id).order_by(Seat.row, Seat.col)
+        )
+        labels = labels.scalars().all()
+    subject = f"Booking {booking.id} {event}: {title}"
+    body = (
+        f"Your booking {booking.id} has been {event}.\n\n"
+        f"Movie: {title}\n"
+        f"When: {start_time:%Y-%m-%d %H:%M}\n"
+        f"Where: {theatre}, {screen}\n"
+        f"Seats: {', '.join(labels)}\n"
+        f"Total: {booking.total_price:.2f}\n"
+    )
+    await email_dispatcher.enqueue(OutgoingEmail(recipient, subject, body))
@@ -0,0 +1,70 @@
+# keyset pagination and ndjson streaming for list endpoints
+from fastapi import Query, Response
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel
+from sqlalchemy import Select
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.config import settings
+from app.database import AsyncSessionLocal
+from app.serialize import FastJSONResponse, as_dicts, dumps, is_flat, schema_columns
+
+
+class PageParams:
+    def __init__(
+        self,
+        limit: int | None = Query(None, ge=1, le=settings.PAGE_SIZE_MAX, description="Rows per page"),
+        after: int | None = Query(None, description="Cursor: return rows with id greater than this, from X-Next-Cursor"),
+        stream: bool = Query(False, description="Stream rows as NDJSON instead of returning a page"),
+    ):
+        self.limit = limit
+        self.after = after
+        self.stream = stream
+
+
+def keyset(query: Select, model, page: PageParams, limit: int | None) -> Select:
+    # ids grow with created_at, so ordering on the primary key walks rows in creation order
+    if page.after is not None:
+        query = query.filter(model.id > page.after)
+    query = query.order_by(model.id)
+    if limit is not None:
+        query = query.limit(limit)
+    return query
+
+
+async def load_page(db: AsyncSession, query: Select, model, schema: type[BaseModel], page: PageParams):
+    # only the schema's columns, as dicts ready for dumps(); returns the rows and the cursor for
+    # the next page, None on the last page
+    limit = page.limit or settings.PAGE_SIZE_DEFAULT
+    # core execution on the session's connection: plain rows, none of the orm result machinery
+    connection = await db.connection()
+    result = await connection.execute(keyset(query.with_only_columns(*schema_columns(model, schema)), model, page, limit))
+    rows = as_dicts(result)
+    return rows, (rows[-1]["id"] if len(rows) == limit else None)
+
+
+def page_response(rows: list[dict], next_cursor: int | None) -> Response:
+    headers = {"X-Next-Cursor": str(next_cursor)} if next_cursor is not None else None
+    return FastJSONResponse(rows, headers=headers)
+
+
+def stream_ndjson(query: Select, model, schema: type[BaseModel], page: PageParams) -> StreamingResponse:
+    flat = is_flat(model, schema)
+    if flat:
+        query = query.with_only_columns(*schema_columns(model, schema))
+    query = keyset(query, model, page, page.limit).execution_options(yield_per=settings.STREAM_YIELD_PER)
+
+    async def rows():
+        # own session: the request's session may be closed before the body is sent
+        async with AsyncSessionLocal() as db:
+            if flat:
+                connection = await db.connection()
+                result = await connection.stream(query)
+                keys = list(result.keys())
+                async for row in result:
+                    yield dumps(dict(zip(keys, row))) + b"\n"
+            else:
+                result = await db.stream(query)
+                async for row in result.scalars():
+                    yield schema.model_validate(row).model_dump_json() + "\n"
+
+    return StreamingResponse(rows(), media_type="application/x-ndjson")
@@ -0,0 +1,91 @@
+# catalog response cache: pre-serialized bodies keyed by a per-tag version, with ETag/304 support
+import hashlib
+import time
+from fastapi import Request, Response
+from app.cache import TTLCache
+from app.config import settings
+from app.serialize import dumps
+
+
+class MemoryBackend:
+    # in-process stand-in exposing the subset of the redis.asyncio client the cache uses
+    def __init__(self, maxsize: int):
+        self._entries = TTLCache(maxsize=maxsize)
+        # counters live outside the LRU, an evicted version would make stale entries valid again
+        self._counters: dict[str, int] = {}
+
+    async def get(self, key: str):
+        if key in self._counters:
+            return str(self._counters[key]).encode()
+        return self._entries.get(key)
+
+    async def set(self, key: str, value: bytes, ex: int | None = None):
+        self._entries.set(key, value, expires_at=time.time() + ex if ex is not None else None)
+
+    async def incr(self, key: str) -> int:
+        self._counters[key] = self._counters.get(key, 0) + 1
+        return self._counters[key]
+
+    async def delete(self, *keys: str):
+        for key in keys:
+            self._counters.pop(key, None)
+            self._entries.pop(key)
+
+
+def make_backend():
+    if not settings.CATALOG_CACHE_URL:
+        return MemoryBackend(settings.CATALOG_CACHE_SIZE)
+    try:
+        import redis.asyncio as redis
+    except ImportError:
+        raise RuntimeError("CATALOG_CACHE_URL is set but the redis package is not installed")
+    return redis.from_url(settings.CATALOG_CACHE_URL)
+
+
+class CatalogCache:
+    def __init__(self, backend, ttl: int):
+        self.backend = backend
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.not_modified = 0
+
+    async def version(self, tag: str) -> int:
+        version = await self.backend.get(f"catalog:version:{tag}")
+        return int(version) if version else 0
+
+    async def bump(self, *tags: str):
+        # entries are never deleted, they just stop being addressable once the version moves
+        for tag in tags:
+            await self.backend.incr(f"catalog:version:{tag}")
+
+    async def respond(self, request: Request, tag: str, load) -> Response:
+        # load returns (rows, next_cursor) with rows already plain json-ready values, see pagination.load_page
+        version = await self.version(tag)
+        query = "&".join(sorted(request.url.query.split("&"))) if request.url.query else ""
+        key = f"catalog:{tag}:{version}:{request.url.path}?{query}"
+        etag = f'W/"{tag}-{version}-{hashlib.sha1(key.encode()).hexdigest()[:16]}"'
+        headers = {"ETag": etag, "Cache-Control": "no-cache"}
+
+        if etag in request.headers.get("if-none-match", ""):
+            self.not_modified += 1
+            return Response(status_code=304, headers=headers)
+
+        cached = await self.backend.get(key)
+        if cached is None:
+            self.misses += 1
+            rows, next_cursor = await load()
+            cached = (str(next_cursor) if next_cursor is not None else "").encode() + b"\n" + dumps(rows)
+            await self.backend.set(key, cached, ex=self.ttl)
+        else:
+            self.hits += 1
+        next_cursor, body = cached.split(b"\n", 1)
+        if next_cursor:
+            headers["X-Next-Cursor"] = next_cursor.decode()
+        return Response(content=body, media_type="application/json", headers=headers)
+
+    def stats(self) -> dict:
+        return {"backend": type(self.backend).__name__, "hits": self.hits, "misses": self.misses, "not_modified": self.not_modified}
+
+
+catalog_cache = CatalogCache(make_backend(), settings.CATALOG_CACHE_TTL_SECONDS)
@@ -1,26 +1,44 @@
 # admin routes(protected)
-from fastapi import APIRouter, Depends, HTTPException, status
+from datetime import date
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, status
 from sqlalchemy import select
 from sqlalchemy.ext.asyncio import AsyncSession
-from app.database import get_db
-from app.models import Booking, Movie, Screen, Seat, Show, Theatre, User
-from app.schemas import MovieCreate, ScreenCreate, SeatCreate, ShowCreate, TheatreCreate
+from app.database import get_db, get_write_db
+from app.models import ArchivedBooking, Booking, Movie, Screen, Seat, Show, Theatre, User
+from app.schemas import AnalyticsSummary, ArchiveRun, CatalogImportResult, DailyAnalytics, RollupRebuild, ArchivedBooking as ArchivedBookingSchema
+from app.schemas import MovieCreate, ScreenCreate, SeatCreate, SeatLayoutCreate, ShowBatchCreate, ShowCreate, TheatreCreate
 from app.schemas import Theatre as TheatreSchema, Screen as ScreenSchema, Movie as MovieSchema, Show as ShowSchema, Booking as BookingSchema, Seat as SeatSchema
-from app.deps import require_admin
+from app.auth import hash_pool_stats
+from app.booking_pipeline import booking_pipeline
+from app.holds import hold_expiry
+from app.notifications import email_dispatcher
+from app.pagination import PageParams, load_page, page_response, stream_ndjson
+from app.deps import auth_cache_stats, require_admin
+from app.admission import admission_stats, admit
+from app.seatmap import seat_maps
+from app.seatfeed import seat_feed
+from app.response_cache import catalog_cache
+from app.layout import write_layout
+from app.scheduling import schedule_shows
+from app.analytics import rebuild_rollups, summarize, summarize_by_day
+from app.archive import booking_archiver
+from app.catalog_import import KINDS as IMPORT_TYPES, run_import
 
-router = APIRouter(prefix="/admin", tags=["admin"])
+# admin traffic gets its own small slot pool, so it stays usable while user routes are shedding
+router = APIRouter(prefix="/admin", tags=["admin"], dependencies=[Depends(admit("admin", require_admin))])
 
 # Theatre
 @router.post("/theatres", response_model=TheatreSchema)
-async def create_theatre(theatre: TheatreCreate, db: AsyncSession = Depends(get_db), current_user: User = Depends(require_admin)):
+async def create_theatre(theatre: TheatreCreate, db: AsyncSession = Depends(get_write_db), current_user: User = Depends(require_admin)):
     new_theatre = Theatre(name=theatre.name, location=theatre.location)
     db.add(new_theatre)
     await db.commit()
+    await catalog_cache.bump("theatres")
     await db.refresh(new_theatre)
     return new_theatre
 
 @router.put("/theatres/{theatre_id}", response_model=TheatreSchema)
-async def update_theatre(theatre_id: int, theatre: TheatreCreate, db: AsyncSession = Depends(get_db), current_user: User = Depends(require_admin)):
+async def update_theatre(theatre_id: int, theatre: TheatreCreate, db: AsyncSession = Depends(get_write_db), current_user: User = Depends(require_admin)):
     existing_theatre = await db.execute(select(Theatre).filter(Theatre.id == theatre_id))
     existing_theatre = existing_theatre.scalar_one_or_none()
     if not existing_theatre:
@@ -28,22 +46,29 @@ async def update_theatre(theatre_id: int, theatre: TheatreCreate, db: AsyncSessi
     for key, value in theatre.model_dump().items():
         setattr(existing_theatre, key, value)
     await db.commit()
+    await catalog_cache.bump("theatres", "shows")
     await db.refresh(existing_theatre)
     return existing_theatre
 
 @router.delete("/theatres/{theatre_id}", response_model=TheatreSchema)
-async def delete_theatre(theatre_id: int, db: AsyncSession = Depends(get_db), current_user: User = Depends(require_admin)):
+async def delete_theatre(theatre_id: int, db: AsyncSession = Depends(get_write_db), current_user: User = Depends(require_admin)):
     existing_theatre = await db.execute(select(Theatre).filter(Theatre.id == theatre_id))
     existing_theatre = existing_theatre.scalar_one_or_none()
     if not existing_theatre:
         raise HTTPException(status_code=404, detail="Theatre not found")
+    show_ids = await db.execute(select(Show.id).join(Screen, Show.screen_id == Screen.id).filter(Screen.theatre_id == theatre_id))
+    show_ids = show_ids.scalars().all()
     await db.delete(existing_theatre)
     await db.commit()
+    await catalog_cache.bump("theatres", "shows")
+    # sqlite reuses the ids, a new show must not find the old one's seat map
+    for show_id in show_ids:
+        seat_maps.invalidate_show(show_id)
     return existing_theatre
 
 # add screens to theatres
 @router.post("/theatres/{theatre_id}/screens", response_model=ScreenSchema)
-async def create_screen(theatre_id: int, screen: ScreenCreate, db: AsyncSession = Depends(get_db), current_user: User = Depends(require_admin)):
+async def create_screen(theatre_id: int, screen: ScreenCreate, db: AsyncSession = Depends(get_write_db), current_user: User = Depends(require_admin)):
     existing_theatre = await db.execute(select(Theatre).filter(Theatre.id == theatre_id))
     existing_theatre = existing_theatre.scalar_one_or_none()
     if not existing_theatre:
@@ -51,12 +76,13 @@ async def create_screen(theatre_id: int, screen: ScreenCreate, db: AsyncSession
     new_screen = Screen(name=screen.name, theatre_id=theatre_id)
     db.add(new_screen)
     await db.commit()
+    await catalog_cache.bump("theatres", "shows")
     await db.refresh(new_screen)
     return new_screen
 
 # update screen
 @router.put("/screens/{screen_id}", response_model=ScreenSchema)
-async def update_screen(screen_id: int, screen: ScreenCreate, db: AsyncSession = Depends(get_db), current_user: User = Depends(require_admin)):
+async def update_screen(screen_id: int, screen: ScreenCreate, db: AsyncSession = Depends(get_write_db), current_user: User = Depends(require_admin)):
     existing_screen = await db.execute(select(Screen).filter(Screen.id == screen_id))
     existing_screen = existing_screen.scalar_one_or_none()
     if not existing_screen:
@@ -64,23 +90,26 @@ async def update_screen(screen_id: int, screen: ScreenCreate, db: AsyncSession =
     for key, value in screen.model_dump().items():
         setattr(existing_screen, key, value)
     await db.commit()
+    await catalog_cache.bump("theatres", "shows")
     await db.refresh(existing_screen)
     return existing_screen
 
 # delete a screen
 @router.delete("/screens/{screen_id}", response_model=ScreenSchema)
-async def delete_screen(screen_id: int, db: AsyncSession = Depends(get_db), current_user: User = Depends(require_admin)):
+async def delete_screen(screen_id: int, db: AsyncSession = Depends(get_write_db), current_user: User = Depends(require_admin)):
     existing_screen = await db.execute(select(Screen).filter(Screen.id == screen_id))
     existing_screen = existing_screen.scalar_one_or_none()
     if not existing_screen:
         raise HTTPException(status_code=404, detail="Screen not found")
     await db.delete(existing_screen)
     await db.commit()
+    await catalog_cache.bump("theatres", "shows")
+    seat_maps.invalidate_screen(screen_id)
     return existing_screen
 
 # seats for a screen
 @router.post("/screens/{screen_id}/seats", response_model=SeatSchema)
-async def create_seat(screen_id: int, seat: SeatCreate, db: AsyncSession = Depends(get_db), current_user: User = Depends(require_admin)):
+async def create_seat(screen_id: int, seat: SeatCreate, db: AsyncSession = Depends(get_write_db), current_user: User = Depends(require_admin)):
     existing_screen = await db.execute(select(Screen).filter(Screen.id == screen_id))
     existing_screen = existing_screen.scalar_one_or_none()
     if not existing_screen:
@@ -89,21 +118,31 @@ async def create_seat(screen_id: int, seat: SeatCreate, db: AsyncSession = Depen
     db.add(new_seat)
     await db.commit()
     await db.refresh(new_seat)
+    seat_maps.invalidate_screen(screen_id)
     return new_seat
 
+# generate a whole seat layout for a screen from a grid spec and/or explicit seats
+@router.post("/screens/{screen_id}/layout", response_model=list[SeatSchema])
+async def create_seat_layout(screen_id: int, layout: SeatLayoutCreate, db: AsyncSession = Depends(get_write_db), current_user: User = Depends(require_admin)):
+    existing_screen = await db.execute(select(Screen.id).filter(Screen.id == screen_id))
+    if existing_screen.scalar_one_or_none() is None:
+        raise HTTPException(status_code=404, detail="Screen not found")
+    return await write_layout(db, screen_id, layout)
+
 #add new movie
 
 @router.post("/movies", response_model=MovieSchema)
-async def create_movie(movie: MovieCreate, db: AsyncSession = Depends(get_db), current_user: User = Depends(require_admin)):
+async def create_movie(movie: MovieCreate, db: AsyncSession = Depends(get_write_db), current_user: User = Depends(require_admin)):
     new_movie = Movie(title=movie.title, description=movie.description, min_duration=movie.min_duration)
     db.add(new_movie)
     await db.commit()
+    await catalog_cache.bump("movies")
     await db.refresh(new_movie)
     return new_movie
 
 #update movie details
 @router.put("/movies/{movie_id}", response_model=MovieSchema)
-async def update_movie(movie_id: int, movie: MovieCreate, db: AsyncSession = Depends(get_db), current_user: User = Depends(require_admin)):
+async def update_movie(movie_id: int, movie: MovieCreate, db: AsyncSession = Depends(get_write_db), current_user: User = Depends(require_admin)):
     existing_movie = await db.execute(select(Movie).filter(Movie.id == movie_id))
     existing_movie = existing_movie.scalar_one_or_none()
     if not existing_movie:
@@ -111,32 +150,91 @@ async def update_movie(movie_id: int, movie: MovieCreate, db: AsyncSession = Dep
     for key, value in movie.model_dump().items():
         setattr(existing_movie, key, value)
     await db.commit()
+    await catalog_cache.bump("movies")
     await db.refresh(existing_movie)
     return existing_movie
 
 #delete movie
 @router.delete("/movies/{movie_id}", response_model=MovieSchema)
-async def delete_movie(movie_id: int, db: AsyncSession = Depends(get_db), current_user: User = Depends(require_admin)):
+async def delete_movie(movie_id: int, db: AsyncSession = Depends(get_write_db), current_user: User = Depends(require_admin)):
     existing_movie = await db.execute(select(Movie).filter(Movie.id == movie_id))
     existing_movie = existing_movie.scalar_one_or_none()
     if not existing_movie:
         raise HTTPException(status_code=404, detail="Movie not found")
+    show_ids = await db.execute(select(Show.id).filter(Show.movie_id == movie_id))
+    show_ids = show_ids.scalars().all()
     await db.delete(existing_movie)
     await db.commit()
+    await catalog_cache.bump("movies", "shows")
+    for show_id in show_ids:
+        seat_maps.invalidate_show(show_id)
     return existing_movie
 
 # schedule a new show (movie + screen + time + price)
 @router.post("/shows", response_model=ShowSchema)
 async def create_show(show: ShowCreate, db: AsyncSession = Depends(get_db), current_user: User = Depends(require_admin)):
-    new_show = Show(movie_id=show.movie_id, screen_id=show.screen_id, start_time=show.start_time, end_time=show.end_time, price=show.price)
-    db.add(new_show)
-    await db.commit()
-    await db.refresh(new_show)
-    return new_show
-
-# view all user bookings
-@router.get("/bookings", response_model=list[BookingSchema])
-async def get_all_bookings(db: AsyncSession = Depends(get_db), current_user: User = Depends(require_admin)):
-    bookings = await db.execute(select(Booking))
-    bookings = bookings.scalars().all()
-    return bookings
\ No newline at end of file
+    new_shows = await schedule_shows(db, ShowBatchCreate(shows=[show]))
+    await catalog_cache.bump("shows")
+    return new_shows[0]
+
+# schedule many shows at once, from a list and/or a recurrence rule
+@router.post("/shows/bulk", response_model=list[ShowSchema])
+async def create_shows_bulk(batch: ShowBatchCreate, db: AsyncSession = Depends(get_db), current_user: User = Depends(require_admin)):
+    new_shows = await schedule_shows(db, batch)
+    await catalog_cache.bump("shows")
+    return new_shows
+
+# bulk import of movies, theatres, screens, seats and shows from a csv or ndjson body, read as it
+# arrives; see app/catalog_import.py for the row format
+@router.post("/import", response_model=CatalogImportResult)
+async def import_catalog(
+    request: Request,
+    format: str | None = Query(None, pattern="^(csv|ndjson)$", description="Defaults to csv for a text/csv body, ndjson otherwise"),
+    type: str | None = Query(None, description=f"Type for rows that do not name one: {', '.join(IMPORT_TYPES)}"),
+    chunk_size: int | None = Query(None, ge=1, le=100000, description="Rows per insert transaction"),
+    current_user: User = Depends(require_admin),
+):
+    fmt = format or ("csv" if "csv" in request.headers.get("content-type", "") else "ndjson")
+    return await run_import(request.stream(), fmt, type, chunk_size)
+
+# view all user bookings; archived=true reads bookings of long-finished shows from the archive instead
+@router.get("/bookings", response_model=list[BookingSchema] | list[ArchivedBookingSchema])
+async def get_all_bookings(page: PageParams = Depends(), archived: bool = Query(False, description="Read archived bookings, with their seat ids"), db: AsyncSession = Depends(get_db), current_user: User = Depends(require_admin)):
+    model, schema = (ArchivedBooking, ArchivedBookingSchema) if archived else (Booking, BookingSchema)
+    if page.stream:
+        return stream_ndjson(select(model), model, schema, page)
+    return page_response(*await load_page(db, select(model), model, schema, page))
+
+# move bookings of shows that ended more than after_days ago into the archive, in batches
+@router.post("/archive/run", response_model=ArchiveRun)
+async def run_archive(after_days: int | None = Query(None, ge=0, description="Defaults to ARCHIVE_AFTER_DAYS"), current_user: User = Depends(require_admin)):
+    return {"bookings": await booking_archiver.run_once(after_days)}
+
+# booking analytics, read from the show_stats rollup
+@router.get("/analytics/shows/{show_id}", response_model=AnalyticsSummary)
+async def get_show_analytics(show_id: int, db: AsyncSession = Depends(get_db), current_user: User = Depends(require_admin)):
+    summary = await summarize(db, show_id=show_id)
+    if not summary["shows"]:
+        raise HTTPException(status_code=404, detail="Show not found")
+    return summary
+
+@router.get("/analytics/movies/{movie_id}", response_model=AnalyticsSummary)
+async def get_movie_analytics(movie_id: int, start: date | None = None, end: date | None = None, db: AsyncSession = Depends(get_db), current_user: User = Depends(require_admin)):
+    return await summarize(db, start, end, movie_id=movie_id)
+
+@router.get("/analytics/theatres/{theatre_id}", response_model=AnalyticsSummary)
+async def get_theatre_analytics(theatre_id: int, start: date | None = None, end: date | None = None, db: AsyncSession = Depends(get_db), current_user: User = Depends(require_admin)):
+    return await summarize(db, start, end, theatre_id=theatre_id)
+
+@router.get("/analytics/days", response_model=list[DailyAnalytics])
+async def get_daily_analytics(start: date = Query(...), end: date = Query(...), db: AsyncSession = Depends(get_db), current_user: User = Depends(require_admin)):
+    return await summarize_by_day(db, start, end)
+
+@router.post("/analytics/rebuild", response_model=RollupRebuild)
+async def rebuild_analytics(db: AsyncSession = Depends(get_db), current_user: User = Depends(require_admin)):
+    return {"shows": await rebuild_rollups(db)}
+
+# cache hit/miss counters for tuning
+@router.get("/cache-stats")
+async def get_cache_stats(current_user: User = Depends(require_admin)):
+    return {"auth": auth_cache_stats(), "password_hashing": hash_pool_stats(), "catalog": catalog_cache.stats(), "seat_feed": seat_feed.stats(), "booking_pipeline": booking_pipeline.stats(), "seat_holds": hold_expiry.stats(), "email": email_dispatcher.stats(), "admission": admission_stats(), "archive": booking_archiver.stats()}
\ No newline at end of file
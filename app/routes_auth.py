@@ -3,10 +3,10 @@ from fastapi import APIRouter, Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordRequestForm
 from sqlalchemy import select
 from sqlalchemy.ext.asyncio import AsyncSession
-from app.database import get_db
+from app.database import begin_write, get_db
 from app.models import User as UserModel
 from app.schemas import UserCreate, UserLogin, Token, User as UserSchema
-from app.auth import create_access_token, get_password_hash, verify_password
+from app.auth import create_access_token, get_password_hash_async, verify_password_async
 from app.deps import get_current_user
 
 router = APIRouter(prefix="/auth", tags=["auth"])
@@ -16,7 +16,9 @@ async def register_user(user: UserCreate, db: AsyncSession = Depends(get_db)):
     existing_user = await db.execute(select(UserModel).filter(UserModel.email == user.email))
     if existing_user.scalar_one_or_none():
         raise HTTPException(status_code=400, detail="Email already registered")
-    new_user = UserModel(email=user.email, password=get_password_hash(user.password))
+    password = await get_password_hash_async(user.password)
+    await begin_write(db)
+    new_user = UserModel(email=user.email, password=password)
     db.add(new_user)
     await db.commit()
     await db.refresh(new_user)
@@ -28,7 +30,7 @@ async def login_user(form_data: OAuth2PasswordRequestForm = Depends(), db: Async
     user = user.scalar_one_or_none()
     if not user:
         raise HTTPException(status_code=400, detail="Invalid credentials")
-    if not verify_password(form_data.password, user.password):
+    if not await verify_password_async(form_data.password, user.password):
         raise HTTPException(status_code=400, detail="Invalid credentials")
-    access_token = create_access_token(data={"sub": user.id})
+    access_token = create_access_token(data={"sub": str(user.id)})
     return {"access_token": access_token, "token_type": "bearer"}
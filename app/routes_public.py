@@ -1,89 +1,188 @@
 # user apis
-from fastapi import APIRouter, Depends, HTTPException, status
+from collections import defaultdict
+from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException, Query, Request, status
+from fastapi.responses import StreamingResponse
 from sqlalchemy import select
+from sqlalchemy.orm import joinedload, selectinload
 from sqlalchemy.ext.asyncio import AsyncSession
 from app.database import get_db
 from app.models import BookedSeat, Booking, Movie, Screen, Seat, Show, Theatre, User
-from app.schemas import BookingCreate, BookingUpdate, Movie as MovieSchema, Screen as ScreenSchema, Seat as SeatSchema, Show as ShowSchema, Theatre as TheatreSchema, User as UserSchema, Booking as BookingSchema
+from app.schemas import BookingCreate, BookingUpdate, Movie as MovieSchema, Screen as ScreenSchema, Seat as SeatSchema, SeatAvailability, Show as ShowSchema, ShowDetail, Theatre as TheatreSchema, User as UserSchema, Booking as BookingSchema, BookingDetail, SeatHold as SeatHoldSchema, SeatHoldCreate, BestSeatHoldCreate, BestSeats
 from app.deps import require_active_user
+from app.admission import admit, show_admission
+from app.seatmap import seat_maps
+from app.seatfeed import seat_events
+from app.pagination import PageParams, load_page, page_response, stream_ndjson
+from app.response_cache import catalog_cache
+from app.serialize import as_dicts, schema_columns
+from app.search import ShowFilters, search_movies
+from app.browse import BrowseParams, browse
+from app.booking import cancel_booking as cancel_user_booking, create_booking
+from app.booking_pipeline import booking_pipeline
+from app.holds import confirm_hold, create_hold, get_hold, hold_best_available, no_block, release_hold
+from app.notifications import notify_booking
+from app.config import settings
 
 router = APIRouter(prefix="/user", tags=["user"])
 
+# booking -> show is many-to-one and joins in; booking -> seats is one extra IN query per page
+booking_loaders = (joinedload(Booking.show), selectinload(Booking.seats))
+
+
+async def attach_show_and_seats(db: AsyncSession, bookings: list[dict]) -> list[dict]:
+    # BookingDetail from plain rows: one IN query for the page's shows and one for its seats
+    if not bookings:
+        return bookings
+    shows = await db.execute(select(*schema_columns(Show, ShowSchema)).filter(Show.id.in_({b["show_id"] for b in bookings})))
+    shows = {show["id"]: show for show in as_dicts(shows)}
+    result = await db.execute(
+        select(BookedSeat.booking_id, *schema_columns(Seat, SeatSchema))
+        .join(Seat, BookedSeat.seat_id == Seat.id)
+        .filter(BookedSeat.booking_id.in_([b["id"] for b in bookings]))
+        .order_by(BookedSeat.id)
+    )
+    keys = list(result.keys())[1:]
+    seats = defaultdict(list)
+    for booking_id, *seat in result:
+        seats[booking_id].append(dict(zip(keys, seat)))
+    for booking in bookings:
+        booking["show"] = shows[booking["show_id"]]
+        booking["seats"] = seats[booking["id"]]
+    return bookings
+
 # get all movies
 @router.get("/movies", response_model=list[MovieSchema])
-async def get_all_movies(db: AsyncSession = Depends(get_db), current_user: User = Depends(require_active_user)):
-    movies = await db.execute(select(Movie))
-    movies = movies.scalars().all()
-    return movies
+async def get_all_movies(request: Request, q: str | None = None, page: PageParams = Depends(), db: AsyncSession = Depends(get_db), current_user: User = Depends(admit("browse"))):
+    query = search_movies(select(Movie), q)
+    if page.stream:
+        return stream_ndjson(query, Movie, MovieSchema, page)
+    return await catalog_cache.respond(request, "movies", lambda: load_page(db, query, Movie, MovieSchema, page))
 
 # get all shows
 @router.get("/shows", response_model=list[ShowSchema])
-async def get_all_shows(db: AsyncSession = Depends(get_db), current_user: User = Depends(require_active_user)):
-    shows = await db.execute(select(Show))
-    shows = shows.scalars().all()
-    return shows
+async def get_all_shows(request: Request, filters: ShowFilters = Depends(), page: PageParams = Depends(), db: AsyncSession = Depends(get_db), current_user: User = Depends(admit("browse"))):
+    query = filters.apply(select(Show))
+    if page.stream:
+        return stream_ndjson(query, Show, ShowSchema, page)
+    return await catalog_cache.respond(request, "shows", lambda: load_page(db, query, Show, ShowSchema, page))
+
+# theatres with their screens, upcoming shows, movies and availability in one response;
+# include and fields trim the levels and columns, theatres page like the list endpoints
+@router.get("/browse")
+async def browse_theatres(params: BrowseParams = Depends(), db: AsyncSession = Depends(get_db), current_user: User = Depends(admit("browse"))):
+    theatres, next_cursor = await browse(db, params)
+    return page_response(theatres, next_cursor)
 
 # get show details with screen and seat layout
-@router.get("/shows/{show_id}", response_model=ShowSchema)
-async def get_show_details(show_id: int, db: AsyncSession = Depends(get_db), current_user: User = Depends(require_active_user)):
-    show = await db.execute(select(Show).filter(Show.id == show_id))
+@router.get("/shows/{show_id}", response_model=ShowDetail)
+async def get_show_details(show_id: int, db: AsyncSession = Depends(get_db), current_user: User = Depends(admit("browse"))):
+    # one query for show, movie, screen and theatre; seats come from the seat map
+    show = await db.execute(
+        select(Show).options(joinedload(Show.movie), joinedload(Show.screen).joinedload(Screen.theatre)).filter(Show.id == show_id)
+    )
     show = show.scalar_one_or_none()
     if not show:
         raise HTTPException(status_code=404, detail="Show not found")
-    booked = await db.execute(select(BookedSeat).join(Booking).filter(Booking.show_id == show_id))
-    booked = booked.scalars().all()
-    booked_seats = [b.seat_id for b in booked]
-    for seat in show.screen.seats:
-        if seat.id in booked_seats:
-            seat.booked = True
-        else:
-            seat.booked = False
-    return show
+    seat_map = await seat_maps.get(db, show_id, screen_id=show.screen_id)
+    return {
+        **ShowSchema.model_validate(show).model_dump(),
+        "movie": show.movie,
+        "screen": show.screen,
+        "theatre": show.screen.theatre,
+        "seats": seat_map.seats() if seat_map else [],
+    }
 
 # get seat availability for a show
-@router.get("/shows/{show_id}/seats", response_model=list[SeatSchema])
-async def get_seat_availability(show_id: int, db: AsyncSession = Depends(get_db), current_user: User = Depends(require_active_user)):
-    seats = await db.execute(select(Seat).join(Show).filter(Show.id == show_id))
-    seats = seats.scalars().all()
-    return seats
+@router.get("/shows/{show_id}/seats", response_model=list[SeatAvailability])
+async def get_seat_availability(show_id: int, db: AsyncSession = Depends(get_db), current_user: User = Depends(admit("seats"))):
+    seat_map = await seat_maps.get(db, show_id)
+    if not seat_map:
+        raise HTTPException(status_code=404, detail="Show not found")
+    return seat_map.seats()
 
-# book specific seats for a show
-@router.post("/bookings", response_model=BookingSchema)
-async def book_seats(booking: BookingCreate, db: AsyncSession = Depends(get_db), current_user: User = Depends(require_active_user)):
-    # Get the show to calculate total price
-    show = await db.execute(select(Show).filter(Show.id == booking.show_id))
-    show = show.scalar_one_or_none()
-    if not show:
+# best block of adjacent free seats for a party, nearest the middle of the screen
+@router.get("/shows/{show_id}/seats/best", response_model=BestSeats)
+async def get_best_available(show_id: int, count: int = Query(..., ge=1), db: AsyncSession = Depends(get_db), current_user: User = Depends(admit("seats"))):
+    seat_map = await seat_maps.get(db, show_id)
+    if not seat_map:
+        raise HTTPException(status_code=404, detail="Show not found")
+    seat_ids = seat_map.best_available(count)
+    if seat_ids is None:
+        raise no_block(count)
+    seats = [seat_map.seat(seat_id) for seat_id in seat_ids]
+    return {"show_id": show_id, "row": seats[0]["row"], "seats": seats}
+
+# live seat availability for a show as server-sent events: a snapshot, then deltas
+@router.get("/shows/{show_id}/seats/stream")
+async def stream_seat_availability(show_id: int, db: AsyncSession = Depends(get_db), current_user: User = Depends(require_active_user)):
+    if not await seat_maps.get(db, show_id):
         raise HTTPException(status_code=404, detail="Show not found")
+    return StreamingResponse(seat_events(show_id), media_type="text/event-stream", headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
 
-    # Calculate total price based on number of seats and show price
-    total_price = show.price * len(booking.seat_ids)
-
-    new_booking = Booking(show_id=booking.show_id, user_id=current_user.id, total_price=total_price)
-    db.add(new_booking)
-    await db.commit()
-    await db.refresh(new_booking)
-    for seat_id in booking.seat_ids:
-        new_booked_seat = BookedSeat(booking_id=new_booking.id, seat_id=seat_id)
-        db.add(new_booked_seat)
-    await db.commit()
+# book specific seats for a show
+@router.post("/bookings", response_model=BookingSchema)
+async def book_seats(booking: BookingCreate, background_tasks: BackgroundTasks, db: AsyncSession = Depends(get_db), current_user: User = Depends(admit("bookings"))):
+    async with show_admission(booking.show_id):
+        if settings.BOOKING_PIPELINE_ENABLED:
+            new_booking = await booking_pipeline.submit(current_user.id, booking.show_id, booking.seat_ids)
+        else:
+            new_booking = await create_booking(db, current_user.id, booking.show_id, booking.seat_ids)
+    background_tasks.add_task(notify_booking, new_booking.id, "confirmed")
     return new_booking
 
+# hold seats for a few minutes before booking; held seats show as unavailable to everyone else
+@router.post("/holds", response_model=SeatHoldSchema)
+async def hold_seats(hold: SeatHoldCreate, db: AsyncSession = Depends(get_db), current_user: User = Depends(admit("bookings"))):
+    async with show_admission(hold.show_id):
+        return await create_hold(db, current_user.id, hold.show_id, hold.seat_ids, hold.minutes)
+
+# hold the best available block in one step
+@router.post("/holds/best", response_model=SeatHoldSchema)
+async def hold_best_seats(hold: BestSeatHoldCreate, db: AsyncSession = Depends(get_db), current_user: User = Depends(admit("bookings"))):
+    async with show_admission(hold.show_id):
+        return await hold_best_available(db, current_user.id, hold.show_id, hold.count, hold.minutes)
+
+@router.get("/holds/{hold_id}", response_model=SeatHoldSchema)
+async def get_seat_hold(hold_id: int, db: AsyncSession = Depends(get_db), current_user: User = Depends(require_active_user)):
+    return await get_hold(db, hold_id, current_user.id)
+
+# turn a hold into a booking
+@router.post("/holds/{hold_id}/confirm", response_model=BookingSchema)
+async def confirm_seat_hold(hold_id: int, background_tasks: BackgroundTasks, db: AsyncSession = Depends(get_db), current_user: User = Depends(admit("bookings"))):
+    booking = await confirm_hold(db, hold_id, current_user.id)
+    background_tasks.add_task(notify_booking, booking.id, "confirmed")
+    return booking
+
+@router.delete("/holds/{hold_id}", response_model=SeatHoldSchema)
+async def release_seat_hold(hold_id: int, db: AsyncSession = Depends(get_db), current_user: User = Depends(require_active_user)):
+    return await release_hold(db, hold_id, current_user.id)
+
 # view user’s booking history
-@router.get("/bookings", response_model=list[BookingSchema])
-async def get_booking_history(db: AsyncSession = Depends(get_db), current_user: User = Depends(require_active_user)):
-    bookings = await db.execute(select(Booking).filter(Booking.user_id == current_user.id))
-    bookings = bookings.scalars().all()
-    return bookings
+@router.get("/bookings", response_model=list[BookingDetail])
+async def get_booking_history(page: PageParams = Depends(), db: AsyncSession = Depends(get_db), current_user: User = Depends(require_active_user)):
+    query = select(Booking).filter(Booking.user_id == current_user.id)
+    if page.stream:
+        return stream_ndjson(query.options(*booking_loaders), Booking, BookingDetail, page)
+    bookings, next_cursor = await load_page(db, query, Booking, BookingSchema, page)
+    return page_response(await attach_show_and_seats(db, bookings), next_cursor)
+
+# view a single booking with its show and seats
+@router.get("/bookings/{booking_id}", response_model=BookingDetail)
+async def get_booking(booking_id: int, db: AsyncSession = Depends(get_db), current_user: User = Depends(require_active_user)):
+    booking = await db.execute(select(Booking).options(*booking_loaders).filter(Booking.id == booking_id, Booking.user_id == current_user.id))
+    booking = booking.scalar_one_or_none()
+    if not booking:
+        raise HTTPException(status_code=404, detail="Booking not found")
+    return booking
 
 # cancel a booking
 @router.delete("/bookings/{booking_id}", response_model=BookingSchema)
-async def cancel_booking(booking_id: int, db: AsyncSession = Depends(get_db), current_user: User = Depends(require_active_user)):
+async def cancel_booking(booking_id: int, background_tasks: BackgroundTasks, db: AsyncSession = Depends(get_db), current_user: User = Depends(require_active_user)):
     existing_booking = await db.execute(select(Booking).filter(Booking.id == booking_id))
     existing_booking = existing_booking.scalar_one_or_none()
     if not existing_booking:
         raise HTTPException(status_code=404, detail="Booking not found")
-    existing_booking.cancelled = True  # type: ignore[assignment]
-    await db.commit()
-    await db.refresh(existing_booking)
-    return existing_booking
\ No newline at end of file
+    cancelled, changed = await cancel_user_booking(db, existing_booking)
+    if changed:
+        background_tasks.add_task(notify_booking, cancelled.id, "cancelled")
+    return cancelled
@@ -0,0 +1,139 @@
+# show scheduling: expands recurrences and checks time overlaps per screen before a batch insert
+import asyncio
+from bisect import bisect_left
+from datetime import datetime, timedelta, timezone
+from fastapi import HTTPException
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.analytics import new_show_stats
+from app.database import begin_write
+from app.models import Movie, Screen, Seat, Show
+from app.schemas import ShowBatchCreate, ShowCreate
+
+# conflict check and insert must not interleave between two scheduling requests
+schedule_lock = asyncio.Lock()
+
+
+def naive_utc(value: datetime) -> datetime:
+    # show times are stored naive, aware input is normalised to utc
+    return value.astimezone(timezone.utc).replace(tzinfo=None) if value.tzinfo else value
+
+
+class IntervalIndex:
+    # existing shows of one screen sorted by start, with a running max of end times,
+    # so "does anything overlap [start, end)" is one binary search
+    def __init__(self, intervals: list[tuple[datetime, datetime, int]]):
+        intervals = sorted(intervals)
+        self.starts = [start for start, _, _ in intervals]
+        self.max_end = []
+        self.max_end_id = []
+        best_end, best_id = None, None
+        for _, end, show_id in intervals:
+            if best_end is None or end > best_end:
+                best_end, best_id = end, show_id
+            self.max_end.append(best_end)
+            self.max_end_id.append(best_id)
+
+    def overlapping(self, start: datetime, end: datetime) -> int | None:
+        idx = bisect_left(self.starts, end)
+        if idx and self.max_end[idx - 1] > start:
+            return self.max_end_id[idx - 1]
+        return None
+
+
+def expand_batch(batch: ShowBatchCreate, durations: dict[int, int]) -> list[ShowCreate]:
+    shows = list(batch.shows)
+    rule = batch.recurrence
+    if rule is None:
+        return shows
+    if rule.end_date < rule.start_date:
+        raise HTTPException(status_code=400, detail="Recurrence end_date is before start_date")
+    duration = timedelta(minutes=rule.duration_minutes or durations.get(rule.movie_id) or 0)
+    if not duration:
+        raise HTTPException(status_code=400, detail="Recurrence needs duration_minutes or a movie with min_duration")
+    day = rule.start_date
+    while day <= rule.end_date:
+        if not rule.weekdays or day.weekday() in rule.weekdays:
+            for at in rule.times:
+                start = datetime.combine(day, at)
+                for screen_id in rule.screen_ids:
+                    shows.append(ShowCreate(movie_id=rule.movie_id, screen_id=screen_id, start_time=start, end_time=start + duration, price=rule.price))
+        day += timedelta(days=1)
+    return shows
+
+
+async def find_conflicts(db: AsyncSession, shows: list[ShowCreate]) -> list[dict]:
+    by_screen: dict[int, list[int]] = {}
+    for i, show in enumerate(shows):
+        by_screen.setdefault(show.screen_id, []).append(i)
+
+    # one range query for every screen in the batch, bounded by the batch's time window
+    window_start = min(show.start_time for show in shows)
+    window_end = max(show.end_time for show in shows)
+    existing = await db.execute(
+        select(Show.screen_id, Show.start_time, Show.end_time, Show.id).filter(
+            Show.screen_id.in_(by_screen), Show.start_time < window_end, Show.end_time > window_start
+        )
+    )
+    existing_by_screen: dict[int, list] = {}
+    for screen_id, start, end, show_id in existing.all():
+        existing_by_screen.setdefault(screen_id, []).append((start, end, show_id))
+
+    conflicts = []
+    for screen_id, indexes in by_screen.items():
+        index = IntervalIndex(existing_by_screen.get(screen_id, []))
+        previous = None
+        for i in sorted(indexes, key=lambda i: shows[i].start_time):
+            show = shows[i]
+            show_id = index.overlapping(show.start_time, show.end_time)
+            if show_id is not None:
+                conflicts.append({"index": i, "screen_id": screen_id, "conflicts_with_show": show_id})
+            if previous is not None and shows[previous].end_time > show.start_time:
+                conflicts.append({"index": i, "screen_id": screen_id, "conflicts_with_index": previous})
+            if previous is None or show.end_time > shows[previous].end_time:
+                previous = i
+    return conflicts
+
+
+async def schedule_shows(db: AsyncSession, batch: ShowBatchCreate) -> list[Show]:
+    movie_ids = {show.movie_id for show in batch.shows}
+    screen_ids = {show.screen_id for show in batch.shows}
+    if batch.recurrence:
+        movie_ids.add(batch.recurrence.movie_id)
+        screen_ids.update(batch.recurrence.screen_ids)
+
+    durations = await db.execute(select(Movie.id, Movie.min_duration).filter(Movie.id.in_(movie_ids)))
+    durations = dict(durations.all())
+    missing = movie_ids - durations.keys()
+    if missing:
+        raise HTTPException(status_code=404, detail={"message": "Movie not found", "movie_ids": sorted(missing)})
+    # theatre and seat count per screen, for the rollup rows created alongside the shows
+    screens = await db.execute(
+        select(Screen.id, Screen.theatre_id, func.count(Seat.id)).outerjoin(Seat, Seat.screen_id == Screen.id).filter(Screen.id.in_(screen_ids)).group_by(Screen.id, Screen.theatre_id)
+    )
+    screens = {screen_id: (theatre_id, capacity) for screen_id, theatre_id, capacity in screens.all()}
+    missing = screen_ids - screens.keys()
+    if missing:
+        raise HTTPException(status_code=404, detail={"message": "Screen not found", "screen_ids": sorted(missing)})
+
+    shows = [
+        show.model_copy(update={"start_time": naive_utc(show.start_time), "end_time": naive_utc(show.end_time)})
+        for show in expand_batch(batch, durations)
+    ]
+    if not shows:
+        raise HTTPException(status_code=400, detail="No shows to schedule")
+    invalid = [i for i, show in enumerate(shows) if show.end_time <= show.start_time]
+    if invalid:
+        raise HTTPException(status_code=400, detail={"message": "end_time must be after start_time", "indexes": invalid})
+
+    async with schedule_lock:
+        conflicts = await find_conflicts(db, shows)
+        if conflicts:
+            raise HTTPException(status_code=409, detail={"message": "Show times overlap on the same screen", "conflicts": conflicts})
+        await begin_write(db)
+        new_shows = [Show(**show.model_dump()) for show in shows]
+        db.add_all(new_shows)
+        await db.flush()
+        db.add_all([new_show_stats(show, *screens[show.screen_id]) for show in new_shows])
+        await db.commit()
+    return new_shows
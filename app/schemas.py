@@ -1,6 +1,6 @@
 from pydantic import BaseModel, EmailStr, Field
 from typing import List, Optional
-from datetime import datetime
+from datetime import date, datetime, time
 
 class UserCreate(BaseModel):
     email: EmailStr
@@ -80,6 +80,31 @@ class Seat(BaseModel):
     row: str
     col: int
 
+    class Config:
+        from_attributes = True
+
+class SeatSpec(BaseModel):
+    label: str
+    row: str
+    col: int
+
+class SeatGrid(BaseModel):
+    rows: str = Field(..., description="Row letters, e.g. 'A-J' or 'A-C,E'")
+    col_start: int = Field(1, ge=1)
+    col_end: int = Field(..., ge=1)
+    skip_cols: list[int] = Field(default_factory=list, description="Aisle gaps, no seat in these columns")
+    disabled: list[str] = Field(default_factory=list, description="Labels of seats to leave out")
+
+class ScreenGridCreate(SeatGrid):
+    screen_id: int
+
+class SeatLayoutCreate(BaseModel):
+    grid: Optional[SeatGrid] = None
+    seats: list[SeatSpec] = Field(default_factory=list)
+    replace: bool = False
+
+class SeatAvailability(Seat):
+    booked: bool
 
 # Movies / Shows / Bookings / Booked Seats
 class MovieCreate(BaseModel):
@@ -111,6 +136,20 @@ class ShowUpdate(BaseModel):
     end_time: Optional[datetime] = None
     price: Optional[float] = None
 
+class ShowRecurrence(BaseModel):
+    movie_id: int
+    screen_ids: list[int]
+    start_date: date
+    end_date: date
+    times: list[time]
+    weekdays: list[int] = Field(default_factory=list, description="0 = Monday; empty means every day")
+    duration_minutes: Optional[int] = Field(None, ge=1, description="Defaults to the movie's min_duration")
+    price: float
+
+class ShowBatchCreate(BaseModel):
+    shows: list[ShowCreate] = Field(default_factory=list)
+    recurrence: Optional[ShowRecurrence] = None
+
 class Show(BaseModel):
     id: int
     movie_id: int
@@ -123,6 +162,12 @@ class Show(BaseModel):
     class Config:
         from_attributes = True
 
+class ShowDetail(Show):
+    movie: Movie
+    screen: Screen
+    theatre: Theatre
+    seats: list[SeatAvailability]
+
 class BookingCreate(BaseModel):
     show_id: int
     seat_ids: list[int]
@@ -143,6 +188,35 @@ class Booking(BaseModel):
     class Config:
         from_attributes = True
 
+class ArchivedBooking(Booking):
+    seat_ids: list[int]
+    archived_at: datetime
+
+class BookingDetail(Booking):
+    show: Show
+    seats: list[Seat]
+
+class SeatHoldCreate(BaseModel):
+    show_id: int
+    seat_ids: list[int]
+    minutes: Optional[int] = Field(None, ge=1, description="Defaults to SEAT_HOLD_MINUTES")
+
+class BestSeatHoldCreate(BaseModel):
+    show_id: int
+    count: int = Field(ge=1)
+    minutes: Optional[int] = Field(None, ge=1, description="Defaults to SEAT_HOLD_MINUTES")
+
+class BestSeats(BaseModel):
+    show_id: int
+    row: str
+    seats: list[Seat]
+
+class SeatHold(BaseModel):
+    id: int
+    show_id: int
+    seat_ids: list[int]
+    expires_at: datetime
+
 class BookedSeat(BaseModel):
     id: int
     booking_id: int
@@ -153,3 +227,37 @@ class BookedSeat(BaseModel):
     class Config:
         from_attributes = True
 
+
+
+# admin analytics
+class AnalyticsSummary(BaseModel):
+    shows: int
+    capacity: int
+    seats_sold: int
+    bookings: int
+    cancellations: int
+    revenue: float
+    occupancy: float
+
+class DailyAnalytics(AnalyticsSummary):
+    day: date
+
+class RollupRebuild(BaseModel):
+    shows: int
+
+class ArchiveRun(BaseModel):
+    bookings: int
+
+# bulk catalog import
+class CatalogImportError(BaseModel):
+    line: int
+    type: Optional[str] = None
+    message: str
+
+class CatalogImportResult(BaseModel):
+    rows: int
+    inserted: dict[str, int]
+    errors: int
+    error_rows: list[CatalogImportError]
+    seconds: float
+    rows_per_second: float
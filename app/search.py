@@ -0,0 +1,110 @@
+# show filters and movie text search (sqlite fts5 when available, LIKE elsewhere)
+import logging
+from datetime import date, datetime, time, timedelta
+from fastapi import Query
+from sqlalchemy import Integer, Select, column, or_, select, text
+from app.models import Movie, Screen, Show, Theatre
+
+logger = logging.getLogger("app.search")
+
+
+class SearchIndex:
+    def __init__(self):
+        self.fts = False
+
+    def ensure(self, sync_conn):
+        # run at startup: add indexes that create_all skips on existing tables, and the fts table
+        for table in (Show.__table__, Theatre.__table__):
+            for index in table.indexes:
+                index.create(sync_conn, checkfirst=True)
+        if sync_conn.dialect.name != "sqlite":
+            return
+        exists = sync_conn.execute(text("SELECT name FROM sqlite_master WHERE type='table' AND name='movies_fts'")).first()
+        try:
+            if not exists:
+                sync_conn.execute(text("CREATE VIRTUAL TABLE movies_fts USING fts5(title, description, content='movies', content_rowid='id')"))
+                sync_conn.execute(text(
+                    "CREATE TRIGGER movies_fts_insert AFTER INSERT ON movies BEGIN "
+                    "INSERT INTO movies_fts(rowid, title, description) VALUES (new.id, new.title, new.description); END"
+                ))
+                sync_conn.execute(text(
+                    "CREATE TRIGGER movies_fts_delete AFTER DELETE ON movies BEGIN "
+                    "INSERT INTO movies_fts(movies_fts, rowid, title, description) VALUES ('delete', old.id, old.title, old.description); END"
+                ))
+                sync_conn.execute(text(
+                    "CREATE TRIGGER movies_fts_update AFTER UPDATE ON movies BEGIN "
+                    "INSERT INTO movies_fts(movies_fts, rowid, title, description) VALUES ('delete', old.id, old.title, old.description); "
+                    "INSERT INTO movies_fts(rowid, title, description) VALUES (new.id, new.title, new.description); END"
+                ))
+                sync_conn.execute(text("INSERT INTO movies_fts(movies_fts) VALUES ('rebuild')"))
+            self.fts = True
+        except Exception as exc:
+            # sqlite built without fts5
+            logger.warning("movie full-text search disabled: %s", exc)
+
+
+search_index = SearchIndex()
+
+
+def _fts_query(q: str) -> str:
+    # every word as a quoted prefix term, so user input can't break the MATCH syntax
+    return " ".join('"' + word.replace('"', '""') + '"*' for word in q.split())
+
+
+def search_movies(query: Select, q: str | None) -> Select:
+    if not q or not q.strip():
+        return query
+    if search_index.fts:
+        matches = text("SELECT rowid FROM movies_fts WHERE movies_fts MATCH :q").bindparams(q=_fts_query(q)).columns(column("rowid", Integer))
+        return query.filter(Movie.id.in_(matches))
+    pattern = f"%{q.strip()}%"
+    return query.filter(or_(Movie.title.ilike(pattern), Movie.description.ilike(pattern)))
+
+
+class ShowFilters:
+    def __init__(
+        self,
+        movie_id: int | None = None,
+        theatre_id: int | None = None,
+        location: str | None = None,
+        day: date | None = Query(None, description="Shows starting on this day"),
+        start_from: datetime | None = None,
+        start_to: datetime | None = None,
+        active: bool | None = Query(True, description="Defaults to active shows only"),
+        min_price: float | None = None,
+        max_price: float | None = None,
+    ):
+        self.movie_id = movie_id
+        self.theatre_id = theatre_id
+        self.location = location
+        self.start_from = start_from
+        self.start_to = start_to
+        if day is not None:
+            self.start_from = max(filter(None, (start_from, datetime.combine(day, time.min))))
+            self.start_to = min(filter(None, (start_to, datetime.combine(day + timedelta(days=1), time.min))))
+        self.active = active
+        self.min_price = min_price
+        self.max_price = max_price
+
+    def apply(self, query: Select) -> Select:
+        # movie_id/screen_id + start_time filters are served by the composite indexes on shows
+        if self.movie_id is not None:
+            query = query.filter(Show.movie_id == self.movie_id)
+        if self.theatre_id is not None or self.location:
+            screens = select(Screen.id)
+            if self.theatre_id is not None:
+                screens = screens.filter(Screen.theatre_id == self.theatre_id)
+            if self.location:
+                screens = screens.join(Theatre, Screen.theatre_id == Theatre.id).filter(Theatre.location == self.location)
+            query = query.filter(Show.screen_id.in_(screens))
+        if self.start_from is not None:
+            query = query.filter(Show.start_time >= self.start_from)
+        if self.start_to is not None:
+            query = query.filter(Show.start_time < self.start_to)
+        if self.active is not None:
+            query = query.filter(Show.active.is_(self.active))
+        if self.min_price is not None:
+            query = query.filter(Show.price >= self.min_price)
+        if self.max_price is not None:
+            query = query.filter(Show.price <= self.max_price)
+        return query
@@ -0,0 +1,112 @@
+# live seat-state push per show: seat map changes fan out to server-sent-event subscribers
+import asyncio
+import json
+from app.config import settings
+from app.database import AsyncSessionLocal
+from app.seatmap import FREE, seat_maps
+
+
+class Subscriber:
+    __slots__ = ("pending", "resync", "event")
+
+    def __init__(self):
+        # seat_id -> latest state, so several changes to a seat collapse into one
+        self.pending: dict[int, int] = {}
+        self.resync = False
+        self.event = asyncio.Event()
+
+    def push(self, seat_ids, value: int | None) -> bool:
+        # returns True when this change switched the subscriber over to a resync
+        was_resync = self.resync
+        if seat_ids is None:
+            # the whole map was dropped, only a snapshot is meaningful now
+            self.pending.clear()
+            self.resync = True
+        elif not self.resync:
+            for seat_id in seat_ids:
+                self.pending[seat_id] = value
+            if len(self.pending) > settings.SEAT_FEED_MAX_PENDING:
+                # slow consumer: drop the backlog and send a fresh snapshot when it catches up
+                self.pending.clear()
+                self.resync = True
+        self.event.set()
+        return self.resync and not was_resync
+
+
+class SeatFeedHub:
+    def __init__(self):
+        self._subscribers: dict[int, set[Subscriber]] = {}
+        self.published = 0
+        self.resyncs = 0
+
+    def subscribe(self, show_id: int) -> Subscriber:
+        subscriber = Subscriber()
+        self._subscribers.setdefault(show_id, set()).add(subscriber)
+        return subscriber
+
+    def unsubscribe(self, show_id: int, subscriber: Subscriber):
+        subscribers = self._subscribers.get(show_id)
+        if subscribers is not None:
+            subscribers.discard(subscriber)
+            if not subscribers:
+                del self._subscribers[show_id]
+
+    def publish(self, show_id: int, seat_ids, value: int | None):
+        subscribers = self._subscribers.get(show_id)
+        if not subscribers:
+            return
+        if seat_ids is not None:
+            seat_ids = list(seat_ids)
+        self.published += 1
+        for subscriber in subscribers:
+            if subscriber.push(seat_ids, value):
+                self.resyncs += 1
+
+    def stats(self) -> dict:
+        return {
+            "shows": len(self._subscribers),
+            "subscribers": sum(len(s) for s in self._subscribers.values()),
+            "published": self.published,
+            "resyncs": self.resyncs,
+        }
+
+
+seat_feed = SeatFeedHub()
+seat_maps.listeners.append(seat_feed.publish)
+
+
+def _event(name: str, data: dict) -> str:
+    return f"event: {name}\ndata: {json.dumps(data, separators=(',', ':'))}\n\n"
+
+
+async def _snapshot(show_id: int) -> str:
+    async with AsyncSessionLocal() as db:
+        seat_map = await seat_maps.get(db, show_id)
+    unavailable = [seat_map.seat_ids[pos] for pos, state in enumerate(seat_map.state) if state != FREE] if seat_map else []
+    return _event("snapshot", {"unavailable": unavailable})
+
+
+async def seat_events(show_id: int):
+    # subscribe before taking the snapshot so nothing between the two is lost
+    subscriber = seat_feed.subscribe(show_id)
+    try:
+        yield await _snapshot(show_id)
+        while True:
+            try:
+                await asyncio.wait_for(subscriber.event.wait(), settings.SEAT_FEED_HEARTBEAT_SECONDS)
+            except asyncio.TimeoutError:
+                yield ": keep-alive\n\n"
+                continue
+            subscriber.event.clear()
+            if subscriber.resync:
+                subscriber.resync = False
+                yield await _snapshot(show_id)
+                continue
+            pending, subscriber.pending = subscriber.pending, {}
+            if pending:
+                yield _event("delta", {
+                    "unavailable": [seat_id for seat_id, state in pending.items() if state != FREE],
+                    "available": [seat_id for seat_id, state in pending.items() if state == FREE],
+                })
+    finally:
+        seat_feed.unsubscribe(show_id, subscriber)
@@ -0,0 +1,201 @@
+# in-memory seat state per show, built lazily from the db and updated in place on booking/cancel
+import asyncio
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.database import DATABASE_URL, AsyncSessionLocal, in_memory
+from app.models import BookedSeat, HeldSeat, Seat, Show
+
+FREE = 0
+BOOKED = 1
+HELD = 2
+
+
+class SeatMap:
+    __slots__ = ("show_id", "screen_id", "seat_ids", "labels", "rows", "cols", "index", "state", "row_bounds", "row_of", "free_runs", "centre_col")
+
+    def __init__(self, show_id: int, screen_id: int, seats: list[tuple]):
+        # seats are (id, label, row, col) ordered by position in the screen
+        self.show_id = show_id
+        self.screen_id = screen_id
+        self.seat_ids = [s[0] for s in seats]
+        self.labels = [s[1] for s in seats]
+        self.rows = [s[2] for s in seats]
+        self.cols = [s[3] for s in seats]
+        self.index = {seat_id: pos for pos, seat_id in enumerate(self.seat_ids)}
+        # one byte per seat position
+        self.state = bytearray(len(seats))
+        # positions are grouped by row: row r spans row_bounds[r][0]..row_bounds[r][1]
+        self.row_bounds: list[list[int]] = []
+        self.row_of: list[int] = []
+        for pos, row in enumerate(self.rows):
+            if pos == 0 or self.rows[pos - 1] != row:
+                self.row_bounds.append([pos, pos])
+            self.row_bounds[-1][1] = pos + 1
+            self.row_of.append(len(self.row_bounds) - 1)
+        self.centre_col = (min(self.cols) + max(self.cols)) / 2 if seats else 0.0
+        # per row, (start position, length) of each run of free seats with consecutive cols
+        self.free_runs: list[list[tuple[int, int]]] = [self._runs(r) for r in range(len(self.row_bounds))]
+
+    def _runs(self, r: int) -> list[tuple[int, int]]:
+        runs, start = [], None
+        begin, end = self.row_bounds[r]
+        for pos in range(begin, end):
+            if self.state[pos] != FREE:
+                if start is not None:
+                    runs.append((start, pos - start))
+                start = None
+                continue
+            # a gap in the cols (an aisle) breaks the run too
+            if start is not None and self.cols[pos] != self.cols[pos - 1] + 1:
+                runs.append((start, pos - start))
+                start = None
+            if start is None:
+                start = pos
+        if start is not None:
+            runs.append((start, end - start))
+        return runs
+
+    def set_state(self, seat_ids, value: int):
+        touched = set()
+        for seat_id in seat_ids:
+            pos = self.index.get(seat_id)
+            if pos is not None:
+                self.state[pos] = value
+                touched.add(self.row_of[pos])
+        for r in touched:
+            self.free_runs[r] = self._runs(r)
+
+    def best_available(self, count: int) -> list[int] | None:
+        # the free block of count adjacent seats closest to the middle of the screen; one pass over the
+        # rows' free runs, never the seats themselves
+        centre_row = (len(self.row_bounds) - 1) / 2
+        best, best_score = None, None
+        for r, runs in enumerate(self.free_runs):
+            row_score = (r - centre_row) ** 2
+            if best_score is not None and row_score >= best_score:
+                continue
+            for start, length in runs:
+                if length < count:
+                    continue
+                # slide the block as close to the centre col as the run allows
+                offset = round(self.centre_col - (count - 1) / 2 - self.cols[start])
+                pos = start + min(max(offset, 0), length - count)
+                middle = (self.cols[pos] + self.cols[pos + count - 1]) / 2
+                score = row_score + (middle - self.centre_col) ** 2
+                if best_score is None or score < best_score:
+                    best, best_score = pos, score
+        if best is None:
+            return None
+        return self.seat_ids[best:best + count]
+
+    def has_seat(self, seat_id: int) -> bool:
+        return seat_id in self.index
+
+    def is_free(self, seat_id: int) -> bool:
+        pos = self.index.get(seat_id)
+        return pos is not None and self.state[pos] == FREE
+
+    def available_count(self) -> int:
+        return self.state.count(FREE)
+
+    def seat(self, seat_id: int) -> dict:
+        pos = self.index[seat_id]
+        return {"id": seat_id, "label": self.labels[pos], "row": self.rows[pos], "col": self.cols[pos]}
+
+    def seats(self) -> list[dict]:
+        return [
+            {"id": self.seat_ids[pos], "label": self.labels[pos], "row": self.rows[pos], "col": self.cols[pos], "booked": self.state[pos] != FREE}
+            for pos in range(len(self.seat_ids))
+        ]
+
+
+class SeatMapEngine:
+    def __init__(self):
+        self._maps: dict[int, SeatMap] = {}
+        self._locks: dict[int, asyncio.Lock] = {}
+        # bumped on every change so a build racing with a booking is not cached stale
+        self._generation: dict[int, int] = {}
+        # called as listener(show_id, seat_ids, state) after every in-place change,
+        # and with seat_ids=None when a show's map is dropped
+        self.listeners: list = []
+
+    def _lock(self, show_id: int) -> asyncio.Lock:
+        lock = self._locks.get(show_id)
+        if lock is None:
+            lock = self._locks[show_id] = asyncio.Lock()
+        return lock
+
+    async def get(self, db: AsyncSession, show_id: int, screen_id: int | None = None) -> SeatMap | None:
+        seat_map = self._maps.get(show_id)
+        if seat_map is not None:
+            return seat_map
+        async with self._lock(show_id):
+            seat_map = self._maps.get(show_id)
+            if seat_map is not None:
+                return seat_map
+            generation = self._generation.get(show_id, 0)
+            if in_memory(DATABASE_URL):
+                # a single shared connection, the caller's session already has it and there is no
+                # other snapshot to be behind
+                seat_map = await self._build(db, show_id, screen_id)
+            else:
+                # in a transaction of its own: the caller's snapshot can predate a booking whose
+                # generation bump came before the one read above, and the map would be cached without it
+                async with AsyncSessionLocal() as fresh:
+                    seat_map = await self._build(fresh, show_id, screen_id)
+            if seat_map is not None and self._generation.get(show_id, 0) == generation:
+                self._maps[show_id] = seat_map
+            return seat_map
+
+    async def _build(self, db: AsyncSession, show_id: int, screen_id: int | None) -> SeatMap | None:
+        if screen_id is None:
+            screen_id = await db.execute(select(Show.screen_id).filter(Show.id == show_id))
+            screen_id = screen_id.scalar_one_or_none()
+            if screen_id is None:
+                return None
+        seats = await db.execute(
+            select(Seat.id, Seat.label, Seat.row, Seat.col).filter(Seat.screen_id == screen_id).order_by(Seat.row, Seat.col, Seat.id)
+        )
+        seat_map = SeatMap(show_id, screen_id, [tuple(s) for s in seats.all()])
+        booked = await db.execute(
+            select(BookedSeat.seat_id).filter(BookedSeat.show_id == show_id)
+        )
+        seat_map.set_state(booked.scalars().all(), BOOKED)
+        held = await db.execute(select(HeldSeat.seat_id).filter(HeldSeat.show_id == show_id))
+        seat_map.set_state(held.scalars().all(), HELD)
+        return seat_map
+
+    def _update(self, show_id: int, seat_ids, value: int):
+        self._generation[show_id] = self._generation.get(show_id, 0) + 1
+        seat_map = self._maps.get(show_id)
+        if seat_map is not None:
+            seat_map.set_state(seat_ids, value)
+        for listener in self.listeners:
+            listener(show_id, seat_ids, value)
+
+    def mark_booked(self, show_id: int, seat_ids):
+        self._update(show_id, seat_ids, BOOKED)
+
+    def mark_held(self, show_id: int, seat_ids):
+        self._update(show_id, seat_ids, HELD)
+
+    def mark_free(self, show_id: int, seat_ids):
+        self._update(show_id, seat_ids, FREE)
+
+    def invalidate_show(self, show_id: int):
+        self._generation[show_id] = self._generation.get(show_id, 0) + 1
+        self._maps.pop(show_id, None)
+        for listener in self.listeners:
+            listener(show_id, None, None)
+
+    def invalidate_screen(self, screen_id: int):
+        # seat layout changed, every show on the screen has to be rebuilt
+        for show_id in [s for s, m in self._maps.items() if m.screen_id == screen_id]:
+            self.invalidate_show(show_id)
+
+    def clear(self):
+        self._maps.clear()
+        self._generation.clear()
+
+
+seat_maps = SeatMapEngine()
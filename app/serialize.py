@@ -0,0 +1,51 @@
+# fast path for list responses: schema columns fetched as plain rows and encoded with orjson,
+# skipping orm hydration and pydantic validation; the bytes match what the schemas would produce
+import json
+from datetime import date, datetime
+from fastapi import Response
+from pydantic import BaseModel
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def _default(value):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    raise TypeError(f"{type(value).__name__} is not JSON serializable")
+
+
+def dumps(content) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(content)
+    # same compact, utf-8 output as pydantic's dump_json
+    return json.dumps(content, default=_default, separators=(",", ":"), ensure_ascii=False).encode()
+
+
+def loads(data):
+    return orjson.loads(data) if orjson is not None else json.loads(data)
+
+
+class FastJSONResponse(Response):
+    media_type = "application/json"
+
+    def render(self, content) -> bytes:
+        return dumps(content)
+
+
+def schema_columns(model, schema: type[BaseModel], prefix: str = "") -> list:
+    # the model's columns in the schema's field order, so the json keys come out in the same order
+    table = model.__table__
+    return [table.c[name].label(prefix + name) for name in schema.model_fields]
+
+
+def is_flat(model, schema: type[BaseModel]) -> bool:
+    # every field is a column of the model, nothing nested
+    return all(name in model.__table__.c for name in schema.model_fields)
+
+
+def as_dicts(result) -> list[dict]:
+    keys = list(result.keys())
+    return [dict(zip(keys, row)) for row in result]
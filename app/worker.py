@@ -0,0 +1,85 @@
+# background tasks that live as long as the app: started lazily on the running loop, stopped at shutdown
+import asyncio
+import logging
+
+logger = logging.getLogger("app.worker")
+
+
+class BackgroundWorker:
+    def __init__(self):
+        self._task: asyncio.Task | None = None
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    def start(self):
+        if not self.running:
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self):
+        if self.running:
+            await self._shutdown()
+        self._task = None
+
+    async def _shutdown(self):
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+
+    async def _run(self):
+        raise NotImplementedError
+
+
+class BatchingWorker(BackgroundWorker):
+    # items queue up and one task takes them off in batches of up to batch_size, waiting at most
+    # linger seconds for a batch to fill
+    def __init__(self, batch_size: int, linger: float, max_queue: int):
+        super().__init__()
+        self.batch_size = batch_size
+        self.linger = linger
+        self.queue: asyncio.Queue = asyncio.Queue(max_queue)
+
+    async def _shutdown(self):
+        # the task drains whatever is already queued before it exits
+        await self.queue.put(None)
+        await self._task
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            first = await self.queue.get()
+            if first is None:
+                return
+            batch, closing = [first], False
+            deadline = loop.time() + self.linger
+            while len(batch) < self.batch_size:
+                if not self.queue.empty():
+                    item = self.queue.get_nowait()
+                else:
+                    timeout = deadline - loop.time()
+                    if timeout <= 0:
+                        break
+                    try:
+                        item = await asyncio.wait_for(self.queue.get(), timeout)
+                    except asyncio.TimeoutError:
+                        break
+                if item is None:
+                    closing = True
+                    break
+                batch.append(item)
+            try:
+                await self._process(batch)
+            except Exception as exc:
+                # keep the task alive for the next batch
+                self._failed(batch, exc)
+            if closing:
+                return
+
+    async def _process(self, batch: list):
+        raise NotImplementedError
+
+    def _failed(self, batch: list, exc: Exception):
+        logger.exception("%s batch of %d failed", type(self).__name__, len(batch))
@@ -0,0 +1,243 @@
+# load test for the booking flow, driven in-process through httpx's ASGI transport
+#
+#   python -m bench.loadtest                                  # seed a fresh db, run, print the report
+#   python -m bench.loadtest --save-baseline bench/baseline.json
+#   python -m bench.loadtest --baseline bench/baseline.json   # exit 1 on regressions
+import argparse
+import asyncio
+import json
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+from collections import defaultdict
+from datetime import datetime, timedelta
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the movie booking API")
+    parser.add_argument("--db", help="sqlite file to seed (default: a temp file)")
+    parser.add_argument("--theatres", type=int, default=5)
+    parser.add_argument("--screens", type=int, default=4, help="screens per theatre")
+    parser.add_argument("--rows", type=int, default=15)
+    parser.add_argument("--cols", type=int, default=20)
+    parser.add_argument("--days", type=int, default=14, help="days of shows to schedule")
+    parser.add_argument("--shows-per-day", type=int, default=4, help="shows per screen per day")
+    parser.add_argument("--movies", type=int, default=40)
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--bookings", type=int, default=20000)
+    parser.add_argument("--concurrency", type=int, default=50, help="virtual users running at once")
+    parser.add_argument("--iterations", type=int, default=20, help="browse/book rounds per virtual user")
+    parser.add_argument("--bcrypt-rounds", type=int, default=4, help="keeps login from dominating the run")
+    parser.add_argument("--admission", action="store_true", help="keep admission control on; 429/503 are counted as shed, not errors")
+    parser.add_argument("--pipeline", action="store_true", help="route bookings through the group-commit writer")
+    parser.add_argument("--batch-size", type=int, help="group-commit batch size (BOOKING_BATCH_SIZE)")
+    parser.add_argument("--linger-ms", type=float, help="group-commit linger (BOOKING_BATCH_LINGER_MS)")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--json", help="write the report to this file")
+    parser.add_argument("--baseline", help="compare against a stored report")
+    parser.add_argument("--save-baseline", help="store this run's report as the baseline")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed relative regression")
+    return parser.parse_args(argv)
+
+
+class Recorder:
+    def __init__(self, shed_statuses=()):
+        self.latencies = defaultdict(list)
+        self.errors = defaultdict(int)
+        self.shed = defaultdict(int)
+        self.shed_statuses = shed_statuses
+
+    async def call(self, client, name, method, url, expect=(200,), **kwargs):
+        start = time.perf_counter()
+        response = await client.request(method, url, **kwargs)
+        self.latencies[name].append(time.perf_counter() - start)
+        if response.status_code in self.shed_statuses:
+            self.shed[name] += 1
+        elif response.status_code not in expect:
+            self.errors[name] += 1
+        return response
+
+    def report(self, elapsed: float) -> dict:
+        endpoints = {}
+        for name, samples in sorted(self.latencies.items()):
+            samples = sorted(samples)
+            quantiles = statistics.quantiles(samples, n=100, method="inclusive") if len(samples) > 1 else samples * 99
+            endpoints[name] = {
+                "count": len(samples),
+                "errors": self.errors[name],
+                "shed": self.shed[name],
+                "rps": round(len(samples) / elapsed, 1),
+                "p50_ms": round(quantiles[49] * 1000, 2),
+                "p95_ms": round(quantiles[94] * 1000, 2),
+                "p99_ms": round(quantiles[98] * 1000, 2),
+            }
+        total = sum(len(s) for s in self.latencies.values())
+        return {"elapsed_s": round(elapsed, 2), "requests": total, "rps": round(total / elapsed, 1), "endpoints": endpoints}
+
+
+async def seed(args, rng: random.Random):
+    from sqlalchemy import insert
+    from app.auth import get_password_hash
+    from app.database import AsyncSessionLocal, Base, engine
+    from app.models import BookedSeat, Booking, Movie, Screen, Seat, Show, Theatre, User
+
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.drop_all)
+        await conn.run_sync(Base.metadata.create_all)
+
+    password = get_password_hash("benchpass")
+    async with AsyncSessionLocal() as db:
+        await db.execute(insert(User), [{"id": i, "email": f"user{i}@example.com", "password": password, "role": "user"} for i in range(1, args.users + 1)])
+        await db.execute(insert(Movie), [{"id": i, "title": f"Movie {i}", "description": "", "min_duration": 120} for i in range(1, args.movies + 1)])
+        await db.execute(insert(Theatre), [{"id": i, "name": f"Theatre {i}", "location": f"City {i % 3}"} for i in range(1, args.theatres + 1)])
+        screens = [{"id": i + 1, "name": f"Screen {i % args.screens + 1}", "theatre_id": i // args.screens + 1} for i in range(args.theatres * args.screens)]
+        await db.execute(insert(Screen), screens)
+
+        seats, seats_by_screen = [], defaultdict(list)
+        for screen in screens:
+            for r in range(args.rows):
+                for c in range(1, args.cols + 1):
+                    seat_id = len(seats) + 1
+                    row = chr(ord("A") + r)
+                    seats.append({"id": seat_id, "label": f"{row}{c}", "row": row, "col": c, "screen_id": screen["id"]})
+                    seats_by_screen[screen["id"]].append(seat_id)
+        await db.execute(insert(Seat), seats)
+
+        shows, day0 = [], datetime.now().replace(hour=10, minute=0, second=0, microsecond=0)
+        for screen in screens:
+            for day in range(args.days):
+                for slot in range(args.shows_per_day):
+                    start = day0 + timedelta(days=day, hours=3 * slot)
+                    shows.append({"id": len(shows) + 1, "movie_id": rng.randint(1, args.movies), "screen_id": screen["id"], "start_time": start, "end_time": start + timedelta(hours=2, minutes=30), "price": rng.choice([8.0, 10.0, 12.5]), "active": True})
+        await db.execute(insert(Show), shows)
+
+        bookings, booked, taken = [], [], defaultdict(set)
+        for booking_id in range(1, args.bookings + 1):
+            show = rng.choice(shows)
+            free = [s for s in rng.sample(seats_by_screen[show["screen_id"]], 8) if s not in taken[show["id"]]][: rng.randint(1, 4)]
+            if not free:
+                continue
+            taken[show["id"]].update(free)
+            bookings.append({"id": booking_id, "show_id": show["id"], "user_id": rng.randint(1, args.users), "total_price": show["price"] * len(free), "cancelled": False})
+            booked.extend({"booking_id": booking_id, "show_id": show["id"], "seat_id": s} for s in free)
+        await db.execute(insert(Booking), bookings)
+        await db.execute(insert(BookedSeat), booked)
+        await db.commit()
+    return {"shows": len(shows), "seats": len(seats), "bookings": len(bookings)}
+
+
+async def virtual_user(client, recorder: Recorder, args, rng: random.Random, user_id: int, show_count: int):
+    response = await recorder.call(client, "POST /auth/login", "POST", "/auth/login", data={"username": f"user{user_id}@example.com", "password": "benchpass"})
+    if response.status_code != 200:
+        return
+    headers = {"Authorization": f"Bearer {response.json()['access_token']}"}
+    if rng.random() < 0.1:
+        await recorder.call(client, "POST /auth/register", "POST", "/auth/register", json={"email": f"new{user_id}-{rng.random()}@example.com", "password": "benchpass"})
+
+    my_bookings = []
+    for _ in range(args.iterations):
+        await recorder.call(client, "GET /user/movies", "GET", "/user/movies", headers=headers)
+        await recorder.call(client, "GET /user/shows", "GET", "/user/shows?limit=50", headers=headers)
+        show_id = rng.randint(1, show_count)
+        await recorder.call(client, "GET /user/shows/{id}", "GET", f"/user/shows/{show_id}", headers=headers)
+        seats = await recorder.call(client, "GET /user/shows/{id}/seats", "GET", f"/user/shows/{show_id}/seats", headers=headers)
+        free = [seat["id"] for seat in seats.json() if not seat["booked"]] if seats.status_code == 200 else []
+        if free:
+            pick = rng.sample(free, min(len(free), rng.randint(1, 4)))
+            booked = await recorder.call(client, "POST /user/bookings", "POST", "/user/bookings", expect=(200, 409), json={"show_id": show_id, "seat_ids": pick}, headers=headers)
+            if booked.status_code == 200:
+                my_bookings.append(booked.json()["id"])
+        if rng.random() < 0.3:
+            await recorder.call(client, "GET /user/bookings", "GET", "/user/bookings?limit=20", headers=headers)
+        if my_bookings and rng.random() < 0.2:
+            booking_id = my_bookings.pop(rng.randrange(len(my_bookings)))
+            await recorder.call(client, "DELETE /user/bookings/{id}", "DELETE", f"/user/bookings/{booking_id}", headers=headers)
+
+
+def compare(report: dict, baseline: dict, tolerance: float) -> list[str]:
+    regressions = []
+    for name, base in baseline.get("endpoints", {}).items():
+        current = report["endpoints"].get(name)
+        # a handful of samples is too noisy to call a regression
+        if current is None or current["count"] < 20 or base["count"] < 20:
+            continue
+        if current["p95_ms"] > base["p95_ms"] * (1 + tolerance):
+            regressions.append(f"{name}: p95 {current['p95_ms']}ms vs baseline {base['p95_ms']}ms")
+        if current["rps"] < base["rps"] * (1 - tolerance):
+            regressions.append(f"{name}: {current['rps']} req/s vs baseline {base['rps']} req/s")
+    return regressions
+
+
+def print_report(report: dict, dataset: dict):
+    print(f"dataset: {dataset}")
+    print(f"{report['requests']} requests in {report['elapsed_s']}s, {report['rps']} req/s")
+    print(f"{'endpoint':34} {'count':>7} {'err':>5} {'shed':>5} {'req/s':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8}")
+    for name, row in report["endpoints"].items():
+        print(f"{name:34} {row['count']:>7} {row['errors']:>5} {row['shed']:>5} {row['rps']:>8} {row['p50_ms']:>8} {row['p95_ms']:>8} {row['p99_ms']:>8}")
+
+
+async def run(args) -> int:
+    import httpx
+    from app.main import app
+
+    rng = random.Random(args.seed)
+    dataset = await seed(args, rng)
+    recorder = Recorder(shed_statuses=(429, 503) if args.admission else ())
+    semaphore = asyncio.Semaphore(args.concurrency)
+
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench") as client:
+        async def one(user_id):
+            async with semaphore:
+                await virtual_user(client, recorder, args, random.Random(args.seed * 100003 + user_id), user_id, dataset["shows"])
+
+        start = time.perf_counter()
+        await asyncio.gather(*(one(user_id) for user_id in range(1, min(args.users, args.concurrency * 4) + 1)))
+        report = recorder.report(time.perf_counter() - start)
+
+    if args.pipeline:
+        from app.booking_pipeline import booking_pipeline
+        await booking_pipeline.stop()
+        report["booking_pipeline"] = booking_pipeline.stats()
+
+    print_report(report, dataset)
+    if "booking_pipeline" in report:
+        print(f"booking pipeline: {report['booking_pipeline']}")
+    report["dataset"] = dataset
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
+    if args.save_baseline:
+        with open(args.save_baseline, "w") as f:
+            json.dump(report, f, indent=2)
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(report, json.load(f), args.tolerance)
+        for line in regressions:
+            print(f"REGRESSION {line}")
+        return 1 if regressions else 0
+    return 0
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    # settings are read at import time, so the environment has to be in place first
+    db_path = args.db or os.path.join(tempfile.mkdtemp(prefix="bench-"), "bench.db")
+    os.environ["DATABASE_URL"] = f"sqlite+aiosqlite:///{db_path}"
+    os.environ["BCRYPT_ROUNDS"] = str(args.bcrypt_rounds)
+    os.environ.setdefault("DB_POOL_SIZE", str(max(5, args.concurrency // 2)))
+    # every virtual user books far faster than the per-user limits allow
+    os.environ["ADMISSION_ENABLED"] = "true" if args.admission else "false"
+    if args.pipeline:
+        os.environ["BOOKING_PIPELINE_ENABLED"] = "true"
+    if args.batch_size:
+        os.environ["BOOKING_BATCH_SIZE"] = str(args.batch_size)
+    if args.linger_ms is not None:
+        os.environ["BOOKING_BATCH_LINGER_MS"] = str(args.linger_ms)
+    sys.exit(asyncio.run(run(args)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+# cpu cost of one large list response: orm objects through pydantic vs schema columns through orjson
+#
+#   python -m bench.serialization                # 10k shows, 20 rounds each
+#   python -m bench.serialization --rows 50000 --rounds 5
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Compare list response serialization paths")
+    parser.add_argument("--db", help="sqlite file to seed (default: a temp file)")
+    parser.add_argument("--rows", type=int, default=10000)
+    parser.add_argument("--rounds", type=int, default=20)
+    return parser.parse_args(argv)
+
+
+async def seed(rows: int):
+    from sqlalchemy import insert
+    from app.database import AsyncSessionLocal, Base, engine
+    from app.models import Movie, Screen, Show, Theatre
+
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.drop_all)
+        await conn.run_sync(Base.metadata.create_all)
+    async with AsyncSessionLocal() as db:
+        await db.execute(insert(Movie), [{"id": 1, "title": "Movie", "description": "", "min_duration": 120}])
+        await db.execute(insert(Theatre), [{"id": 1, "name": "Theatre", "location": "City"}])
+        await db.execute(insert(Screen), [{"id": 1, "name": "Screen", "theatre_id": 1}])
+        day0 = datetime(2030, 1, 1, 10)
+        await db.execute(insert(Show), [
+            {"id": i, "movie_id": 1, "screen_id": 1, "start_time": day0 + timedelta(hours=i), "end_time": day0 + timedelta(hours=i, minutes=150), "price": 12.5, "active": True}
+            for i in range(1, rows + 1)
+        ])
+        await db.commit()
+
+
+async def measure(rounds: int, render) -> tuple[float, bytes]:
+    from app.database import AsyncSessionLocal
+
+    body, start = b"", time.process_time()
+    for _ in range(rounds):
+        async with AsyncSessionLocal() as db:
+            body = await render(db)
+    return (time.process_time() - start) / rounds, body
+
+
+async def run(args) -> int:
+    from pydantic import TypeAdapter
+    from sqlalchemy import select
+    from app.models import Show
+    from app.pagination import PageParams, load_page
+    from app.schemas import Show as ShowSchema
+    from app.serialize import dumps
+
+    await seed(args.rows)
+    adapter = TypeAdapter(list[ShowSchema])
+    # the list endpoints' own loader, with the page widened to the whole table
+    page = PageParams(limit=args.rows, after=None, stream=False)
+
+    async def orm_pydantic(db):
+        rows = await db.execute(select(Show).order_by(Show.id))
+        return adapter.dump_json(adapter.validate_python(rows.scalars().all(), from_attributes=True))
+
+    async def columns_orjson(db):
+        rows, _ = await load_page(db, select(Show), Show, ShowSchema, page)
+        return dumps(rows)
+
+    # warm up the statement caches before timing
+    await measure(1, orm_pydantic)
+    await measure(1, columns_orjson)
+    slow, slow_body = await measure(args.rounds, orm_pydantic)
+    fast, fast_body = await measure(args.rounds, columns_orjson)
+
+    print(f"{args.rows} rows, {args.rounds} rounds")
+    print(f"orm + pydantic:    {slow * 1000:8.1f} ms cpu per response")
+    print(f"columns + orjson:  {fast * 1000:8.1f} ms cpu per response")
+    print(f"speedup:           {slow / fast:8.1f}x")
+    if slow_body != fast_body:
+        print("MISMATCH: the two paths produced different bodies")
+        return 1
+    return 0
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    # settings are read at import time, so the environment has to be in place first
+    db_path = args.db or os.path.join(tempfile.mkdtemp(prefix="bench-"), "bench.db")
+    os.environ["DATABASE_URL"] = f"sqlite+aiosqlite:///{db_path}"
+    sys.exit(asyncio.run(run(args)))
+
+
+if __name__ == "__main__":
+    main()
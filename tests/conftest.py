@@ -0,0 +1,70 @@
+import os
+import tempfile
+
+# settings are read at import time, so the app has to be pointed at a scratch database before anything imports it
+_db_dir = tempfile.mkdtemp(prefix="booking-tests-")
+os.environ["DATABASE_URL"] = f"sqlite+aiosqlite:///{os.path.join(_db_dir, 'test.db')}"
+os.environ["ADMISSION_ENABLED"] = "false"
+os.environ["BCRYPT_ROUNDS"] = "4"
+
+import itertools
+import sqlite3
+import pytest
+from fastapi.testclient import TestClient
+from app.database import DATABASE_URL
+from app.main import app
+
+
+def query(sql: str, *params) -> list[tuple]:
+    # straight at the database file, past the app and its caches
+    with sqlite3.connect(DATABASE_URL.database) as connection:
+        return connection.execute(sql, params).fetchall()
+
+
+# one app and event loop for the whole run: the engine's pool and the app's locks outlive a test module
+@pytest.fixture(scope="session")
+def client():
+    with TestClient(app) as client:
+        yield client
+
+
+@pytest.fixture(scope="session")
+def login(client):
+    def login(email: str, role: str | None = None) -> dict:
+        response = client.post("/auth/register", json={"email": email, "password": "secret"})
+        assert response.status_code == 200, response.text
+        if role is not None:
+            with sqlite3.connect(DATABASE_URL.database) as connection:
+                connection.execute("UPDATE users SET role = ? WHERE email = ?", (role, email))
+        response = client.post("/auth/login", data={"username": email, "password": "secret"})
+        assert response.status_code == 200, response.text
+        return {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+    return login
+
+
+@pytest.fixture(scope="session")
+def admin(login):
+    return login("admin@example.com", role="admin")
+
+
+@pytest.fixture(scope="session")
+def make_show(client, admin):
+    # each show gets a screen of its own, so shows made by different tests never overlap
+    screens = itertools.count(1)
+
+    def make_show(rows: str = "A-J", col_end: int = 20, start_time: str = "2030-01-01T18:00:00", end_time: str = "2030-01-01T21:00:00") -> dict:
+        theatre = client.post("/admin/theatres", json={"name": "Odeon", "location": "Leeds"}, headers=admin).json()
+        screen = client.post(f"/admin/theatres/{theatre['id']}/screens", json={"name": f"Screen {next(screens)}", "theatre_id": theatre["id"]}, headers=admin).json()
+        response = client.post(f"/admin/screens/{screen['id']}/layout", json={"grid": {"rows": rows, "col_end": col_end}}, headers=admin)
+        assert response.status_code == 200, response.text
+        movie = client.post("/admin/movies", json={"title": "Heat", "description": "LA crime", "min_duration": 170}, headers=admin).json()
+        response = client.post(
+            "/admin/shows",
+            json={"movie_id": movie["id"], "screen_id": screen["id"], "start_time": start_time, "end_time": end_time, "price": 10.0},
+            headers=admin,
+        )
+        assert response.status_code == 200, response.text
+        return response.json()
+
+    return make_show
@@ -0,0 +1,65 @@
+# deleting catalog rows takes everything hanging off their shows with it, so a reused show id starts clean
+from sqlalchemy import select
+from app.booking import create_booking
+from app.database import AsyncSessionLocal
+from app.models import Show
+from app.seatmap import seat_maps
+from conftest import query
+
+
+def test_deleting_a_movie_leaves_no_show_rows_behind(client, login, admin, make_show):
+    headers = login("delete-movie@example.com")
+    show = make_show()
+    seats = client.get(f"/user/shows/{show['id']}/seats", headers=headers).json()
+    response = client.post("/user/holds", json={"show_id": show["id"], "seat_ids": [seats[0]["id"]]}, headers=headers)
+    assert response.status_code == 200, response.text
+
+    response = client.delete(f"/admin/movies/{show['movie_id']}", headers=admin)
+    assert response.status_code == 200, response.text
+    for table in ("show_stats", "seat_holds", "held_seats"):
+        assert query(f"SELECT COUNT(*) FROM {table} WHERE show_id = ?", show["id"]) == [(0,)], table
+
+    # sqlite hands the deleted show's id to the next show
+    movie = client.post("/admin/movies", json={"title": "Ronin", "min_duration": 120}, headers=admin).json()
+    response = client.post(
+        "/admin/shows",
+        json={"movie_id": movie["id"], "screen_id": show["screen_id"], "start_time": show["start_time"], "end_time": show["end_time"], "price": 12.0},
+        headers=admin,
+    )
+    assert response.status_code == 200, response.text
+    assert query("SELECT seats_sold, bookings FROM show_stats WHERE show_id = ?", response.json()["id"]) == [(0, 0)]
+
+
+def test_a_reused_show_id_does_not_get_the_old_seat_map(client, login, admin, make_show):
+    headers = login("reused-show@example.com")
+    show = make_show()
+    seats = client.get(f"/user/shows/{show['id']}/seats", headers=headers).json()
+    response = client.post("/user/bookings", json={"show_id": show["id"], "seat_ids": [seats[0]["id"], seats[1]["id"]]}, headers=headers)
+    assert response.status_code == 200, response.text
+
+    # the screen stays, so nothing about the new show's own screen invalidates the old map
+    response = client.delete(f"/admin/movies/{show['movie_id']}", headers=admin)
+    assert response.status_code == 200, response.text
+    reused = make_show(rows="A-B", col_end=5)
+    assert reused["id"] == show["id"]
+    seats = client.get(f"/user/shows/{reused['id']}/seats", headers=headers).json()
+    assert len(seats) == 10 and not any(seat["booked"] for seat in seats)
+
+
+def test_seat_map_is_built_past_the_callers_snapshot(client, login, make_show):
+    login("snapshot@example.com")
+    [(user_id,)] = query("SELECT id FROM users WHERE email = ?", "snapshot@example.com")
+    show = make_show()
+    [(seat_id,)] = query("SELECT id FROM seats WHERE screen_id = ? ORDER BY id LIMIT 1", show["screen_id"])
+
+    async def build_after_booking():
+        async with AsyncSessionLocal() as db:
+            # the caller's read snapshot starts here, before the booking below commits
+            await db.execute(select(Show.id).filter(Show.id == show["id"]))
+            async with AsyncSessionLocal() as other:
+                await create_booking(other, user_id, show["id"], [seat_id])
+            seat_maps.invalidate_show(show["id"])
+            seat_map = await seat_maps.get(db, show["id"])
+            return seat_map.is_free(seat_id)
+
+    assert client.portal.call(build_after_booking) is False
@@ -0,0 +1,106 @@
+# the email dispatcher against a real smtp server: batching, retry with backoff, giving up
+import asyncio
+import socket
+import pytest
+from app.config import settings
+from app.notifications import EmailDispatcher, OutgoingEmail
+from conftest import query
+
+aiosmtpd = pytest.importorskip("aiosmtpd.controller")
+
+
+class Mailbox:
+    def __init__(self):
+        self.delivered: list[str] = []
+        # DATA commands still to answer with a temporary failure
+        self.failures = 0
+
+    async def handle_RCPT(self, server, session, envelope, address, rcpt_options):
+        if address.startswith("bounce@"):
+            return "550 5.1.1 no such user"
+        envelope.rcpt_tos.append(address)
+        return "250 OK"
+
+    async def handle_DATA(self, server, session, envelope):
+        if self.failures:
+            self.failures -= 1
+            return "451 4.3.0 try again later"
+        self.delivered.extend(envelope.rcpt_tos)
+        return "250 OK"
+
+
+@pytest.fixture
+def mailbox(monkeypatch):
+    with socket.socket() as probe:
+        probe.bind(("127.0.0.1", 0))
+        port = probe.getsockname()[1]
+    mailbox = Mailbox()
+    controller = aiosmtpd.Controller(mailbox, hostname="127.0.0.1", port=port)
+    controller.start()
+    monkeypatch.setattr(settings, "SMTP_HOST", "127.0.0.1")
+    monkeypatch.setattr(settings, "SMTP_PORT", port)
+    monkeypatch.setattr(settings, "EMAIL_BATCH_LINGER_MS", 50.0)
+    monkeypatch.setattr(settings, "EMAIL_RETRY_BASE_SECONDS", 0.05)
+    monkeypatch.setattr(settings, "EMAIL_MAX_ATTEMPTS", 3)
+    yield mailbox
+    controller.stop()
+
+
+def deliver(client, *batches: list[str], settled: int | None = None) -> EmailDispatcher:
+    # each batch is queued at once, the next only after the one before has gone out; returns once
+    # `settled` mails (all of them by default) were either sent or given up on
+    settled = sum(map(len, batches)) if settled is None else settled
+
+    async def run():
+        dispatcher = EmailDispatcher()
+        for recipients in batches:
+            done = dispatcher.batches
+            for recipient in recipients:
+                await dispatcher.enqueue(OutgoingEmail(recipient, "Booking", "Your seats"))
+            while dispatcher.batches == done:
+                await asyncio.sleep(0.01)
+        async with asyncio.timeout(5):
+            while dispatcher.sent + dispatcher.failed < settled:
+                await asyncio.sleep(0.01)
+        await dispatcher.stop()
+        return dispatcher
+
+    return client.portal.call(run)
+
+
+def test_queued_mail_goes_out_in_one_batch_over_one_connection(client, mailbox):
+    recipients = [f"guest{i}@example.com" for i in range(5)]
+    dispatcher = deliver(client, recipients, ["late@example.com"])
+    assert sorted(mailbox.delivered) == sorted(recipients + ["late@example.com"])
+    assert (dispatcher.batches, dispatcher.sender.connections) == (2, 1)
+    assert (dispatcher.sent, dispatcher.retried, dispatcher.failed) == (6, 0, 0)
+
+
+def test_temporary_failures_are_retried_with_backoff(client, mailbox):
+    mailbox.failures = 2
+    dispatcher = deliver(client, ["retry@example.com"])
+    assert mailbox.delivered == ["retry@example.com"]
+    assert (dispatcher.sent, dispatcher.retried, dispatcher.failed) == (1, 2, 0)
+    # the first try and one batch per retry
+    assert dispatcher.batches == 3
+
+
+def test_temporary_failures_give_up_after_max_attempts(client, mailbox):
+    mailbox.failures = 100
+    dispatcher = deliver(client, ["never@example.com"])
+    assert mailbox.delivered == []
+    assert (dispatcher.sent, dispatcher.retried, dispatcher.failed) == (0, 2, 1)
+
+
+def test_permanent_failures_are_not_retried(client, mailbox):
+    dispatcher = deliver(client, ["bounce@example.com", "guest@example.com"])
+    assert mailbox.delivered == ["guest@example.com"]
+    assert (dispatcher.sent, dispatcher.retried, dispatcher.failed) == (1, 0, 1)
+    assert dispatcher.batches == 1
+
+
+def test_outbox_rows_are_written_per_batch_and_marked(client, mailbox, monkeypatch):
+    monkeypatch.setattr(settings, "EMAIL_OUTBOX_ENABLED", True)
+    deliver(client, ["outbox@example.com", "bounce@outbox.example.com"])
+    rows = query("SELECT recipient, attempts, sent_at IS NOT NULL, failed_at IS NOT NULL FROM email_outbox WHERE recipient LIKE '%outbox%' ORDER BY id")
+    assert rows == [("outbox@example.com", 0, 1, 0), ("bounce@outbox.example.com", 1, 0, 1)]
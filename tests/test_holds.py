@@ -0,0 +1,42 @@
+# limits on seat holds: seats per hold, holds per user, and none once the show has started
+from app.config import settings
+from conftest import query
+
+
+def test_a_hold_is_capped_at_max_seats(client, login, make_show):
+    headers = login("hold-size@example.com")
+    show = make_show()
+    seats = client.get(f"/user/shows/{show['id']}/seats", headers=headers).json()
+    too_many = settings.SEAT_HOLD_MAX_SEATS + 1
+    response = client.post("/user/holds", json={"show_id": show["id"], "seat_ids": [seat["id"] for seat in seats[:too_many]]}, headers=headers)
+    assert response.status_code == 400, response.text
+    response = client.post("/user/holds/best", json={"show_id": show["id"], "count": too_many}, headers=headers)
+    assert response.status_code == 400, response.text
+    assert query("SELECT COUNT(*) FROM held_seats WHERE show_id = ?", show["id"]) == [(0,)]
+
+
+def test_a_user_has_at_most_max_active_holds(client, login, make_show):
+    headers = login("hold-count@example.com")
+    shows = [make_show(), make_show()]
+    holds = []
+    for i in range(settings.SEAT_HOLD_MAX_ACTIVE):
+        response = client.post("/user/holds/best", json={"show_id": shows[i % 2]["id"], "count": 1}, headers=headers)
+        assert response.status_code == 200, response.text
+        holds.append(response.json())
+    response = client.post("/user/holds/best", json={"show_id": shows[1]["id"], "count": 1}, headers=headers)
+    assert response.status_code == 409, response.text
+
+    response = client.delete(f"/user/holds/{holds[0]['id']}", headers=headers)
+    assert response.status_code == 200, response.text
+    response = client.post("/user/holds/best", json={"show_id": shows[1]["id"], "count": 1}, headers=headers)
+    assert response.status_code == 200, response.text
+
+
+def test_no_holds_on_a_show_that_has_started(client, login, make_show):
+    headers = login("hold-started@example.com")
+    show = make_show(start_time="2020-01-01T18:00:00", end_time="2020-01-01T21:00:00")
+    seats = client.get(f"/user/shows/{show['id']}/seats", headers=headers).json()
+    response = client.post("/user/holds", json={"show_id": show["id"], "seat_ids": [seats[0]["id"]]}, headers=headers)
+    assert response.status_code == 400, response.text
+    response = client.post("/user/holds/best", json={"show_id": show["id"], "count": 1}, headers=headers)
+    assert response.status_code == 400, response.text
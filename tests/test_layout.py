@@ -0,0 +1,24 @@
+# replacing a screen's layout deletes its seats, so it is refused while any booking points at them
+from conftest import query
+
+
+def test_layout_is_not_replaced_under_a_cancelled_booking(client, login, admin, make_show):
+    headers = login("layout-cancelled@example.com")
+    show = make_show()
+    seats = client.get(f"/user/shows/{show['id']}/seats", headers=headers).json()
+    booking = client.post("/user/bookings", json={"show_id": show["id"], "seat_ids": [seats[0]["id"]]}, headers=headers)
+    assert booking.status_code == 200, booking.text
+    response = client.delete(f"/user/bookings/{booking.json()['id']}", headers=headers)
+    assert response.status_code == 200, response.text
+
+    response = client.post(f"/admin/screens/{show['screen_id']}/layout", json={"grid": {"rows": "A-B", "col_end": 5}, "replace": True}, headers=admin)
+    assert response.status_code == 409, response.text
+    assert query("SELECT seat_id FROM booked_seats WHERE booking_id = ?", booking.json()["id"]) == [(seats[0]["id"],)]
+    assert query("SELECT COUNT(*) FROM seats WHERE screen_id = ?", show["screen_id"]) == [(200,)]
+
+
+def test_layout_without_bookings_is_replaced(client, admin, make_show):
+    show = make_show()
+    response = client.post(f"/admin/screens/{show['screen_id']}/layout", json={"grid": {"rows": "A-B", "col_end": 5}, "replace": True}, headers=admin)
+    assert response.status_code == 200, response.text
+    assert len(response.json()) == 10
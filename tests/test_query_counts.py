@@ -0,0 +1,53 @@
+# the show detail and booking history endpoints load their object graphs in a fixed number of
+# queries, however many seats or bookings there are
+from contextlib import contextmanager
+import pytest
+from sqlalchemy import event
+from app.database import engine
+
+
+@contextmanager
+def count_queries():
+    counter = {"queries": 0}
+
+    def before_cursor_execute(*args):
+        counter["queries"] += 1
+
+    event.listen(engine.sync_engine, "before_cursor_execute", before_cursor_execute)
+    try:
+        yield counter
+    finally:
+        event.remove(engine.sync_engine, "before_cursor_execute", before_cursor_execute)
+
+
+@pytest.fixture(scope="module")
+def show(make_show):
+    return make_show()
+
+
+def test_show_detail_is_one_query_warm(client, login, show):
+    headers = login("detail@example.com")
+    # the first request builds the seat map and resolves the user; later ones only load the show graph
+    client.get(f"/user/shows/{show['id']}", headers=headers)
+    with count_queries() as counter:
+        response = client.get(f"/user/shows/{show['id']}", headers=headers)
+    assert response.status_code == 200
+    assert len(response.json()["seats"]) == 200
+    assert counter["queries"] == 1
+
+
+def test_booking_history_is_three_queries(client, login, show):
+    headers = login("history@example.com")
+    seats = client.get(f"/user/shows/{show['id']}/seats", headers=headers).json()
+    free = [seat["id"] for seat in seats if not seat["booked"]]
+    for i in range(10):
+        response = client.post("/user/bookings", json={"show_id": show["id"], "seat_ids": free[2 * i:2 * i + 2]}, headers=headers)
+        assert response.status_code == 200, response.text
+    with count_queries() as counter:
+        response = client.get("/user/bookings", headers=headers)
+    assert response.status_code == 200
+    bookings = response.json()
+    assert len(bookings) == 10
+    assert all(len(booking["seats"]) == 2 and booking["show"]["id"] == show["id"] for booking in bookings)
+    # the page of bookings, their shows, their seats
+    assert counter["queries"] == 3
@@ -0,0 +1,91 @@
+# requests that race on the same booking or seats: whatever the interleaving, each change happens once
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+import pytest
+import app.routes_public
+from app.booking import show_lock
+from app.database import AsyncSessionLocal
+from app.holds import confirm_hold, release_holds
+from app.seatmap import seat_maps
+from conftest import query
+
+
+def concurrently(count: int, call) -> list:
+    # the test client runs every request on the app's one event loop, so these overlap the way real
+    # requests do, interleaving at every await
+    with ThreadPoolExecutor(count) as pool:
+        return list(pool.map(lambda _: call(), range(count)))
+
+
+@pytest.fixture
+def emails(monkeypatch) -> list:
+    sent = []
+
+    async def notify_booking(booking_id: int, event: str):
+        sent.append((booking_id, event))
+
+    monkeypatch.setattr(app.routes_public, "notify_booking", notify_booking)
+    return sent
+
+
+def test_concurrent_cancels_cancel_once(client, login, make_show, emails):
+    headers = login("cancel-race@example.com")
+    show = make_show()
+    seats = client.get(f"/user/shows/{show['id']}/seats", headers=headers).json()
+    booking = client.post("/user/bookings", json={"show_id": show["id"], "seat_ids": [seats[0]["id"], seats[1]["id"]]}, headers=headers)
+    assert booking.status_code == 200, booking.text
+    booking = booking.json()
+
+    responses = concurrently(4, lambda: client.delete(f"/user/bookings/{booking['id']}", headers=headers))
+    assert [response.status_code for response in responses] == [200] * 4
+    assert all(response.json()["cancelled"] for response in responses)
+    assert query("SELECT seats_sold, bookings, cancellations, revenue FROM show_stats WHERE show_id = ?", show["id"]) == [(0, 0, 1, 0.0)]
+    assert [email for email in emails if email[1] == "cancelled"] == [(booking["id"], "cancelled")]
+    seats = client.get(f"/user/shows/{show['id']}/seats", headers=headers).json()
+    assert not any(seat["booked"] for seat in seats)
+
+
+def test_expiry_racing_confirm_leaves_the_seats_booked(client, login, make_show):
+    headers, other = login("hold-race@example.com"), login("hold-race-2@example.com")
+    [(user_id,)] = query("SELECT id FROM users WHERE email = ?", "hold-race@example.com")
+    show = make_show()
+    seats = client.get(f"/user/shows/{show['id']}/seats", headers=headers).json()
+    seat_ids = [seats[0]["id"], seats[1]["id"]]
+    hold = client.post("/user/holds", json={"show_id": show["id"], "seat_ids": seat_ids}, headers=headers)
+    assert hold.status_code == 200, hold.text
+    hold = hold.json()
+
+    async def race():
+        # the confirm queues for the show lock first, the expiry after it, each with its reads before the
+        # lock already done
+        async with AsyncSessionLocal() as db:
+            async with show_lock(show["id"]):
+                confirm = asyncio.ensure_future(confirm_hold(db, hold["id"], user_id))
+                await asyncio.sleep(0.05)
+                expire = asyncio.ensure_future(release_holds([hold["id"]]))
+                await asyncio.sleep(0.05)
+            await asyncio.gather(confirm, expire)
+
+    client.portal.call(race)
+    assert len(query("SELECT id FROM booked_seats WHERE show_id = ?", show["id"])) == 2
+    seats = client.get(f"/user/shows/{show['id']}/seats", headers=other).json()
+    assert all(seat["booked"] for seat in seats if seat["id"] in seat_ids)
+    response = client.post("/user/holds", json={"show_id": show["id"], "seat_ids": seat_ids}, headers=other)
+    assert response.status_code == 409, response.text
+
+
+def test_hold_on_a_booked_seat_is_refused_when_the_seat_map_is_wrong(client, login, make_show):
+    headers = login("hold-booked@example.com")
+    show = make_show()
+    seats = client.get(f"/user/shows/{show['id']}/seats", headers=headers).json()
+    seat_ids = [seats[0]["id"], seats[1]["id"]]
+    response = client.post("/user/bookings", json={"show_id": show["id"], "seat_ids": seat_ids}, headers=headers)
+    assert response.status_code == 200, response.text
+
+    async def forget():
+        seat_maps.mark_free(show["id"], seat_ids)
+
+    client.portal.call(forget)
+    response = client.post("/user/holds", json={"show_id": show["id"], "seat_ids": seat_ids}, headers=headers)
+    assert response.status_code == 409, response.text
+    assert query("SELECT COUNT(*) FROM held_seats WHERE show_id = ?", show["id"]) == [(0,)]